@@ -0,0 +1,517 @@
+#!/usr/bin/env python3
+"""ASGI entry point for the GitHub oAuth2 proxy.
+
+Serves the same ``/``, ``/info`` and GitHub webhook endpoints as the Flask
+app in ``webhook.py``, but each login runs as a coroutine on one event loop
+using ``AsyncGithubAuth``, so concurrency is not capped by a thread count.
+The configuration, profile cache, requirement checks and username mapping
+are shared with ``webhook.py``.
+
+Run it with any ASGI server, for example ``uvicorn asgi:app``.
+"""
+
+import asyncio
+import json
+import logging
+import math
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple, TypeVar
+
+import async_github_auth
+import metrics
+import webhook
+from async_github_auth import AsyncGithubAuth
+from cache import AsyncSingleFlight, SerializedCache, hash_token
+from github_auth import RateLimitError
+from webhook import RequirementCheck, build_user_info, run_requirement_checks
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+Response = Tuple[int, Dict[str, Any], Dict[str, str]]
+T = TypeVar('T')
+
+logger = logging.getLogger(__name__)
+# Strong references to background refreshes, which asyncio only keeps weakly
+background_tasks: Set['asyncio.Task[None]'] = set()
+# Concurrent /info calls with the same token share a single GitHub fetch
+profile_flight = AsyncSingleFlight()
+
+
+async def cache_io(call: Callable[..., T], *args: Any) -> T:
+    """Run a call that reads or writes the profile cache.
+
+    The SQLite and Redis backends block on I/O, which would stall every
+    request on the event loop, so with them the call runs in a worker
+    thread. The in-memory cache answers at once and is called directly.
+
+    Args:
+        call: The function to call.
+        *args: Its arguments.
+
+    Returns:
+        What ``call`` returns.
+    """
+    if isinstance(webhook.profile_cache, SerializedCache):
+        return await asyncio.to_thread(call, *args)
+    return call(*args)
+
+
+async def get_user_info_with_scopes(github: AsyncGithubAuth) -> Any:
+    """Return the user's profile after validating the token's scopes.
+
+    Args:
+        github: The authenticated GitHub client.
+
+    Returns:
+        The decoded ``/user`` response.
+
+    Raises:
+        PermissionError: If GitHub rejects the token or a scope is missing.
+    """
+    info = await github.get_user_info()
+    await github.validate_scopes()
+    return info
+
+
+async def get_graphql_profile_with_scopes(github: AsyncGithubAuth) -> Any:
+    """Return the GraphQL profile after validating the token's scopes.
+
+    Args:
+        github: The authenticated GitHub client.
+
+    Returns:
+        The profile, organizations and team slugs.
+
+    Raises:
+        PermissionError: If GitHub rejects the token or a scope is missing.
+    """
+    profile = await github.get_graphql_profile(webhook.config)
+    await github.validate_scopes()
+    return profile
+
+
+async def wait_for_all(
+    coroutines: List[Awaitable[Any]],
+    on_result: Optional[Callable[[int, Any], None]] = None,
+) -> List[Any]:
+    """Run ``coroutines`` concurrently, failing on the first error.
+
+    The asyncio counterpart of ``webhook.wait_for_all``: the first failure,
+    including one raised by ``on_result``, cancels the remaining calls and
+    is re-raised, preferring ``PermissionError``.
+
+    Args:
+        coroutines: The calls to run.
+        on_result: Optional function called with the index and result of
+            each call as it completes.
+
+    Returns:
+        The results, in the order of ``coroutines``.
+    """
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    indexes = {task: index for index, task in enumerate(tasks)}
+    pending = set(tasks)
+
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+            errors: List[BaseException] = [
+                error for error in (task.exception() for task in done) if error is not None
+            ]
+            if errors:
+                raise next((e for e in errors if isinstance(e, PermissionError)), errors[0])
+
+            if on_result is not None:
+                for task in done:
+                    on_result(indexes[task], task.result())
+    finally:
+        for task in pending:
+            task.cancel()
+
+    return [task.result() for task in tasks]
+
+
+async def fetch_github_data(
+    github: AsyncGithubAuth,
+    checks: Optional[List[Tuple[str, RequirementCheck]]] = None,
+) -> Tuple[Any, Any, Any, List[str]]:
+    """Fetch everything ``/info`` needs from GitHub concurrently.
+
+    The asyncio counterpart of ``webhook.fetch_github_data``, including its
+    use of the organization directory. A failing requirement check cancels
+    the calls still in flight.
+
+    Args:
+        github: The authenticated GitHub client.
+        checks: Optional pairs returned by ``webhook.get_requirement_checks``.
+
+    Returns:
+        The user profile, organizations, email addresses and team slugs.
+
+    Raises:
+        PermissionError: If GitHub rejects the token, a scope is missing or
+            a requirement fails.
+        RateLimitError: If GitHub is rate limiting the token.
+        RuntimeError: If GitHub returns an unexpected status.
+    """
+    current = webhook.get_settings()
+    data: Dict[str, Any] = {}
+
+    if current.api_mode == 'graphql':
+        def on_graphql_result(index: int, result: Any) -> None:
+            if index == 0:
+                data['info'], data['orgs'], data['teams'] = result
+            else:
+                data['emails'] = result
+            run_requirement_checks(checks or [], data)
+
+        (info, orgs, teams), emails = await wait_for_all([
+            get_graphql_profile_with_scopes(github),
+            github.get_email_addresses(current.raw),
+        ], on_graphql_result)
+        return info, orgs, emails, teams
+
+    membership_org = current.membership_org
+    org_source = 'orgs' if membership_org is None else 'membership'
+
+    def collect(sources: Tuple[str, ...]) -> Callable[[int, Any], None]:
+        def on_rest_result(index: int, result: Any) -> None:
+            data[sources[index]] = result
+            run_requirement_checks(checks or [], data)
+
+        return on_rest_result
+
+    def org_check() -> Awaitable[Any]:
+        if membership_org is None:
+            return github.get_org_list(current.raw)
+        return github.get_org_membership(membership_org)
+
+    snapshot = webhook.org_directory.current()
+
+    if snapshot is None:
+        info, orgs, emails, teams = await wait_for_all([
+            get_user_info_with_scopes(github),
+            org_check(),
+            github.get_email_addresses(current.raw),
+            github.get_user_teams(current.raw),
+        ], collect(('info', org_source, 'emails', 'teams')))
+    else:
+        info, emails = await wait_for_all([
+            get_user_info_with_scopes(github),
+            github.get_email_addresses(current.raw),
+        ], collect(('info', 'emails')))
+        directory_teams = snapshot.roles.get(info['login'].lower())
+
+        if directory_teams is not None:
+            return info, [{'login': snapshot.org}], emails, list(directory_teams)
+
+        orgs, teams = await wait_for_all([
+            org_check(),
+            github.get_user_teams(current.raw),
+        ], collect((org_source, 'teams')))
+
+    if membership_org is not None:
+        orgs = [{'login': membership_org}] if orgs else []
+
+    return info, orgs, emails, teams
+
+
+async def load_profile(github: AsyncGithubAuth) -> Dict[str, str]:
+    """Fetch a user's GitHub data, enforce the requirements and build the profile.
+
+    The asyncio counterpart of ``webhook.load_profile``.
+
+    Args:
+        github: The authenticated GitHub client.
+
+    Returns:
+        The Spinnaker user profile.
+
+    Raises:
+        PermissionError: If GitHub rejects the token or a requirement fails.
+        RateLimitError: If GitHub is rate limiting the token.
+        RuntimeError: If GitHub returns an unexpected status.
+    """
+    info, orgs, emails, teams = await fetch_github_data(github, list(webhook.get_settings().checks))
+    return build_user_info(info, orgs, emails, teams)
+
+
+async def fetch_profile(github: AsyncGithubAuth, token_hash: str) -> Dict[str, str]:
+    """Load a user's profile and store it in the profile cache.
+
+    The asyncio counterpart of ``webhook.fetch_profile``.
+
+    Args:
+        github: The authenticated GitHub client.
+        token_hash: Hash of the client's token.
+
+    Returns:
+        The Spinnaker user profile.
+
+    Raises:
+        PermissionError: If GitHub rejects the token or a requirement fails.
+        RateLimitError: If GitHub is rate limiting the token.
+        RuntimeError: If GitHub returns an unexpected status.
+    """
+    user_info = await load_profile(github)
+    await cache_io(webhook.profile_cache.set, token_hash, user_info)
+    webhook.pre_refresher.schedule(token_hash)
+    return user_info
+
+
+async def refresh_profile(access_token: str, token_hash: str) -> None:
+    """Fetch a fresh profile for an expired cache entry.
+
+    The asyncio counterpart of ``webhook.refresh_profile``.
+
+    Args:
+        access_token: The GitHub OAuth access token.
+        token_hash: Hash of the token.
+    """
+    try:
+        await profile_flight.do(token_hash, fetch_profile, AsyncGithubAuth(access_token), token_hash)
+    except PermissionError as e:
+        await cache_io(webhook.deny_token, token_hash, str(e))
+        logger.warning('Authorization failed during refresh: %s', e)
+    except Exception as e:
+        logger.warning('Failed to refresh cached profile: %s', e)
+    finally:
+        webhook.release_refresh(token_hash)
+
+
+async def get_revalidating_profile(access_token: str, token_hash: str) -> Optional[Dict[str, str]]:
+    """Return a recently expired profile and refresh it in a background task.
+
+    The asyncio counterpart of ``webhook.get_revalidating_profile``.
+
+    Args:
+        access_token: The GitHub OAuth access token.
+        token_hash: Hash of the token.
+
+    Returns:
+        The profile if it expired within the ``stale_while_revalidate``
+        window, otherwise ``None``.
+    """
+    window = webhook.get_stale_while_revalidate(webhook.config)
+
+    if window <= 0:
+        return None
+
+    stale_user_info = await cache_io(webhook.profile_cache.get_stale, token_hash, window)
+
+    if stale_user_info is not None and webhook.claim_refresh(token_hash):
+        task = asyncio.ensure_future(refresh_profile(access_token, token_hash))
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+    return stale_user_info
+
+
+async def get_profile(auth_header: Optional[str]) -> Response:
+    """Validate a token and build its Spinnaker profile.
+
+    Args:
+        auth_header: The ``Authorization`` request header, or ``None``.
+
+    Returns:
+        The HTTP status, JSON body and extra response headers.
+    """
+    if auth_header is None:
+        return 401, {
+            'status': 'error',
+            'msg': 'Authorization header not found in request'
+        }, {}
+
+    if not auth_header:
+        return 401, {
+            'status': 'error',
+            'msg': 'Authorization header not present or empty'
+        }, {}
+
+    access_token = auth_header.split(' ')[-1]
+    token_hash = hash_token(access_token)
+    profile_cache = webhook.profile_cache
+    denial = webhook.denied_cache.get(token_hash)
+
+    if denial is not None:
+        return 401, {
+            'status': 'error',
+            'msg': 'Unauthorized',
+            'detail': denial
+        }, {}
+
+    try:
+        webhook.pre_refresher.seen(access_token, token_hash)
+        github = AsyncGithubAuth(access_token)
+        cached_user_info = await cache_io(profile_cache.get, token_hash)
+
+        if cached_user_info is not None:
+            return 200, cached_user_info, {}
+
+        stale_user_info = await get_revalidating_profile(access_token, token_hash)
+
+        if stale_user_info is not None:
+            return 200, stale_user_info, {}
+
+        user_info = await profile_flight.do(token_hash, fetch_profile, github, token_hash)
+        return 200, user_info, {}
+    except PermissionError as e:
+        await cache_io(webhook.deny_token, token_hash, str(e))
+        logger.warning('Authorization failed: %s', e)
+        return 401, {
+            'status': 'error',
+            'msg': 'Unauthorized',
+            'detail': str(e)
+        }, {}
+    except RateLimitError as e:
+        stale_user_info = await cache_io(profile_cache.get_stale, token_hash)
+
+        if stale_user_info is not None:
+            logger.warning('Serving cached profile while rate limited: %s', e)
+            return 200, stale_user_info, {}
+
+        logger.warning('Rate limited: %s', e)
+        return 429, {
+            'status': 'error',
+            'msg': 'Too Many Requests',
+            'detail': str(e)
+        }, {'Retry-After': str(math.ceil(e.retry_after))}
+
+
+async def send_body(send: Send, status: int, body: bytes, headers: Dict[str, str]) -> None:
+    """Send a complete response.
+
+    Args:
+        send: The ASGI send callable.
+        status: The HTTP status code.
+        body: The response body.
+        headers: The response headers, including ``Content-Type``.
+    """
+    raw_headers = [(b'content-length', str(len(body)).encode('latin-1'))]
+    raw_headers.extend((name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items())
+    await send({'type': 'http.response.start', 'status': status, 'headers': raw_headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_json(send: Send, status: int, body: Dict[str, Any], headers: Dict[str, str]) -> None:
+    """Send a complete JSON response.
+
+    Args:
+        send: The ASGI send callable.
+        status: The HTTP status code.
+        body: The JSON-serializable response body.
+        headers: Extra response headers.
+    """
+    await send_body(send, status, json.dumps(body).encode('utf-8'), {'Content-Type': 'application/json', **headers})
+
+
+async def read_body(receive: Receive) -> bytes:
+    """Return the complete request body.
+
+    Args:
+        receive: The ASGI receive callable.
+
+    Returns:
+        The body, joined from every ``http.request`` message.
+    """
+    chunks = []
+
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def lifespan(receive: Receive, send: Send) -> None:
+    """Handle ASGI lifespan events, closing pooled connections on shutdown.
+
+    Args:
+        receive: The ASGI receive callable.
+        send: The ASGI send callable.
+    """
+    while True:
+        message = await receive()
+
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await async_github_auth.client.aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope: Scope, receive: Receive, send: Send) -> None:
+    """Serve the proxy's endpoints as an ASGI application.
+
+    Args:
+        scope: The ASGI connection scope.
+        receive: The ASGI receive callable.
+        send: The ASGI send callable.
+    """
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+
+    path = scope['path']
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+    if webhook.config_watcher.due():
+        # Reloading stats and parses the file, so keep it off the event loop
+        await asyncio.to_thread(webhook.config_watcher.check)
+
+    try:
+        if path in ('/', '/info', '/metrics') and scope['method'] != 'GET':
+            await send_json(send, 405, {
+                'status': 'error',
+                'msg': 'Method Not Allowed'
+            }, {'Allow': 'GET'})
+        elif path == webhook.GITHUB_WEBHOOK_PATH and scope['method'] != 'POST':
+            await send_json(send, 405, {
+                'status': 'error',
+                'msg': 'Method Not Allowed'
+            }, {'Allow': 'POST'})
+        elif path == webhook.GITHUB_WEBHOOK_PATH and webhook.github_webhook_secret is not None:
+            status, body = await cache_io(
+                webhook.handle_github_event,
+                headers.get('x-github-event'), headers.get('x-hub-signature-256'), await read_body(receive),
+            )
+            await send_json(send, status, body, {})
+        elif path == '/':
+            await send_json(send, 200, {'status': 'ok'}, {})
+        elif path == '/metrics':
+            payload, content_type = metrics.render()
+            await send_body(send, 200, payload, {'Content-Type': content_type})
+        elif path == '/info':
+            started = metrics.start_info_request()
+            status = 500
+
+            try:
+                status, body, extra_headers = await get_profile(headers.get('authorization'))
+                await send_json(send, status, body, extra_headers)
+            finally:
+                metrics.finish_info_request(started, status)
+        else:
+            host = headers.get('host', 'localhost')
+            await send_json(send, 404, {
+                'status': 'error',
+                'msg': f"{scope.get('scheme', 'http')}://{host}{path} not found"
+            }, {})
+    except Exception as e:
+        logger.exception('Unhandled exception: %s', e)
+        await send_json(send, 500, {
+            'status': 'error',
+            'msg': 'Internal Server Error'
+        }, {})
+
+
+async_github_auth.configure_http(webhook.config)
+
+
+if __name__ == '__main__':
+    args = webhook.get_args()
+    # Deferred import: uvicorn is only needed for the standalone server.
+    import uvicorn
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run(app, host=args.host, port=args.port)
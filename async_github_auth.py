@@ -0,0 +1,387 @@
+"""Asyncio GitHub API client used by the ASGI entry point.
+
+Mirrors ``GithubAuth`` method for method, but performs I/O through one shared
+``httpx.AsyncClient`` so that a single event loop can serve many concurrent
+logins over pooled keep-alive connections. ETag caching, rate limiting and
+the scope and team rules come from ``GithubAuthBase``, so both clients
+behave identically.
+"""
+
+import asyncio
+import time
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+import httpx
+
+from github_auth import (
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_POOL_MAXSIZE,
+    DEFAULT_READ_TIMEOUT,
+    GithubAuthBase,
+    GraphqlProfile,
+    NotFoundError,
+)
+
+DEFAULT_MAX_CONNECTIONS = 100
+
+
+def create_client(
+    max_connections: int = DEFAULT_MAX_CONNECTIONS,
+    max_keepalive_connections: int = DEFAULT_POOL_MAXSIZE,
+    connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+    read_timeout: float = DEFAULT_READ_TIMEOUT,
+) -> httpx.AsyncClient:
+    """Create a pooled asynchronous HTTP client for the GitHub API.
+
+    Cookies are never stored, because the client is shared by every user's
+    requests.
+
+    Args:
+        max_connections: Maximum number of concurrent connections.
+        max_keepalive_connections: Maximum number of idle connections kept open.
+        connect_timeout: Seconds to wait for a connection.
+        read_timeout: Seconds to wait for response data.
+
+    Returns:
+        The configured client.
+    """
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+        ),
+        timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
+    )
+
+
+def configure_http(config: Optional[Dict[str, Any]]) -> None:
+    """Rebuild the shared client from ``github.http`` settings.
+
+    Args:
+        config: The loaded configuration, or ``None``.
+    """
+    global client
+
+    settings: Dict[str, Any] = {}
+    if config and 'github' in config and 'http' in config['github']:
+        settings = config['github']['http'] or {}
+
+    client = create_client(
+        max_connections=settings.get('max_connections', DEFAULT_MAX_CONNECTIONS),
+        max_keepalive_connections=settings.get('pool_maxsize', DEFAULT_POOL_MAXSIZE),
+        connect_timeout=settings.get('connect_timeout', DEFAULT_CONNECT_TIMEOUT),
+        read_timeout=settings.get('read_timeout', DEFAULT_READ_TIMEOUT),
+    )
+
+
+client: httpx.AsyncClient = create_client()
+
+
+class AsyncGithubAuth(GithubAuthBase):
+    """Authenticated asyncio client for the GitHub REST API.
+
+    Attributes:
+        required_scopes: OAuth scopes the proxy requires before granting access.
+        headers: HTTP headers sent with every request, including the bearer token.
+        token_hash: Hash of the access token, used to key cached responses.
+        scope_headers: Headers of the latest response that reported the
+            token's OAuth scopes, or ``None`` before any such response.
+    """
+
+    async def _request(
+        self,
+        endpoint: str,
+        params: Optional[Dict[str, Any]] = None,
+    ) -> Any:
+        """Perform a GET request against the GitHub API.
+
+        See ``GithubAuth._request`` for the caching and rate-limit behavior.
+
+        Args:
+            endpoint: The API path (for example ``/user``).
+            params: Optional query string parameters.
+
+        Returns:
+            The response, when the request succeeds with HTTP 200.
+
+        Raises:
+            PermissionError: If GitHub returns HTTP 401 or 403.
+            RateLimitError: If the token is rate limited.
+            RuntimeError: If GitHub returns any other non-200 status.
+        """
+        url, cache_key, cached, headers = self._prepare_request(endpoint, params)
+        attempt = 0
+
+        while True:
+            started = time.perf_counter()
+            r = await client.get(url, headers=headers, params=params)
+            self._observe(endpoint, r, started)
+            retry_delay = self._get_retry_delay(r, attempt)
+
+            if retry_delay is None:
+                break
+
+            await asyncio.sleep(retry_delay)
+            attempt += 1
+
+        return self._handle_response(r, cache_key, cached)
+
+    async def _get_page(self, endpoint: str, page: int, select: Callable[[List[Any]], List[Any]]) -> List[Any]:
+        """Return the selected items of one page of a list endpoint."""
+        return select((await self._request(endpoint, params=self._page_params(page))).json())
+
+    async def _get_pages(
+        self,
+        endpoint: str,
+        select: Callable[[List[Any]], List[Any]] = list,
+        done: Optional[Callable[[List[Any]], bool]] = None,
+    ) -> List[Any]:
+        """Return the selected items of every page of a list endpoint.
+
+        See ``GithubAuth._get_pages``.
+
+        Args:
+            endpoint: The API path (for example ``/user/teams``).
+            select: Returns the items to keep from a page.
+            done: Optional check for whether enough items have been received.
+
+        Returns:
+            The selected items, in page order.
+
+        Raises:
+            PermissionError: If GitHub returns HTTP 401 or 403.
+            RateLimitError: If the token is rate limited.
+            RuntimeError: If GitHub returns any other non-200 status.
+        """
+        r = await self._request(endpoint, params=self._page_params(1))
+        pages = {1: select(r.json())}
+
+        if done is not None and done(pages[1]):
+            return pages[1]
+
+        tasks = {
+            asyncio.ensure_future(self._get_page(endpoint, page, select)): page
+            for page in range(2, self._last_page(r) + 1)
+        }
+        pending = set(tasks)
+
+        try:
+            while pending:
+                finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in finished:
+                    pages[tasks[task]] = task.result()
+
+                if done is not None and done([item for items in pages.values() for item in items]):
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+
+        return [item for page in sorted(pages) for item in pages[page]]
+
+    async def _graphql(self, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+        """Run a GraphQL query against the GitHub API.
+
+        Args:
+            query: The GraphQL query.
+            variables: The query variables.
+
+        Returns:
+            The ``data`` of the response.
+
+        Raises:
+            PermissionError: If GitHub returns HTTP 401 or 403.
+            RateLimitError: If the token is rate limited.
+            RuntimeError: If GitHub returns any other non-200 status, or the
+                query returns no data.
+        """
+        self._check_rate_limit()
+        attempt = 0
+
+        while True:
+            started = time.perf_counter()
+            r = await client.post(
+                self._url('/graphql'), headers=self.headers, json={'query': query, 'variables': variables}
+            )
+            self._observe('/graphql', r, started)
+            retry_delay = self._get_retry_delay(r, attempt)
+
+            if retry_delay is None:
+                break
+
+            await asyncio.sleep(retry_delay)
+            attempt += 1
+
+        return self._get_graphql_data(self._handle_response(r, None, None).json())
+
+    async def get_graphql_profile(self, config: Optional[Dict[str, Any]]) -> GraphqlProfile:
+        """Return the profile, organizations and teams using GraphQL.
+
+        See ``GithubAuth.get_graphql_profile``.
+
+        Args:
+            config: The loaded configuration, or ``None``.
+
+        Returns:
+            The user's ``login`` and ``name``, their organizations and their
+            team slugs in the required organization.
+
+        Raises:
+            PermissionError: If GitHub returns HTTP 401 or 403.
+            RuntimeError: If GitHub returns any other non-200 status.
+        """
+        queries = self._graphql_profile_queries(config)
+        query = next(queries)
+
+        while True:
+            try:
+                query = queries.send(await self._graphql(*query))
+            except StopIteration as done:
+                return done.value
+
+    async def get_headers(self) -> Mapping[str, str]:
+        """Return the headers from a request to the GitHub API root.
+
+        Returns:
+            The response headers, used to inspect the granted OAuth scopes.
+
+        Raises:
+            PermissionError: If GitHub does not return HTTP 200.
+        """
+        started = time.perf_counter()
+        r = await client.get(self._url(''), headers=self.headers)
+        self._observe('/', r, started)
+
+        if r.status_code != 200:
+            raise PermissionError(f'Github returned HTTP status: {r.status_code}')
+
+        return r.headers
+
+    async def get_scopes(self) -> List[str]:
+        """Return the OAuth scopes granted to the current token.
+
+        Returns:
+            A list of granted scope names.
+
+        Raises:
+            PermissionError: If the ``X-OAuth-Scopes`` header is missing.
+        """
+        headers = self.scope_headers if self.scope_headers is not None else await self.get_headers()
+        return self._parse_scopes(headers)
+
+    async def validate_scopes(self) -> None:
+        """Ensure the token grants every required OAuth scope.
+
+        Raises:
+            PermissionError: If one or more required scopes are missing.
+        """
+        self._check_scopes(await self.get_scopes())
+
+    async def call_github_api_endpoint(self, endpoint: str) -> Any:
+        """Return the JSON payload from a GitHub API endpoint.
+
+        Args:
+            endpoint: The API path (for example ``/user/emails``).
+
+        Returns:
+            The decoded JSON response body.
+
+        Raises:
+            PermissionError: If GitHub returns HTTP 401 or 403.
+            RuntimeError: If GitHub returns any other non-200 status.
+        """
+        r = await self._request(endpoint)
+        return r.json()
+
+    async def get_email_addresses(self, config: Optional[Dict[str, Any]] = None) -> List[Any]:
+        """Return the email addresses associated with the account.
+
+        See ``GithubAuth.get_email_addresses``.
+
+        Args:
+            config: The loaded configuration, or ``None``.
+
+        Returns:
+            The ``/user/emails`` entries.
+
+        Raises:
+            PermissionError: If GitHub returns HTTP 401 or 403.
+            RateLimitError: If the token is rate limited.
+            RuntimeError: If GitHub returns any other non-200 status.
+        """
+        return await self._get_pages('/user/emails', done=self._found_required_emails(config))
+
+    async def get_org_list(self, config: Optional[Dict[str, Any]] = None) -> List[Any]:
+        """Return the organizations the authenticated user belongs to.
+
+        See ``GithubAuth.get_org_list``.
+
+        Args:
+            config: The loaded configuration, or ``None``.
+
+        Returns:
+            The ``/user/orgs`` entries.
+
+        Raises:
+            PermissionError: If GitHub returns HTTP 401 or 403.
+            RateLimitError: If the token is rate limited.
+            RuntimeError: If GitHub returns any other non-200 status.
+        """
+        return await self._get_pages('/user/orgs', done=self._found_required_org(config))
+
+    async def get_org_membership(self, org: str) -> bool:
+        """Return whether the user is an active member of ``org``.
+
+        See ``GithubAuth.get_org_membership``.
+
+        Args:
+            org: The organization login.
+
+        Returns:
+            ``True`` if the membership is active, ``False`` if it is pending
+            or the user is not a member.
+
+        Raises:
+            PermissionError: If GitHub returns HTTP 401 or 403.
+            RateLimitError: If the token is rate limited.
+            RuntimeError: If GitHub returns any other non-200 status.
+        """
+        try:
+            membership = (await self._request(f'/user/memberships/orgs/{org}')).json()
+        except NotFoundError:
+            return False
+
+        return membership.get('state') == 'active'
+
+    async def get_user_info(self) -> Any:
+        """Return the authenticated user's profile.
+
+        Returns:
+            The decoded ``/user`` response.
+        """
+        return await self.call_github_api_endpoint('/user')
+
+    async def get_user_teams(self, config: Optional[Dict[str, Any]]) -> List[str]:
+        """Return team slugs for the configured GitHub organization.
+
+        See ``GithubAuth.get_user_teams``.
+
+        Args:
+            config: The loaded configuration, or ``None``.
+
+        Returns:
+            The team slugs the user belongs to in the required organization.
+
+        Raises:
+            PermissionError: If GitHub returns HTTP 401 or 403.
+            RuntimeError: If GitHub returns any other non-200 status.
+        """
+        org = self._get_required_org(config)
+
+        if org is None:
+            return []
+
+        return await self._get_pages('/user/teams', lambda page: list(self._filter_teams(page, org)))
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""Benchmark cold starts of ``webhook.py``, as seen by AWS Lambda.
+
+Starts ``fake_github.py`` in a subprocess, then starts fresh Python
+processes that import ``webhook`` and serve a single ``/info`` request
+through Flask's test client, the way a new Lambda container does. Each
+variant is measured with ``config.yml`` parsed by PyYAML or read from
+``config.compiled.json``, and with ``github.prewarm`` off or on. Reports
+the median import time and time to the first ``/info`` response.
+
+Example::
+
+    python benchmarks/cold_start.py --runs 20 --latency '*=0.02' --output cold_start.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import yaml
+
+from run import FAKE_GITHUB, ROOT, free_port, percentile, start
+
+# Runs inside each fresh process; prints the timings as JSON
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+import webhook
+imported = time.perf_counter()
+response = webhook.app.test_client().get('/info', headers={'Authorization': 'Bearer bench-token'})
+answered = time.perf_counter()
+print(json.dumps({
+    'status': response.status_code,
+    'import_ms': (imported - started) * 1000,
+    'first_info_ms': (answered - imported) * 1000,
+    'yaml_imported': 'yaml' in sys.modules,
+}))
+'''
+
+
+def write_config(directory: str, api_url: str, prewarm: bool, precompiled: bool) -> None:
+    """Write the configuration the proxy under test loads.
+
+    Args:
+        directory: The proxy's working directory.
+        api_url: Base URL of the fake GitHub API.
+        prewarm: Value of ``github.prewarm``.
+        precompiled: Whether to also write ``config.compiled.json``.
+    """
+    config: Dict[str, Any] = {
+        'github': {'api_url': api_url, 'prewarm': prewarm, 'required': {'org': 'BenchOrg'}},
+        'cache': {'profile': {'ttl': 0}},
+    }
+
+    with open(os.path.join(directory, 'config.yml'), 'w') as stream:
+        yaml.safe_dump(config, stream)
+
+    if precompiled:
+        subprocess.run(
+            [sys.executable, os.path.join(ROOT, 'webhook.py'), '--precompile-config'],
+            cwd=directory, check=True, stdout=subprocess.DEVNULL,
+        )
+
+
+def measure(directory: str, runs: int) -> Dict[str, Any]:
+    """Start ``runs`` fresh processes and collect their timings.
+
+    Args:
+        directory: The proxy's working directory.
+        runs: Number of processes to start.
+
+    Returns:
+        Median and p95 import time and time to the first ``/info`` response.
+    """
+    samples: List[Dict[str, Any]] = []
+    env = dict(os.environ, PYTHONPATH=ROOT, PYTHONDONTWRITEBYTECODE='1')
+
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', CHILD], cwd=directory, env=env, check=True, capture_output=True, text=True,
+        ).stdout
+        samples.append(json.loads(output.splitlines()[-1]))
+
+    imports = sorted(sample['import_ms'] for sample in samples)
+    first_info = sorted(sample['first_info_ms'] for sample in samples)
+
+    return {
+        'runs': runs,
+        'errors': sum(1 for sample in samples if sample['status'] != 200),
+        'yaml_imported': any(sample['yaml_imported'] for sample in samples),
+        'import_p50_ms': round(percentile(imports, 0.50), 2),
+        'import_p95_ms': round(percentile(imports, 0.95), 2),
+        'first_info_p50_ms': round(percentile(first_info, 0.50), 2),
+        'first_info_p95_ms': round(percentile(first_info, 0.95), 2),
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    """Measure every combination of configuration format and pre-warming.
+
+    Args:
+        args: The benchmark arguments.
+
+    Returns:
+        The run's settings and one result per variant.
+    """
+    github_port = free_port()
+    api_url = f'http://127.0.0.1:{github_port}'
+    github = start([FAKE_GITHUB, '-p', str(github_port), '--latency', args.latency], ROOT, github_port)
+    results = []
+
+    try:
+        for precompiled in (False, True):
+            for prewarm in (False, True):
+                with tempfile.TemporaryDirectory() as directory:
+                    write_config(directory, api_url, prewarm, precompiled)
+                    result = measure(directory, args.runs)
+                result.update({'config': 'json' if precompiled else 'yaml', 'prewarm': prewarm})
+                results.append(result)
+                print(
+                    f"{result['config']:>5} prewarm={str(prewarm):<5}  "
+                    f"import p50 {result['import_p50_ms']:>8} ms  p95 {result['import_p95_ms']:>8} ms  "
+                    f"first /info p50 {result['first_info_p50_ms']:>8} ms  p95 {result['first_info_p95_ms']:>8} ms  "
+                    f"{result['errors']} errors",
+                    flush=True,
+                )
+    finally:
+        github.terminate()
+        github.wait()
+
+    return {
+        'settings': {
+            'latency': args.latency,
+            'runs': args.runs,
+            'python': platform.python_version(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        },
+        'results': results,
+    }
+
+
+def get_args() -> argparse.Namespace:
+    """Parse command-line arguments.
+
+    Returns:
+        The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark cold starts of webhook.py against a fake GitHub API')
+    parser.add_argument('--runs', type=int, default=10, help='Fresh processes per variant')
+    parser.add_argument('--latency', default='0.02', help='Latency per endpoint, e.g. /user=0.05,*=0.02')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args()
+    report = run(args)
+
+    if args.output:
+        with open(args.output, 'w') as stream:
+            json.dump(report, stream, indent=2)
+            stream.write('\n')
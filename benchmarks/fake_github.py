@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""Local stand-in for api.github.com used by the benchmarks.
+
+Serves the endpoints the proxy calls (``/``, ``/user``, ``/user/orgs``,
+``/user/memberships/orgs/BenchOrg``, ``/user/emails``, paginated
+``/user/teams``, ``/graphql`` and ``/rate_limit``, and the organization
+directory's ``/orgs/BenchOrg/members``, ``/orgs/BenchOrg/teams`` and
+``/orgs/BenchOrg/teams/{team}/members``) with a
+configurable latency per endpoint, number of team pages and error rate.
+Responses carry an ``ETag`` and honour ``If-None-Match``, and every request
+is counted per endpoint; ``GET /_stats`` returns the counters so the
+benchmark can report upstream calls per login.
+
+The server accepts a deep backlog of connections and answers each on its
+own thread, so it keeps up with the proxy's concurrency and the
+benchmark's numbers measure the proxy rather than the stand-in.
+
+Run it on its own with ``python benchmarks/fake_github.py -p 9000``.
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+TEAMS_PER_PAGE = 100
+ORG = 'BenchOrg'
+# Pending connections the listening socket queues; the default of 5 drops
+# connection attempts under load, and clients retry them a second later
+LISTEN_BACKLOG = 1024
+
+
+class FakeGithub:
+    """Behaviour and request counters of the fake GitHub API.
+
+    Attributes:
+        latency: Seconds to wait before answering, by endpoint. ``*`` applies
+            to endpoints without their own entry.
+        team_pages: Number of ``/user/teams`` pages (of 100 teams), announced
+            with a ``Link: rel="last"`` header like GitHub does.
+        error_rate: Share of requests answered with HTTP 502.
+        counts: Number of requests received, by endpoint.
+    """
+
+    def __init__(
+        self,
+        latency: Optional[Dict[str, float]] = None,
+        team_pages: int = 1,
+        error_rate: float = 0.0,
+    ) -> None:
+        """Initialize the fake API.
+
+        Args:
+            latency: Seconds to wait before answering, by endpoint.
+            team_pages: Number of ``/user/teams`` pages.
+            error_rate: Share of requests answered with HTTP 502.
+        """
+        self.latency = latency or {}
+        self.team_pages = team_pages
+        self.error_rate = error_rate
+        self.counts: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> Dict[str, int]:
+        """Return a copy of the request counters."""
+        with self._lock:
+            return dict(self.counts)
+
+    def handle(self, method: str, path: str, body: Optional[Dict[str, Any]]) -> Tuple[int, Any, Dict[str, str]]:
+        """Return the status, JSON payload and extra headers for one request.
+
+        Args:
+            method: The HTTP method.
+            path: The request path, including the query string.
+            body: The decoded JSON request body, if any.
+
+        Returns:
+            The HTTP status, the payload to encode as JSON and extra headers.
+        """
+        url = urlsplit(path)
+        endpoint = url.path.rstrip('/') or '/'
+
+        if endpoint == '/_stats':
+            return 200, self.snapshot(), {}
+
+        with self._lock:
+            self.counts[endpoint] += 1
+
+        time.sleep(self.latency.get(endpoint, self.latency.get('*', 0.0)))
+
+        if self.error_rate and random.random() < self.error_rate:
+            return 502, {'message': 'Server Error'}, {}
+
+        if method == 'POST' and endpoint == '/graphql':
+            return 200, self.graphql((body or {}).get('variables') or {}), {}
+
+        if endpoint == '/':
+            return 200, {'current_user_url': '/user'}, {}
+        if endpoint == '/user':
+            return 200, {'login': 'benchuser', 'name': 'Bench User'}, {}
+        if endpoint == '/user/orgs':
+            return 200, [{'login': ORG}], {}
+        if endpoint == f'/user/memberships/orgs/{ORG}':
+            return 200, {'state': 'active', 'role': 'member', 'organization': {'login': ORG}}, {}
+        if endpoint == '/user/emails':
+            return 200, [{'email': 'bench@example.com', 'primary': True}], {}
+        if endpoint == '/rate_limit':
+            return 200, {'resources': {'core': {'limit': 5000, 'remaining': 5000}}}, {}
+        if endpoint == '/user/teams' or endpoint == f'/orgs/{ORG}/teams':
+            page = int(parse_qs(url.query).get('page', ['1'])[0])
+            return 200, self.teams(page), self.links(endpoint, self.team_pages)
+        if endpoint == f'/orgs/{ORG}/members' or endpoint.startswith(f'/orgs/{ORG}/teams/'):
+            return 200, [{'login': 'benchuser'}], {}
+
+        return 404, {'message': 'Not Found'}, {}
+
+    @staticmethod
+    def links(endpoint: str, pages: int) -> Dict[str, str]:
+        """Return the ``Link`` header GitHub sends for a list with ``pages`` pages."""
+        if pages <= 1:
+            return {}
+
+        return {'Link': f'<{endpoint}?page={pages}&per_page={TEAMS_PER_PAGE}>; rel="last"'}
+
+    def teams(self, page: int) -> List[Dict[str, Any]]:
+        """Return one page of teams in the benchmark organization."""
+        if page > self.team_pages:
+            return []
+
+        first = (page - 1) * TEAMS_PER_PAGE
+        return [
+            {'slug': f'team-{n}', 'organization': {'login': ORG}}
+            for n in range(first, first + TEAMS_PER_PAGE)
+        ]
+
+    def graphql(self, variables: Dict[str, Any]) -> Dict[str, Any]:
+        """Answer the proxy's profile and teams queries."""
+        page_info = {'hasNextPage': False, 'endCursor': None}
+
+        if 'org' in variables:
+            page = int(variables.get('teamCursor') or 0) + 1
+            return {'data': {'organization': {'teams': {
+                'nodes': [{'slug': team['slug']} for team in self.teams(page)],
+                'pageInfo': {'hasNextPage': page < self.team_pages, 'endCursor': str(page)},
+            }}}}
+
+        return {'data': {'viewer': {
+            'login': 'benchuser',
+            'name': 'Bench User',
+            'organizations': {'nodes': [{'login': ORG}], 'pageInfo': page_info},
+        }}}
+
+
+class FakeGithubServer(ThreadingHTTPServer):
+    """HTTP server for the fake API, with one daemon thread per connection."""
+
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+
+def create_server(github: FakeGithub, host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+    """Create an HTTP server answering with ``github``.
+
+    Args:
+        github: The fake API.
+        host: The address to bind to.
+        port: The port to listen on, or ``0`` for any free port.
+
+    Returns:
+        The server, not yet started.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body are written separately, so avoid delayed-ACK stalls
+        disable_nagle_algorithm = True
+
+        def do_GET(self) -> None:
+            self.respond('GET', None)
+
+        def do_POST(self) -> None:
+            length = int(self.headers.get('Content-Length') or 0)
+            self.respond('POST', json.loads(self.rfile.read(length) or b'{}'))
+
+        def respond(self, method: str, body: Optional[Dict[str, Any]]) -> None:
+            status, payload, headers = github.handle(method, self.path, body)
+            data = json.dumps(payload).encode('utf-8')
+            etag = '"' + hashlib.sha1(data).hexdigest() + '"'
+
+            if status == 200 and method == 'GET' and self.headers.get('If-None-Match') == etag:
+                status, data = 304, b''
+
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.send_header('X-OAuth-Scopes', 'read:org, user:email')
+            self.send_header('X-RateLimit-Remaining', '5000')
+            if status in (200, 304) and method == 'GET':
+                self.send_header('ETag', etag)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    return FakeGithubServer((host, port), Handler)
+
+
+def parse_latency(value: str) -> Dict[str, float]:
+    """Parse ``endpoint=seconds`` pairs, for example ``/user=0.05,*=0.02``.
+
+    Args:
+        value: Comma-separated pairs; a bare number applies to every endpoint.
+
+    Returns:
+        Seconds of latency by endpoint.
+    """
+    latency: Dict[str, float] = {}
+
+    for item in filter(None, value.split(',')):
+        endpoint, _, seconds = item.rpartition('=')
+        latency[endpoint or '*'] = float(seconds)
+
+    return latency
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake GitHub API for benchmarks')
+    parser.add_argument('-H', '--host', default='127.0.0.1', help='Host to bind to')
+    parser.add_argument('-p', '--port', type=int, default=9000, help='Port to listen on')
+    parser.add_argument('--latency', default='0.02', help='Latency per endpoint, e.g. /user=0.05,*=0.02')
+    parser.add_argument('--team-pages', type=int, default=1, help='Full pages of /user/teams')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests failing with 502')
+    args = parser.parse_args()
+
+    fake = FakeGithub(parse_latency(args.latency), args.team_pages, args.error_rate)
+    print(f'Fake GitHub API on http://{args.host}:{args.port}')
+    create_server(fake, args.host, args.port).serve_forever()
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""Benchmark the ``/info`` path against a local GitHub API stand-in.
+
+Starts ``fake_github.py`` in a subprocess, then runs the proxy under each
+requested server (``waitress`` serving ``webhook.app`` or ``uvicorn``
+serving ``asgi.app``) in a subprocess configured to call the stand-in, and
+drives ``/info`` at increasing concurrency. Reports requests per second,
+p50/p95/p99 latency and GitHub calls per login, and optionally writes the
+results as JSON so runs can be compared over time.
+
+Before measuring, the stand-in's own capacity is measured, and every
+result reports which share of it the proxy used. A result that used more
+than ``--max-upstream-load`` of it may measure the stand-in rather than
+the proxy; it is flagged with a warning and marked ``upstream_bound``. Each server is
+also warmed up, so connection pools are filled before the first
+measurement.
+
+Example::
+
+    python benchmarks/run.py --servers waitress uvicorn --concurrency 1 8 32 \\
+        --latency '*=0.02,/user/teams=0.05' --team-pages 3 --output results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+import requests
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_GITHUB = os.path.join(ROOT, 'benchmarks', 'fake_github.py')
+SERVERS = {
+    'waitress': os.path.join(ROOT, 'webhook.py'),
+    'uvicorn': os.path.join(ROOT, 'asgi.py'),
+}
+# GitHub calls a login makes concurrently (profile, orgs, emails and teams)
+CALLS_PER_LOGIN = 4
+
+
+def free_port() -> int:
+    """Return a TCP port that is currently free on localhost."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: List[float], share: float) -> float:
+    """Return the ``share`` percentile of ``values`` (nearest rank).
+
+    Args:
+        values: The sorted samples.
+        share: The percentile as a fraction, for example ``0.99``.
+
+    Returns:
+        The sample at that rank, or ``0.0`` without samples.
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, round(share * len(values)) - 1))]
+
+
+def write_config(directory: str, api_url: str, args: argparse.Namespace) -> None:
+    """Write the ``config.yml`` the proxy under test loads.
+
+    Args:
+        directory: The proxy's working directory.
+        api_url: Base URL of the fake GitHub API.
+        args: The benchmark arguments.
+    """
+    config: Dict[str, Any] = {
+        'github': {
+            'api': args.api,
+            'api_url': api_url,
+            'org_check': args.org_check,
+            'required': {'org': 'BenchOrg'},
+            'directory': {'interval': args.directory_interval},
+        },
+        'cache': {'profile': {'ttl': args.profile_cache_ttl}},
+    }
+
+    with open(os.path.join(directory, 'config.yml'), 'w') as stream:
+        yaml.safe_dump(config, stream)
+
+
+def start(command: List[str], directory: str, port: int) -> subprocess.Popen:
+    """Start a server and wait until it answers.
+
+    Args:
+        command: The server's command line, after the Python interpreter.
+        directory: The server's working directory.
+        port: The port the server listens on.
+
+    Returns:
+        The running server process.
+
+    Raises:
+        RuntimeError: If the server does not come up within 30 seconds.
+    """
+    process = subprocess.Popen(
+        [sys.executable, *command],
+        cwd=directory,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f'http://127.0.0.1:{port}/', timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.1)
+
+    process.kill()
+    raise RuntimeError(f'{command[0]} did not start on port {port}')
+
+
+def wait_for_directory(port: int) -> None:
+    """Wait until the proxy has synced its organization directory once.
+
+    Args:
+        port: The port the proxy listens on.
+
+    Raises:
+        RuntimeError: If no sync succeeds within 60 seconds.
+    """
+    deadline = time.monotonic() + 60
+
+    while time.monotonic() < deadline:
+        body = requests.get(f'http://127.0.0.1:{port}/metrics', timeout=5).text
+        if 'github_oauth_proxy_directory_syncs_total{result="ok"}' in body:
+            return
+        time.sleep(0.1)
+
+    raise RuntimeError('The organization directory was not synced')
+
+
+def measure_upstream_capacity(api_url: str, args: argparse.Namespace) -> float:
+    """Return how many requests per second the fake GitHub API can answer.
+
+    ``/_stats`` is answered without the configured latency, so driving it
+    at the highest concurrency the proxy can reach measures the stand-in's
+    own throughput on this machine.
+
+    Args:
+        api_url: Base URL of the fake GitHub API.
+        args: The benchmark arguments.
+
+    Returns:
+        The request rate the stand-in sustained.
+    """
+    concurrency = max(args.concurrency) * CALLS_PER_LOGIN
+    result = drive(f'{api_url}/_stats', concurrency, max(args.requests, concurrency * 10), 1)
+    print(f"fake GitHub capacity {result['rps']:>8} req/s at c={concurrency}", flush=True)
+    return result['rps']
+
+
+def upstream_calls(api_url: str) -> Dict[str, int]:
+    """Return the fake GitHub API's request counters, by endpoint."""
+    return requests.get(f'{api_url}/_stats', timeout=5).json()
+
+
+def drive(url: str, concurrency: int, total: int, tokens: int) -> Dict[str, Any]:
+    """Send ``total`` ``/info`` requests from ``concurrency`` threads.
+
+    Args:
+        url: The proxy's ``/info`` URL.
+        concurrency: Number of concurrent clients.
+        total: Number of requests to send.
+        tokens: Number of distinct tokens to rotate through.
+
+    Returns:
+        The request rate, latency percentiles and error count.
+    """
+    local = threading.local()
+
+    def login(n: int) -> float:
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        started = time.perf_counter()
+        r = local.session.get(url, headers={'Authorization': f'Bearer bench-token-{n % tokens}'})
+        elapsed = time.perf_counter() - started
+        return elapsed if r.status_code == 200 else -elapsed
+
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(login, range(total)))
+
+    duration = time.perf_counter() - started
+    latencies = sorted(abs(sample) for sample in samples)
+
+    return {
+        'requests': total,
+        'errors': sum(1 for sample in samples if sample < 0),
+        'rps': round(total / duration, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    """Run every server at every concurrency level.
+
+    Args:
+        args: The benchmark arguments.
+
+    Returns:
+        The run's settings and one result per server and concurrency level.
+    """
+    # The organization directory syncs with this token when it is enabled
+    os.environ.setdefault('GITHUB_DIRECTORY_TOKEN', 'bench-service-token')
+    github_port = free_port()
+    api_url = f'http://127.0.0.1:{github_port}'
+    github = start([
+        FAKE_GITHUB, '-p', str(github_port),
+        '--latency', args.latency,
+        '--team-pages', str(args.team_pages),
+        '--error-rate', str(args.error_rate),
+    ], ROOT, github_port)
+    results = []
+
+    try:
+        capacity = measure_upstream_capacity(api_url, args)
+
+        for server in args.servers:
+            with tempfile.TemporaryDirectory() as directory:
+                write_config(directory, api_url, args)
+                port = free_port()
+                process = start([SERVERS[server], '-H', '127.0.0.1', '-p', str(port)], directory, port)
+
+                if args.directory_interval:
+                    wait_for_directory(port)
+
+                if args.warmup:
+                    drive(f'http://127.0.0.1:{port}/info', max(args.concurrency), args.warmup, args.tokens)
+
+                try:
+                    for concurrency in args.concurrency:
+                        before = upstream_calls(api_url)
+                        result = drive(f'http://127.0.0.1:{port}/info', concurrency, args.requests, args.tokens)
+                        after = upstream_calls(api_url)
+                        calls = {
+                            endpoint: after[endpoint] - before.get(endpoint, 0)
+                            for endpoint in sorted(after)
+                            if after[endpoint] != before.get(endpoint, 0)
+                        }
+                        calls_per_login = sum(calls.values()) / args.requests
+                        result.update({
+                            'server': server,
+                            'concurrency': concurrency,
+                            'upstream_calls_per_login': round(calls_per_login, 2),
+                            'upstream_calls': calls,
+                            'upstream_load': round(result['rps'] * calls_per_login / capacity, 2),
+                        })
+                        result['upstream_bound'] = result['upstream_load'] > args.max_upstream_load
+                        results.append(result)
+                        print(
+                            f"{server:>9} c={concurrency:<4} {result['rps']:>8} req/s  "
+                            f"p50 {result['p50_ms']:>8} ms  p95 {result['p95_ms']:>8} ms  "
+                            f"p99 {result['p99_ms']:>8} ms  {result['upstream_calls_per_login']:>5} calls/login  "
+                            f"{result['errors']} errors  {result['upstream_load']:.0%} of fake GitHub",
+                            flush=True,
+                        )
+
+                        if result['upstream_bound']:
+                            print(
+                                f'WARNING: {server} c={concurrency} used over {args.max_upstream_load:.0%} of the '
+                                'fake GitHub API capacity; this result may measure the stand-in',
+                                file=sys.stderr,
+                                flush=True,
+                            )
+                finally:
+                    process.terminate()
+                    process.wait()
+    finally:
+        github.terminate()
+        github.wait()
+
+    return {
+        'settings': {
+            'api': args.api,
+            'org_check': args.org_check,
+            'latency': args.latency,
+            'team_pages': args.team_pages,
+            'error_rate': args.error_rate,
+            'requests': args.requests,
+            'tokens': args.tokens,
+            'profile_cache_ttl': args.profile_cache_ttl,
+            'directory_interval': args.directory_interval,
+            'warmup': args.warmup,
+            'upstream_capacity_rps': capacity,
+            'python': platform.python_version(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        },
+        'results': results,
+    }
+
+
+def get_args() -> argparse.Namespace:
+    """Parse command-line arguments.
+
+    Returns:
+        The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the /info path against a fake GitHub API')
+    parser.add_argument('--servers', nargs='+', choices=sorted(SERVERS), default=['waitress', 'uvicorn'])
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=200, help='Requests per concurrency level')
+    parser.add_argument('--tokens', type=int, default=1000, help='Distinct tokens to rotate through')
+    parser.add_argument('--api', choices=['rest', 'graphql'], default='rest')
+    parser.add_argument('--org-check', choices=['list', 'membership'], default='list')
+    parser.add_argument('--latency', default='0.02', help='Latency per endpoint, e.g. /user=0.05,*=0.02')
+    parser.add_argument('--team-pages', type=int, default=1, help='Full pages of /user/teams')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of GitHub requests failing with 502')
+    parser.add_argument(
+        '--profile-cache-ttl', type=float, default=0,
+        help='Profile cache TTL; 0 (the default) measures every login against GitHub',
+    )
+    parser.add_argument(
+        '--directory-interval', type=float, default=0,
+        help='Organization directory sync interval; 0 (the default) disables it',
+    )
+    parser.add_argument(
+        '--warmup', type=int, default=100,
+        help='Requests sent to each server before measuring, at the highest concurrency',
+    )
+    parser.add_argument(
+        '--max-upstream-load', type=float, default=0.5,
+        help="Flag results that used more than this share of the fake GitHub API's capacity",
+    )
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = get_args()
+    report = run(args)
+
+    if args.output:
+        with open(args.output, 'w') as stream:
+            json.dump(report, stream, indent=2)
+            stream.write('\n')
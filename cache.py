@@ -0,0 +1,951 @@
+"""Caches used by the oAuth2 proxy.
+
+Provides a thread-safe, size-bounded LRU cache with per-entry expiry and
+memory accounting, variants for Spinnaker profiles (kept as compact
+records) and for conditional (ETag) GitHub responses, and a helper that
+derives cache keys from OAuth tokens so raw tokens are never stored.
+
+The profile cache can also be shared between processes and replicas, using
+``SqliteCache`` on a local file or ``RedisCache`` on any server speaking
+the Redis protocol. Both store compact JSON entries with a TTL.
+
+``SingleFlight`` and ``AsyncSingleFlight`` coalesce concurrent work for the
+same key, so that simultaneous cache misses trigger a single fetch.
+"""
+
+import hashlib
+import json
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Hashable, Iterator, Optional, Tuple
+
+if TYPE_CHECKING:
+    import asyncio
+
+CACHE_BACKENDS = ('memory', 'sqlite', 'redis')
+DEFAULT_SQLITE_PATH = '/tmp/github-oauth-proxy-cache.db'
+DEFAULT_REDIS_URL = 'redis://localhost:6379/0'
+DEFAULT_REDIS_PREFIX = 'github-oauth-proxy:'
+# Keys read per round trip when every entry has to be visited
+REDIS_SCAN_BATCH = 100
+# Writes between two size checks of a SQLite cache, at most; counting the
+# rows visits all of them, so it is not done on every write
+SQLITE_TRIM_INTERVAL = 100
+
+# Memory the cache holds per entry besides the key and value: the entry
+# tuple, its expiry and size, and the OrderedDict slot (CPython 3.11)
+ENTRY_OVERHEAD = 160
+# The keys of the profiles built by ``webhook.build_user_info``
+PROFILE_FIELDS = frozenset(('username', 'firstname', 'lastname', 'email', 'roles', 'orgs', 'organizations_url'))
+
+logger = logging.getLogger(__name__)
+
+
+def sizeof(value: Any) -> int:
+    """Return the memory held by a value, including the items it contains.
+
+    Dicts, lists, tuples and sets are followed; anything else counts as
+    ``sys.getsizeof``.
+
+    Args:
+        value: The value to measure.
+
+    Returns:
+        The size in bytes.
+    """
+    size = sys.getsizeof(value)
+
+    if isinstance(value, dict):
+        size += sum(sizeof(key) + sizeof(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(sizeof(item) for item in value)
+
+    return size
+
+
+def hash_token(access_token: str) -> str:
+    """Return a stable, non-reversible cache key for an OAuth token.
+
+    Args:
+        access_token: The GitHub OAuth access token.
+
+    Returns:
+        The hex-encoded SHA-256 digest of the token.
+    """
+    return hashlib.sha256(access_token.encode('utf-8')).hexdigest()
+
+
+class CacheBackend:
+    """Interface shared by the profile cache backends.
+
+    Subclasses implement ``get``, ``get_stale``, ``set``, ``delete``,
+    ``delete_where``, ``clear`` and ``__len__``.
+
+    Attributes:
+        ttl: Seconds an entry stays fresh. A TTL of ``0`` disables the cache.
+        max_entries: Maximum number of entries kept.
+        max_stale: Seconds an expired entry is kept for ``get_stale``.
+        hits: Number of lookups answered from the cache.
+        misses: Number of lookups that found no fresh entry.
+    """
+
+    def __init__(self, ttl: float, max_entries: int, max_stale: float = 0) -> None:
+        """Initialize the shared settings and counters.
+
+        Args:
+            ttl: Seconds an entry stays fresh.
+            max_entries: Maximum number of entries to keep.
+            max_stale: Seconds an expired entry remains available as stale.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_stale = max_stale
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """Return whether the cache stores anything at all."""
+        return self.ttl > 0 and self.max_entries > 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for ``key`` if it has not expired."""
+        raise NotImplementedError
+
+    def get_stale(self, key: Hashable, within: Optional[float] = None) -> Optional[Any]:
+        """Return the value for ``key`` even if it expired within ``max_stale``."""
+        raise NotImplementedError
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store ``value`` under ``key``."""
+        raise NotImplementedError
+
+    def delete(self, key: Hashable) -> None:
+        """Remove ``key`` from the cache if present."""
+        raise NotImplementedError
+
+    def delete_where(self, predicate: Callable[[Any], bool]) -> int:
+        """Remove every entry whose value matches ``predicate``, expired or not."""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        """Remove every entry from the cache."""
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        """Return the number of entries currently held."""
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, float]:
+        """Return the cache's counters for metrics.
+
+        Returns:
+            The ``hits``, ``misses``, ``hit_ratio`` and current ``entries``.
+        """
+        stats = self._lookup_stats()
+        stats['entries'] = len(self)
+        return stats
+
+    def _lookup_stats(self) -> Dict[str, float]:
+        """Return the ``hits``, ``misses`` and ``hit_ratio`` counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+class TTLCache(CacheBackend):
+    """Thread-safe LRU cache whose entries expire after a fixed TTL.
+
+    The memory held by every entry, its key and the cache's own bookkeeping
+    is counted in ``bytes``, so the cache can be bounded by size as well as
+    by number of entries.
+
+    Attributes:
+        ttl: Seconds an entry stays fresh. A TTL of ``0`` disables the cache.
+        max_entries: Maximum number of entries kept before the least recently
+            used entry is evicted.
+        max_stale: Seconds an expired entry is kept for ``get_stale``.
+        max_bytes: Maximum ``bytes`` before the least recently used entries
+            are evicted; ``0`` for no limit.
+        bytes: Memory currently held by the entries.
+        hits: Number of lookups answered from the cache.
+        misses: Number of lookups that found no fresh entry.
+    """
+
+    def __init__(self, ttl: float, max_entries: int, max_stale: float = 0, max_bytes: int = 0) -> None:
+        """Initialize an empty cache.
+
+        Args:
+            ttl: Seconds an entry stays fresh.
+            max_entries: Maximum number of entries to keep.
+            max_stale: Seconds an expired entry remains available as stale.
+            max_bytes: Maximum memory to hold, or ``0`` for no limit.
+        """
+        super().__init__(ttl, max_entries, max_stale)
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        # Expiry, stored value and its size in bytes, by key
+        self._entries: 'OrderedDict[Hashable, Tuple[float, Any, int]]' = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for ``key`` if it has not expired.
+
+        Args:
+            key: The cache key.
+
+        Returns:
+            The cached value, or ``None`` if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._lookup(key)
+
+            if entry is None or entry[0] <= time.monotonic():
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._decode(entry[1])
+
+    def get_stale(self, key: Hashable, within: Optional[float] = None) -> Optional[Any]:
+        """Return the value for ``key`` even if it expired within ``max_stale``.
+
+        Args:
+            key: The cache key.
+            within: If set, only return an entry that expired less than this
+                many seconds ago.
+
+        Returns:
+            The cached value, or ``None`` if it is missing or too old.
+        """
+        with self._lock:
+            entry = self._lookup(key)
+
+            if entry is None or (within is not None and entry[0] + within <= time.monotonic()):
+                return None
+
+            return self._decode(entry[1])
+
+    def _lookup(self, key: Hashable) -> Optional[Tuple[float, Any, int]]:
+        """Return the entry for ``key``, dropping it once past ``max_stale``.
+
+        The caller must hold the lock.
+        """
+        entry = self._entries.get(key)
+
+        if entry is not None and entry[0] + self.max_stale <= time.monotonic():
+            self._discard(key)
+            return None
+
+        return entry
+
+    def _encode(self, value: Any) -> Tuple[Any, int]:
+        """Return the form ``value`` is stored in and the memory it holds.
+
+        The caller must hold the lock.
+        """
+        return value, sizeof(value)
+
+    def _decode(self, stored: Any) -> Any:
+        """Return the value an entry stored by ``_encode`` stands for."""
+        return stored
+
+    def _release(self, stored: Any) -> None:
+        """Release what a stored value shares with other entries.
+
+        The caller must hold the lock.
+        """
+
+    def _discard(self, key: Hashable) -> None:
+        """Remove ``key`` and stop counting its memory.
+
+        The caller must hold the lock.
+        """
+        entry = self._entries.pop(key, None)
+
+        if entry is not None:
+            self.bytes -= entry[2]
+            self._release(entry[1])
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store ``value`` under ``key``, evicting the oldest entries if full.
+
+        Args:
+            key: The cache key.
+            value: The value to cache.
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._discard(key)
+            stored, size = self._encode(value)
+            size += sizeof(key) + ENTRY_OVERHEAD
+            self._entries[key] = (time.monotonic() + self.ttl, stored, size)
+            self.bytes += size
+
+            while self._entries and (
+                len(self._entries) > self.max_entries or 0 < self.max_bytes < self.bytes
+            ):
+                self._discard(next(iter(self._entries)))
+
+    def delete(self, key: Hashable) -> None:
+        """Remove ``key`` from the cache if present.
+
+        Args:
+            key: The cache key.
+        """
+        with self._lock:
+            self._discard(key)
+
+    def delete_where(self, predicate: Callable[[Any], bool]) -> int:
+        """Remove every entry whose value matches ``predicate``, expired or not.
+
+        Every entry is visited, so this is meant for rare events such as a
+        user leaving the organization, not for the request path.
+
+        Args:
+            predicate: Called with each cached value.
+
+        Returns:
+            The number of entries removed.
+        """
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if predicate(self._decode(entry[1]))]
+
+            for key in keys:
+                self._discard(key)
+
+        return len(keys)
+
+    def clear(self) -> None:
+        """Remove every entry from the cache."""
+        with self._lock:
+            for key in list(self._entries):
+                self._discard(key)
+
+    def __len__(self) -> int:
+        """Return the number of entries currently held, including expired ones."""
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, float]:
+        """Return the cache's counters for metrics.
+
+        Returns:
+            The ``hits``, ``misses``, ``hit_ratio``, current ``entries`` and
+            the ``bytes`` they hold.
+        """
+        stats = super().stats()
+        stats['bytes'] = self.bytes
+        return stats
+
+
+class CompactProfile:
+    """A Spinnaker profile as kept in ``ProfileCache``.
+
+    ``roles`` and ``orgs`` are kept as tuples of names shared with every
+    other cached profile, rather than as one comma-separated string each.
+    """
+
+    __slots__ = ('username', 'firstname', 'lastname', 'email', 'roles', 'orgs', 'organizations_url')
+
+    def __init__(
+        self,
+        username: str,
+        firstname: str,
+        lastname: str,
+        email: str,
+        roles: Tuple[str, ...],
+        orgs: Tuple[str, ...],
+        organizations_url: str,
+    ) -> None:
+        """Initialize the record.
+
+        Args:
+            username: The Spinnaker username.
+            firstname: The user's first name.
+            lastname: The user's last name.
+            email: The user's primary email address.
+            roles: The team slugs.
+            orgs: The organization logins.
+            organizations_url: The organizations URL Spinnaker is given.
+        """
+        self.username = username
+        self.firstname = firstname
+        self.lastname = lastname
+        self.email = email
+        self.roles = roles
+        self.orgs = orgs
+        self.organizations_url = organizations_url
+
+    def to_dict(self) -> Dict[str, str]:
+        """Return the profile in the form ``build_user_info`` builds it."""
+        return {
+            'username': self.username,
+            'firstname': self.firstname,
+            'lastname': self.lastname,
+            'email': self.email,
+            'roles': ','.join(self.roles),
+            'orgs': ','.join(self.orgs),
+            'organizations_url': self.organizations_url,
+        }
+
+
+class ProfileCache(TTLCache):
+    """In-memory cache of Spinnaker profiles, stored as ``CompactProfile`` records.
+
+    Tens of thousands of users mostly belong to the same few organizations
+    and teams, so each name is stored once and counted once in ``bytes``,
+    however many profiles refer to it. Values that are not complete
+    profiles are stored as they are.
+    """
+
+    def __init__(self, ttl: float, max_entries: int, max_stale: float = 0, max_bytes: int = 0) -> None:
+        """Initialize an empty cache.
+
+        Args:
+            ttl: Seconds an entry stays fresh.
+            max_entries: Maximum number of entries to keep.
+            max_stale: Seconds an expired entry remains available as stale.
+            max_bytes: Maximum memory to hold, or ``0`` for no limit.
+        """
+        super().__init__(ttl, max_entries, max_stale, max_bytes)
+        # Shared name and the number of stored profiles using it, by name
+        self._names: Dict[str, Tuple[str, int]] = {}
+
+    def _share(self, name: str) -> str:
+        """Return the shared copy of ``name``, counting it in ``bytes`` once.
+
+        The caller must hold the lock.
+        """
+        shared, references = self._names.get(name, (name, 0))
+
+        if not references:
+            self.bytes += sizeof(shared)
+
+        self._names[name] = (shared, references + 1)
+        return shared
+
+    def _unshare(self, name: str) -> None:
+        """Drop one reference to a shared name, freeing it after the last one.
+
+        The caller must hold the lock.
+        """
+        shared, references = self._names[name]
+
+        if references > 1:
+            self._names[name] = (shared, references - 1)
+        else:
+            del self._names[name]
+            self.bytes -= sizeof(shared)
+
+    def _share_list(self, names: str) -> Tuple[str, ...]:
+        """Return a comma-separated list of names as a tuple of shared names."""
+        return tuple(self._share(name) for name in names.split(',')) if names else ()
+
+    def _encode(self, value: Any) -> Tuple[Any, int]:
+        if not (isinstance(value, dict) and value.keys() == PROFILE_FIELDS
+                and all(isinstance(field, str) for field in value.values())):
+            return super()._encode(value)
+
+        profile = CompactProfile(
+            value['username'],
+            value['firstname'],
+            value['lastname'],
+            value['email'],
+            self._share_list(value['roles']),
+            self._share_list(value['orgs']),
+            self._share(value['organizations_url']),
+        )
+        # The shared names are already counted by ``_share``
+        size = sys.getsizeof(profile) + sys.getsizeof(profile.roles) + sys.getsizeof(profile.orgs)
+        size += sizeof(profile.username) + sizeof(profile.firstname) + sizeof(profile.lastname)
+        return profile, size + sizeof(profile.email)
+
+    def _decode(self, stored: Any) -> Any:
+        return stored.to_dict() if isinstance(stored, CompactProfile) else stored
+
+    def _release(self, stored: Any) -> None:
+        if isinstance(stored, CompactProfile):
+            for name in (*stored.roles, *stored.orgs, stored.organizations_url):
+                self._unshare(name)
+
+
+class ResponseCache(TTLCache):
+    """Cache of GitHub responses replayed with ``If-None-Match``.
+
+    Attributes:
+        not_modified: Number of conditional requests answered with HTTP 304.
+    """
+
+    def __init__(self, ttl: float, max_entries: int, max_bytes: int = 0) -> None:
+        """Initialize an empty response cache.
+
+        Args:
+            ttl: Seconds a stored response may be revalidated for.
+            max_entries: Maximum number of responses to keep.
+            max_bytes: Maximum memory to hold, or ``0`` for no limit.
+        """
+        super().__init__(ttl, max_entries, max_bytes=max_bytes)
+        self.not_modified = 0
+
+    def _encode(self, value: Any) -> Tuple[Any, int]:
+        # ``sys.getsizeof`` of a response leaves out what it holds, which is
+        # its body and headers
+        return value, sizeof(value.content) + sizeof(value.headers)
+
+    def record_not_modified(self) -> None:
+        """Count a conditional request that GitHub answered with HTTP 304."""
+        with self._lock:
+            self.not_modified += 1
+
+    def stats(self) -> Dict[str, float]:
+        """Return the cache's counters for metrics.
+
+        Returns:
+            The ``TTLCache`` counters and ``not_modified``.
+        """
+        stats = super().stats()
+        stats['not_modified'] = self.not_modified
+        return stats
+
+
+class SerializedCache(CacheBackend):
+    """Base for backends that store entries outside the process.
+
+    Values are stored as compact JSON together with the wall-clock time they
+    stay fresh until, so that every process agrees on expiry. Storage
+    failures are logged and treated as cache misses, so an unavailable
+    backend never fails a login.
+    """
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for ``key`` if it has not expired.
+
+        Args:
+            key: The cache key.
+
+        Returns:
+            The cached value, or ``None`` if it is missing or expired.
+        """
+        entry = self._read(str(key))
+        hit = entry is not None and entry[0] > time.time()
+
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        return entry[1] if hit and entry is not None else None
+
+    def get_stale(self, key: Hashable, within: Optional[float] = None) -> Optional[Any]:
+        """Return the value for ``key`` even if it expired within ``max_stale``.
+
+        Args:
+            key: The cache key.
+            within: If set, only return an entry that expired less than this
+                many seconds ago.
+
+        Returns:
+            The cached value, or ``None`` if it is missing or too old.
+        """
+        entry = self._read(str(key))
+
+        if entry is None or (within is not None and entry[0] + within <= time.time()):
+            return None
+
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store ``value`` under ``key`` for ``ttl`` plus ``max_stale`` seconds.
+
+        Args:
+            key: The cache key.
+            value: The JSON-serializable value to cache.
+        """
+        if not self.enabled:
+            return
+
+        fresh_until = time.time() + self.ttl
+        payload = json.dumps([fresh_until, value], separators=(',', ':')).encode('utf-8')
+
+        try:
+            self._store(str(key), payload, fresh_until + self.max_stale)
+        except Exception as e:
+            logger.warning('Failed to write to the %s cache: %s', type(self).__name__, e)
+
+    def delete(self, key: Hashable) -> None:
+        """Remove ``key`` from the cache if present.
+
+        Args:
+            key: The cache key.
+        """
+        try:
+            self._remove(str(key))
+        except Exception as e:
+            logger.warning('Failed to delete from the %s cache: %s', type(self).__name__, e)
+
+    def delete_where(self, predicate: Callable[[Any], bool]) -> int:
+        """Remove every entry whose value matches ``predicate``, expired or not.
+
+        Every stored entry is read and decoded, so this is meant for rare
+        events such as a user leaving the organization, not for the
+        request path.
+
+        Args:
+            predicate: Called with each cached value.
+
+        Returns:
+            The number of entries removed.
+        """
+        try:
+            keys = [
+                key for key, payload in self._scan()
+                if (entry := self._decode(key, payload)) is not None and predicate(entry[1])
+            ]
+
+            for key in keys:
+                self._remove(key)
+        except Exception as e:
+            logger.warning('Failed to delete from the %s cache: %s', type(self).__name__, e)
+            return 0
+
+        return len(keys)
+
+    def _read(self, key: str) -> Optional[Tuple[float, Any]]:
+        """Return the decoded ``(fresh_until, value)`` entry for ``key``."""
+        try:
+            payload = self._load(key)
+        except Exception as e:
+            logger.warning('Failed to read from the %s cache: %s', type(self).__name__, e)
+            return None
+
+        if payload is None:
+            return None
+
+        entry = self._decode(key, payload)
+
+        if entry is None:
+            # Drop the entry so it is not decoded again on every lookup
+            self.delete(key)
+
+        return entry
+
+    def _decode(self, key: str, payload: bytes) -> Optional[Tuple[float, Any]]:
+        """Return the decoded ``(fresh_until, value)`` entry, or ``None`` if it is corrupt."""
+        try:
+            fresh_until, value = json.loads(payload)
+            return float(fresh_until), value
+        except (ValueError, TypeError) as e:
+            logger.warning('Ignoring corrupt %s cache entry %r: %s', type(self).__name__, key, e)
+            return None
+
+    def _load(self, key: str) -> Optional[bytes]:
+        """Return the stored payload for ``key``, or ``None`` once it expired."""
+        raise NotImplementedError
+
+    def _store(self, key: str, payload: bytes, expires_at: float) -> None:
+        """Store ``payload`` under ``key`` until the wall-clock ``expires_at``."""
+        raise NotImplementedError
+
+    def _remove(self, key: str) -> None:
+        """Remove the payload stored under ``key``."""
+        raise NotImplementedError
+
+    def _scan(self) -> Iterator[Tuple[str, bytes]]:
+        """Yield the key and payload of every stored entry."""
+        raise NotImplementedError
+
+
+class SqliteCache(SerializedCache):
+    """Cache stored in a local SQLite database.
+
+    Shared by every process on the host (for example several waitress or
+    uvicorn workers, or Lambda invocations reusing ``/tmp``).
+
+    Eviction is by expiry rather than by use: once the cache is over
+    ``max_entries``, the entries closest to expiry, which with a fixed TTL
+    are the ones written longest ago, are evicted first, even if they were
+    read recently. The size is only checked once every ``max_entries // 10``
+    writes, and at least every ``SQLITE_TRIM_INTERVAL``, so each process
+    can take the cache that far over ``max_entries`` between checks.
+
+    Attributes:
+        path: Path of the database file.
+    """
+
+    def __init__(self, path: str, ttl: float, max_entries: int, max_stale: float = 0) -> None:
+        """Open (and if necessary create) the cache database.
+
+        Args:
+            path: Path of the database file.
+            ttl: Seconds an entry stays fresh.
+            max_entries: Maximum number of entries to keep. Entries closest
+                to expiry are evicted first.
+            max_stale: Seconds an expired entry remains available as stale.
+        """
+        # Deferred import: sqlite3 is only needed when this backend is used.
+        import sqlite3
+
+        super().__init__(ttl, max_entries, max_stale)
+        self.path = path
+        self._trim_interval = max(1, min(SQLITE_TRIM_INTERVAL, max_entries // 10))
+        self._writes = 0
+        self._connection = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, expires_at REAL NOT NULL, value BLOB NOT NULL)'
+        )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at)')
+
+    def _load(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT value FROM cache WHERE key = ? AND expires_at > ?', (key, time.time())
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def _store(self, key: str, payload: bytes, expires_at: float) -> None:
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO cache (key, expires_at, value) VALUES (?, ?, ?)', (key, expires_at, payload)
+            )
+            self._writes += 1
+
+            if self._writes % self._trim_interval == 0:
+                self._trim()
+
+    def _trim(self) -> None:
+        """Delete expired entries, then the ones closest to expiry over ``max_entries``."""
+        self._connection.execute('DELETE FROM cache WHERE expires_at <= ?', (time.time(),))
+        excess = self._connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0] - self.max_entries
+
+        if excess > 0:
+            self._connection.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires_at LIMIT ?)', (excess,)
+            )
+
+    def _remove(self, key: str) -> None:
+        with self._lock:
+            self._connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def _scan(self) -> Iterator[Tuple[str, bytes]]:
+        with self._lock:
+            rows = self._connection.execute('SELECT key, value FROM cache').fetchall()
+        yield from rows
+
+    def clear(self) -> None:
+        """Remove every entry from the cache."""
+        with self._lock:
+            self._connection.execute('DELETE FROM cache')
+
+    def __len__(self) -> int:
+        """Return the number of entries that have not yet expired."""
+        with self._lock:
+            return self._connection.execute(
+                'SELECT COUNT(*) FROM cache WHERE expires_at > ?', (time.time(),)
+            ).fetchone()[0]
+
+
+class RedisCache(SerializedCache):
+    """Cache stored on a server speaking the Redis protocol.
+
+    Shared by every replica connected to the same server. Entries expire
+    through the server's own key TTLs, so ``max_entries`` is left to the
+    server's ``maxmemory`` policy.
+
+    Attributes:
+        prefix: Prefix of every key written by this cache.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        max_entries: int,
+        max_stale: float = 0,
+        url: str = DEFAULT_REDIS_URL,
+        prefix: str = DEFAULT_REDIS_PREFIX,
+        client: Any = None,
+    ) -> None:
+        """Connect to the cache server.
+
+        Args:
+            ttl: Seconds an entry stays fresh.
+            max_entries: Maximum number of entries to keep.
+            max_stale: Seconds an expired entry remains available as stale.
+            url: The server URL, for example ``redis://localhost:6379/0``.
+            prefix: Prefix of every key written by this cache.
+            client: An existing Redis client to use instead of ``url``.
+        """
+        super().__init__(ttl, max_entries, max_stale)
+        self.prefix = prefix
+
+        if client is None:
+            # Deferred import: redis is only needed when this backend is used.
+            import redis
+            client = redis.Redis.from_url(url, socket_timeout=1.0, socket_connect_timeout=1.0)
+
+        self._client = client
+
+    def _load(self, key: str) -> Optional[bytes]:
+        return self._client.get(self.prefix + key)
+
+    def _store(self, key: str, payload: bytes, expires_at: float) -> None:
+        self._client.set(self.prefix + key, payload, px=max(1, int((expires_at - time.time()) * 1000)))
+
+    def _remove(self, key: str) -> None:
+        self._client.delete(self.prefix + key)
+
+    def _scan(self) -> Iterator[Tuple[str, bytes]]:
+        keys = list(self._client.scan_iter(match=self.prefix + '*'))
+
+        for start in range(0, len(keys), REDIS_SCAN_BATCH):
+            batch = keys[start:start + REDIS_SCAN_BATCH]
+
+            for key, payload in zip(batch, self._client.mget(batch)):
+                # Entries can expire between the scan and the read
+                if payload is not None:
+                    name = key.decode('utf-8') if isinstance(key, bytes) else key
+                    yield name[len(self.prefix):], payload
+
+    def clear(self) -> None:
+        """Remove every entry written with this cache's prefix."""
+        keys = list(self._client.scan_iter(match=self.prefix + '*'))
+
+        if keys:
+            self._client.delete(*keys)
+
+    def __len__(self) -> int:
+        """Return the number of entries written with this cache's prefix.
+
+        This scans the whole keyspace, so ``stats`` leaves it out.
+        """
+        return sum(1 for _ in self._client.scan_iter(match=self.prefix + '*'))
+
+    def stats(self) -> Dict[str, float]:
+        """Return the cache's counters for metrics.
+
+        Returns:
+            The ``hits``, ``misses`` and ``hit_ratio``. The number of entries
+            is left out, as counting them would scan the server's keyspace
+            on every scrape.
+        """
+        return self._lookup_stats()
+
+
+class SingleFlight:
+    """Run at most one call per key at a time across threads.
+
+    Threads calling ``do`` with a key that is already in flight wait for
+    that call and share its result or exception instead of repeating it.
+
+    Attributes:
+        shared: Number of calls answered by another thread's call.
+    """
+
+    def __init__(self) -> None:
+        """Initialize with no calls in flight."""
+        self.shared = 0
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args: Any) -> Any:
+        """Return ``fn(*args)``, or the result of the call already running for ``key``.
+
+        Args:
+            key: The deduplication key.
+            fn: The function to call.
+            *args: Arguments passed to ``fn``.
+
+        Returns:
+            The result of ``fn``.
+
+        Raises:
+            Exception: Whatever ``fn`` raised, in every waiting thread.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+
+            if call is None:
+                call = self._calls[key] = Future()
+            else:
+                self.shared += 1
+
+        if not leader:
+            return call.result()
+
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def __len__(self) -> int:
+        """Return the number of calls in flight."""
+        return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """Run at most one coroutine per key at a time on an event loop.
+
+    The asyncio counterpart of ``SingleFlight``. A waiter that is cancelled,
+    for example because its client disconnected, does not cancel the shared
+    call for the others.
+
+    Attributes:
+        shared: Number of calls answered by another coroutine's call.
+    """
+
+    def __init__(self) -> None:
+        """Initialize with no calls in flight."""
+        self.shared = 0
+        self._calls: 'Dict[Hashable, asyncio.Future[Any]]' = {}
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args: Any) -> Any:
+        """Return ``await fn(*args)``, or the result of the call already running for ``key``.
+
+        Args:
+            key: The deduplication key.
+            fn: The coroutine function to call.
+            *args: Arguments passed to ``fn``.
+
+        Returns:
+            The result of ``fn``.
+
+        Raises:
+            Exception: Whatever ``fn`` raised, in every waiting coroutine.
+        """
+        # Deferred import: only the ASGI app uses this class, and asyncio is
+        # a noticeable share of the Flask app's cold start.
+        import asyncio
+
+        call = self._calls.get(key)
+
+        if call is None:
+            call = self._calls[key] = asyncio.ensure_future(fn(*args))
+            call.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.shared += 1
+
+        return await asyncio.shield(call)
+
+    def __len__(self) -> int:
+        """Return the number of calls in flight."""
+        return len(self._calls)
@@ -3,19 +3,430 @@
 Wraps the GitHub REST API endpoints needed to validate a user's OAuth
 token, scopes, email addresses, organization memberships and team
 memberships.
+
+All clients share one pooled ``requests.Session`` so that connections to
+api.github.com are kept alive and reused across requests and threads, and
+one ``ResponseCache`` so that repeat calls are sent as conditional requests
+that GitHub can answer with HTTP 304. A ``RateLimiter`` tracks GitHub's
+rate-limit headers per token so that throttled tokens back off instead of
+being treated as invalid credentials.
 """
 
-from typing import Any, Dict, List, Mapping, Optional
+import json
+import re
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
+from http.cookiejar import DefaultCookiePolicy
+from typing import Any, Callable, Dict, Generator, Iterable, List, Mapping, NamedTuple, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
 
+import metrics
+from cache import ResponseCache, TTLCache, hash_token
 
-class GithubAuth:
-    """Authenticated client for the GitHub REST API.
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 32
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 10.0
+DEFAULT_RESPONSE_CACHE_TTL = 3600
+DEFAULT_RESPONSE_CACHE_MAX_ENTRIES = 5000
+DEFAULT_RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_RATE_LIMIT_MAX_RETRIES = 2
+DEFAULT_RATE_LIMIT_MAX_RETRY_WAIT = 5.0
+DEFAULT_RATE_LIMIT_MAX_ENTRIES = 10000
+# GitHub's primary rate limit resets hourly
+RATE_LIMIT_STATE_TTL = 3600
+# GitHub asks clients to wait at least a minute after a secondary rate limit
+# response that carries no Retry-After or reset header
+SECONDARY_RATE_LIMIT_DELAY = 60.0
+RETRY_BACKOFF = 1.0
+DEFAULT_API_URL = 'https://api.github.com'
+# GitHub's maximum page size for list endpoints
+PER_PAGE = 100
+DEFAULT_PAGE_WORKERS = 8
+LAST_PAGE_PATTERN = re.compile(r'<[^>]*[?&]page=(\d+)[^>]*>;\s*rel="last"')
+# Organization and team names in API paths, replaced by placeholders in
+# metric labels so the number of series does not grow with the organization
+ORG_SEGMENT_PATTERN = re.compile(r'/orgs/[^/]+')
+TEAM_SEGMENT_PATTERN = re.compile(r'/teams/[^/]+')
+
+GraphqlProfile = Tuple[Dict[str, Any], List[Dict[str, Any]], List[str]]
+
+# The viewer's login is needed to filter team memberships, so organizations
+# and teams cannot be fetched in the same query
+GRAPHQL_PROFILE_QUERY = """
+query($orgCursor: String) {
+  viewer {
+    login
+    name
+    organizations(first: 100, after: $orgCursor) {
+      nodes { login }
+      pageInfo { hasNextPage endCursor }
+    }
+  }
+}
+"""
+
+# The REST API lists members of child teams as members of the parent team,
+# unlike ``/user/teams``; only GraphQL can list a team's direct members
+GRAPHQL_TEAM_MEMBERS_QUERY = """
+query($org: String!, $team: String!, $memberCursor: String) {
+  organization(login: $org) {
+    team(slug: $team) {
+      members(first: 100, after: $memberCursor, membership: IMMEDIATE) {
+        nodes { login }
+        pageInfo { hasNextPage endCursor }
+      }
+    }
+  }
+}
+"""
+
+GRAPHQL_TEAMS_QUERY = """
+query($org: String!, $login: String!, $teamCursor: String) {
+  organization(login: $org) {
+    teams(first: 100, after: $teamCursor, userLogins: [$login]) {
+      nodes { slug }
+      pageInfo { hasNextPage endCursor }
+    }
+  }
+}
+"""
+
+
+# The response headers replayed when GitHub answers HTTP 304
+CACHED_RESPONSE_HEADERS = ('ETag', 'Link', 'X-OAuth-Scopes')
+
+
+class CachedResponse(NamedTuple):
+    """The parts of a GitHub response kept in the ETag cache.
+
+    The response itself is not cached: it refers to its request, whose
+    headers hold the user's token.
+
+    Attributes:
+        status_code: Always ``200``.
+        headers: The ``CACHED_RESPONSE_HEADERS`` the response had.
+        content: The response body.
+    """
+
+    status_code: int
+    headers: Dict[str, str]
+    content: bytes
+
+    @classmethod
+    def from_response(cls, r: Any) -> 'CachedResponse':
+        """Return the cacheable parts of a ``requests`` or ``httpx`` response."""
+        headers = {name: r.headers[name] for name in CACHED_RESPONSE_HEADERS if name in r.headers}
+        return cls(r.status_code, headers, r.content)
+
+    def json(self) -> Any:
+        """Return the decoded JSON body."""
+        return json.loads(self.content)
+
+
+class RateLimitError(Exception):
+    """Raised when GitHub throttles a token, as opposed to rejecting it.
+
+    Attributes:
+        retry_after: Seconds until the token may call GitHub again.
+    """
+
+    def __init__(self, message: str, retry_after: float) -> None:
+        """Initialize the error.
+
+        Args:
+            message: The error message.
+            retry_after: Seconds until the token may call GitHub again.
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class NotFoundError(RuntimeError):
+    """Raised when GitHub answers HTTP 404.
+
+    It is a ``RuntimeError`` like any other unexpected status, so only
+    callers that expect a 404 need to tell it apart.
+    """
+
+
+class RateLimiter:
+    """Per-token view of GitHub's rate limits.
+
+    Attributes:
+        max_retries: How many times a rate-limited request is retried.
+        max_retry_wait: The longest delay, in seconds, worth waiting for a
+            retry; longer delays fail fast with ``RateLimitError``.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = DEFAULT_RATE_LIMIT_MAX_RETRIES,
+        max_retry_wait: float = DEFAULT_RATE_LIMIT_MAX_RETRY_WAIT,
+        max_entries: int = DEFAULT_RATE_LIMIT_MAX_ENTRIES,
+    ) -> None:
+        """Initialize the limiter with no known token state.
+
+        Args:
+            max_retries: How many times a rate-limited request is retried.
+            max_retry_wait: The longest delay worth waiting for a retry.
+            max_entries: Maximum number of tokens to track.
+        """
+        self.max_retries = max_retries
+        self.max_retry_wait = max_retry_wait
+        self._state = TTLCache(ttl=RATE_LIMIT_STATE_TTL, max_entries=max_entries)
+
+    def _get_state(self, token_hash: str) -> Dict[str, float]:
+        """Return the tracked state for a token, or an empty state."""
+        return self._state.get(token_hash) or {}
+
+    def update(self, token_hash: str, headers: Mapping[str, str]) -> None:
+        """Record the ``X-RateLimit-*`` headers from a GitHub response.
+
+        Args:
+            token_hash: Hash of the token that made the request.
+            headers: The response headers.
+        """
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset = headers.get('X-RateLimit-Reset')
+
+        if remaining is None or reset is None:
+            return
+
+        state = dict(self._get_state(token_hash))
+        state['remaining'] = int(remaining)
+        state['reset'] = float(reset)
+        self._state.set(token_hash, state)
+
+    def block(self, token_hash: str, delay: float) -> None:
+        """Stop a token from calling GitHub for ``delay`` seconds.
+
+        Args:
+            token_hash: Hash of the throttled token.
+            delay: Seconds to wait before the next call.
+        """
+        state = dict(self._get_state(token_hash))
+        state['blocked_until'] = time.time() + delay
+        self._state.set(token_hash, state)
+
+    def remaining(self, token_hash: str) -> Optional[int]:
+        """Return the last seen remaining request count for a token.
+
+        Args:
+            token_hash: Hash of the token.
+
+        Returns:
+            The remaining request count, or ``None`` if it is not known.
+        """
+        remaining = self._get_state(token_hash).get('remaining')
+        return None if remaining is None else int(remaining)
+
+    def retry_after(self, token_hash: str) -> float:
+        """Return how long a token must wait before calling GitHub again.
+
+        Args:
+            token_hash: Hash of the token.
+
+        Returns:
+            The delay in seconds, or ``0`` if the token may call GitHub now.
+        """
+        state = self._get_state(token_hash)
+        now = time.time()
+        delay = state.get('blocked_until', now) - now
+
+        if state.get('remaining') == 0:
+            delay = max(delay, state['reset'] - now)
+
+        return max(delay, 0.0)
+
+    def clear(self) -> None:
+        """Forget the state of every token."""
+        self._state.clear()
+
+
+def _error_message(r: Any) -> str:
+    """Return the ``message`` field from a GitHub error response."""
+    try:
+        return r.json().get('message', 'unknown error')
+    except ValueError:
+        return 'non-JSON response'
+
+
+def endpoint_template(endpoint: str) -> str:
+    """Return an API path with its organization and team names replaced.
+
+    Args:
+        endpoint: The API path, for example ``/orgs/acme/teams/ops/members``.
+
+    Returns:
+        The path template, for example ``/orgs/:org/teams/:team/members``.
+    """
+    endpoint = ORG_SEGMENT_PATTERN.sub('/orgs/:org', endpoint)
+    return TEAM_SEGMENT_PATTERN.sub('/teams/:team', endpoint)
+
+
+def get_rate_limit_delay(r: Any) -> Optional[float]:
+    """Return how long to wait if a response is a rate-limit rejection.
+
+    GitHub answers both primary and secondary rate limits with HTTP 403 or
+    429. They are told apart from authorization failures by ``Retry-After``,
+    an exhausted ``X-RateLimit-Remaining``, or a rate-limit error message.
+
+    Args:
+        r: The GitHub response, from ``requests`` or ``httpx``.
+
+    Returns:
+        The delay in seconds, or ``None`` if the response is not rate limited.
+    """
+    if r.status_code not in (403, 429):
+        return None
+
+    if 'Retry-After' in r.headers:
+        try:
+            return float(r.headers['Retry-After'])
+        except ValueError:
+            return SECONDARY_RATE_LIMIT_DELAY
+
+    if r.headers.get('X-RateLimit-Remaining') == '0':
+        return max(float(r.headers.get('X-RateLimit-Reset', 0)) - time.time(), 0.0)
+
+    if r.status_code == 429 or 'rate limit' in _error_message(r).lower():
+        return SECONDARY_RATE_LIMIT_DELAY
+
+    return None
+
+
+def create_session(
+    pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+    pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+) -> requests.Session:
+    """Create a keep-alive HTTP session for the GitHub API.
+
+    Cookies are never stored, because the session is shared by every user's
+    requests.
+
+    Args:
+        pool_connections: Number of per-host connection pools to keep.
+        pool_maxsize: Maximum number of connections kept open per host.
+
+    Returns:
+        The configured session.
+    """
+    http_session = requests.Session()
+    http_session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    http_session.mount('https://', adapter)
+    http_session.mount('http://', adapter)
+    return http_session
+
+
+def configure_http(config: Optional[Dict[str, Any]]) -> None:
+    """Rebuild the shared session and timeouts from ``github.http`` settings.
+
+    Also sets the API base URL from ``github.api_url``, for GitHub
+    Enterprise Server or a local stand-in used for benchmarks.
+
+    Args:
+        config: The loaded configuration, or ``None``.
+    """
+    global api_url, session, timeout
+
+    settings: Dict[str, Any] = {}
+    if config and 'github' in config and 'http' in config['github']:
+        settings = config['github']['http'] or {}
+
+    api_url = DEFAULT_API_URL
+    if config and 'github' in config and 'api_url' in config['github']:
+        api_url = config['github']['api_url'].rstrip('/')
+
+    session = create_session(
+        pool_connections=settings.get('pool_connections', DEFAULT_POOL_CONNECTIONS),
+        pool_maxsize=settings.get('pool_maxsize', DEFAULT_POOL_MAXSIZE),
+    )
+    timeout = (
+        settings.get('connect_timeout', DEFAULT_CONNECT_TIMEOUT),
+        settings.get('read_timeout', DEFAULT_READ_TIMEOUT),
+    )
+
+
+def prewarm() -> None:
+    """Open a pooled connection to the GitHub API ahead of the first login.
+
+    Requests ``/rate_limit``, which does not count against the rate limit,
+    so that the first ``/info`` call reuses a connection that has already
+    done its TCP and TLS handshakes.
+
+    Raises:
+        requests.RequestException: If GitHub cannot be reached.
+    """
+    session.get(f'{api_url}/rate_limit', timeout=timeout).close()
+
+
+def configure_response_cache(config: Optional[Dict[str, Any]]) -> None:
+    """Rebuild the shared ETag response cache from ``cache.etag`` settings.
+
+    Args:
+        config: The loaded configuration, or ``None``.
+    """
+    global response_cache
+
+    settings: Dict[str, Any] = {}
+    if config and 'cache' in config and 'etag' in (config['cache'] or {}):
+        settings = config['cache']['etag'] or {}
+
+    response_cache = ResponseCache(
+        ttl=settings.get('ttl', DEFAULT_RESPONSE_CACHE_TTL),
+        max_entries=settings.get('max_entries', DEFAULT_RESPONSE_CACHE_MAX_ENTRIES),
+        max_bytes=settings.get('max_bytes', DEFAULT_RESPONSE_CACHE_MAX_BYTES),
+    )
+
+
+def configure_rate_limit(config: Optional[Dict[str, Any]]) -> None:
+    """Rebuild the shared rate limiter from ``github.rate_limit`` settings.
+
+    Args:
+        config: The loaded configuration, or ``None``.
+    """
+    global rate_limiter
+
+    settings: Dict[str, Any] = {}
+    if config and 'github' in config and 'rate_limit' in config['github']:
+        settings = config['github']['rate_limit'] or {}
+
+    rate_limiter = RateLimiter(
+        max_retries=settings.get('max_retries', DEFAULT_RATE_LIMIT_MAX_RETRIES),
+        max_retry_wait=settings.get('max_retry_wait', DEFAULT_RATE_LIMIT_MAX_RETRY_WAIT),
+    )
+
+
+api_url: str = DEFAULT_API_URL
+session: requests.Session = create_session()
+timeout: Tuple[float, float] = (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)
+response_cache = ResponseCache(
+    DEFAULT_RESPONSE_CACHE_TTL, DEFAULT_RESPONSE_CACHE_MAX_ENTRIES, DEFAULT_RESPONSE_CACHE_MAX_BYTES
+)
+rate_limiter = RateLimiter()
+# Pages are fetched from their own pool: page requests never submit further
+# work, so they cannot deadlock callers that already run in a worker thread
+page_executor = ThreadPoolExecutor(max_workers=DEFAULT_PAGE_WORKERS, thread_name_prefix='github-pages')
+
+
+class GithubAuthBase:
+    """Request preparation and response handling shared by GitHub clients.
+
+    Holds everything that does not perform I/O, so that the blocking
+    ``GithubAuth`` and the asyncio ``AsyncGithubAuth`` apply the same
+    caching, rate limiting, scope and team rules.
 
     Attributes:
         required_scopes: OAuth scopes the proxy requires before granting access.
         headers: HTTP headers sent with every request, including the bearer token.
+        token_hash: Hash of the access token, used to key cached responses.
+        scope_headers: Headers of the latest response that reported the
+            token's OAuth scopes, or ``None`` before any such response.
     """
 
     def __init__(self, access_token: str) -> None:
@@ -33,49 +444,526 @@ class GithubAuth:
         self.headers: Dict[str, str] = {
             'Authorization': f'Bearer {access_token}'
         }
+        self.token_hash = hash_token(access_token)
+        self.scope_headers: Optional[Mapping[str, str]] = None
 
-    def _request(
+    def _remember_scopes(self, headers: Mapping[str, str]) -> None:
+        """Keep response headers that report the token's OAuth scopes.
+
+        GitHub sends ``X-OAuth-Scopes`` with every authenticated response, so
+        the scopes can be validated without a separate request.
+        """
+        if 'X-OAuth-Scopes' in headers:
+            self.scope_headers = headers
+
+    def _prepare_request(
         self,
         endpoint: str,
-        params: Optional[Dict[str, Any]] = None,
-    ) -> requests.Response:
-        """Perform a GET request against the GitHub API.
+        params: Optional[Dict[str, Any]],
+    ) -> Tuple[str, Tuple[Any, ...], Any, Dict[str, str]]:
+        """Return the URL, cache key, cached response and headers for a GET.
+
+        Raises:
+            RateLimitError: If the token is held back by the rate limiter.
+        """
+        url = self._url(endpoint)
+        cache_key = self._cache_key(endpoint, params)
+        cached = response_cache.get(cache_key)
+        headers = self.headers
+
+        if cached is not None:
+            headers = {**self.headers, 'If-None-Match': cached.headers['ETag']}
+
+        self._check_rate_limit()
+        return url, cache_key, cached, headers
+
+    def _cache_key(self, endpoint: str, params: Optional[Dict[str, Any]]) -> Tuple[Any, ...]:
+        """Return the response cache key of a GET for this token."""
+        return (self.token_hash, endpoint, tuple(sorted((params or {}).items())))
+
+    @staticmethod
+    def _url(endpoint: str) -> str:
+        """Return the URL of a GitHub API path."""
+        return f'{api_url}{endpoint}'
+
+    @staticmethod
+    def _observe(endpoint: str, r: Any, started: float) -> None:
+        """Record a response's latency, status and remaining rate limit.
 
         Args:
-            endpoint: The API path (for example ``/user``).
-            params: Optional query string parameters.
+            endpoint: The API path, without query parameters. Organization
+                and team names are recorded as ``:org`` and ``:team``.
+            r: The response.
+            started: ``time.perf_counter()`` when the request was sent.
+        """
+        metrics.observe_github_request(
+            endpoint_template(endpoint), r.status_code, time.perf_counter() - started,
+            r.headers.get('X-RateLimit-Remaining'),
+        )
+
+    def _check_rate_limit(self) -> None:
+        """Raise if the rate limiter is holding this token back.
+
+        Raises:
+            RateLimitError: If the token may not call GitHub yet.
+        """
+        delay = rate_limiter.retry_after(self.token_hash)
+        if delay > 0:
+            raise RateLimitError(f'ERROR: Rate limited: retry after {delay:.0f}s', delay)
+
+    def _get_retry_delay(self, r: Any, attempt: int) -> Optional[float]:
+        """Record a response's rate-limit state and decide whether to retry.
 
         Returns:
-            The response, when the request succeeds with HTTP 200.
+            Seconds to sleep before retrying, or ``None`` if the response is
+            not a rate-limit rejection.
 
         Raises:
-            PermissionError: If GitHub returns HTTP 401 or 403.
-            RuntimeError: If GitHub returns any other non-200 status.
+            RateLimitError: If the request should not be retried.
         """
-        url = f'https://api.github.com{endpoint}'
+        rate_limiter.update(self.token_hash, r.headers)
+        retry_delay = get_rate_limit_delay(r)
+
+        if retry_delay is None:
+            return None
+
+        if attempt >= rate_limiter.max_retries or retry_delay > rate_limiter.max_retry_wait:
+            rate_limiter.block(self.token_hash, retry_delay)
+            raise RateLimitError(
+                f'ERROR: Rate limited: retry after {retry_delay:.0f}s ({_error_message(r)})', retry_delay
+            )
 
-        if params:
-            r = requests.get(url, headers=self.headers, params=params)
-        else:
-            r = requests.get(url, headers=self.headers)
+        return max(retry_delay, RETRY_BACKOFF * 2 ** attempt)
+
+    def _handle_response(self, r: Any, cache_key: Optional[Tuple[Any, ...]], cached: Any) -> Any:
+        """Return the usable response for a request, or raise for its status.
+
+        Responses are only cached when ``cache_key`` is given.
+
+        Raises:
+            PermissionError: If GitHub returns HTTP 401 or 403, or an error
+                status for a token that lacks a required scope.
+            RuntimeError: If GitHub returns any other non-200 status.
+        """
+        if r.status_code == 304 and cached is not None:
+            response_cache.record_not_modified()
+            self._remember_scopes(cached.headers)
+            self._remember_scopes(r.headers)
+            return cached
 
         if r.status_code == 200:
+            self._remember_scopes(r.headers)
+            if cache_key is not None and 'ETag' in r.headers:
+                response_cache.set(cache_key, CachedResponse.from_response(r))
             return r
 
+        # GitHub answers some endpoints with 404 when the token lacks the
+        # scope they need, possibly before any other response has reported
+        # the scopes; report the missing scope so the login is denied
+        self._remember_scopes(r.headers)
+        if 'X-OAuth-Scopes' in r.headers:
+            self._check_scopes(self._parse_scopes(r.headers))
+
         if r.status_code in (401, 403):
-            try:
-                message = r.json().get('message', 'unknown error')
-            except ValueError:
-                message = 'non-JSON response'
+            message = _error_message(r)
 
             if r.status_code == 401:
                 # Authenticating with invalid credentials
                 raise PermissionError(f'ERROR: Unauthorized: ({message})')
-            # Too many invalid credentials within a short period of time
+            # Too many invalid credentials within a short period of time, or
+            # the token is not allowed to access the resource
             raise PermissionError(f'ERROR: Forbidden: ({message})')
 
+        if r.status_code == 404:
+            raise NotFoundError(f'ERROR: {r.status_code}')
+
         raise RuntimeError(f'ERROR: {r.status_code}')
 
+    @staticmethod
+    def _parse_scopes(headers: Mapping[str, str]) -> List[str]:
+        """Return the granted scopes listed in ``X-OAuth-Scopes``.
+
+        Raises:
+            PermissionError: If the ``X-OAuth-Scopes`` header is missing.
+        """
+        if 'X-OAuth-Scopes' not in headers:
+            raise PermissionError('X-OAuth-Scopes header not found in Github response')
+
+        scopes = headers['X-OAuth-Scopes']
+        scopes = scopes.replace(' ', '')
+        return scopes.split(',')
+
+    def _check_scopes(self, granted_scopes: List[str]) -> None:
+        """Raise if any required scope is missing from ``granted_scopes``.
+
+        Raises:
+            PermissionError: If one or more required scopes are missing.
+        """
+        missing_scopes = []
+
+        for required_scope in self.required_scopes:
+            if required_scope not in granted_scopes:
+                missing_scopes.append(required_scope)
+
+        if missing_scopes:
+            separator = "' or '"
+            raise PermissionError(
+                f"Token does not have permission for '{separator.join(missing_scopes)}' scope(s)"
+            )
+
+    @staticmethod
+    def _get_required_org(config: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Return ``github.required.org`` from the configuration, if set."""
+        if not config \
+                or 'github' not in config \
+                or 'required' not in config['github'] \
+                or 'org' not in config['github']['required']:
+            return None
+
+        return config['github']['required']['org']
+
+    @staticmethod
+    def _get_required_email_domain(config: Optional[Dict[str, Any]]) -> Optional[str]:
+        """Return ``github.required.email.domain`` from the configuration, if set."""
+        if not config \
+                or 'github' not in config \
+                or 'required' not in config['github'] \
+                or 'domain' not in (config['github']['required'].get('email') or {}):
+            return None
+
+        return config['github']['required']['email']['domain']
+
+    @classmethod
+    def _found_required_org(cls, config: Optional[Dict[str, Any]]) -> Optional[Callable[[List[Any]], bool]]:
+        """Return a check for whether a list of organizations includes the required one.
+
+        Returns:
+            The check, or ``None`` when no organization is required and the
+            whole list is needed.
+        """
+        org = cls._get_required_org(config)
+
+        if org is None:
+            return None
+
+        return lambda orgs: any((item.get('login') or '').lower() == org.lower() for item in orgs)
+
+    @classmethod
+    def _found_required_emails(cls, config: Optional[Dict[str, Any]]) -> Callable[[List[Any]], bool]:
+        """Return a check for whether a list of emails has everything ``/info`` reads.
+
+        That is the primary email, which goes into the profile, and an email
+        in the required domain, if there is one.
+        """
+        domain = cls._get_required_email_domain(config)
+
+        def found(emails: List[Any]) -> bool:
+            if not any(item.get('primary') for item in emails):
+                return False
+
+            return domain is None or any(
+                (item.get('email') or '').partition('@')[2].lower() == domain.lower() for item in emails
+            )
+
+        return found
+
+    @staticmethod
+    def _get_graphql_data(payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the ``data`` of a GraphQL response.
+
+        Raises:
+            RuntimeError: If the query returned no data at all.
+        """
+        data = payload.get('data')
+
+        if data is None:
+            messages = '; '.join(error.get('message', 'unknown error') for error in payload.get('errors', []))
+            raise RuntimeError(f'ERROR: GraphQL: {messages}')
+
+        return data
+
+    def _graphql_profile_queries(
+        self,
+        config: Optional[Dict[str, Any]],
+    ) -> Generator[Tuple[str, Dict[str, Any]], Dict[str, Any], GraphqlProfile]:
+        """Yield the GraphQL queries that build a profile, one page at a time.
+
+        Each yielded ``(query, variables)`` pair is answered by sending back
+        the query's ``data``, so that blocking and asyncio clients can share
+        the paging logic. The generator returns the same tuple as
+        ``get_graphql_profile``.
+        """
+        orgs: List[Dict[str, Any]] = []
+        org_cursor: Optional[str] = None
+        found_required_org = self._found_required_org(config)
+
+        while True:
+            viewer = (yield GRAPHQL_PROFILE_QUERY, {'orgCursor': org_cursor})['viewer']
+            connection = viewer['organizations']
+            orgs.extend({'login': node['login']} for node in connection['nodes'])
+            org_cursor = self._next_cursor(connection)
+
+            # Stop at the same point as ``get_org_list`` does
+            if org_cursor is None or (found_required_org is not None and found_required_org(orgs)):
+                break
+
+        info = {'login': viewer['login'], 'name': viewer['name']}
+        teams: List[str] = []
+        required_org = self._get_required_org(config)
+        team_cursor: Optional[str] = None
+
+        while required_org is not None:
+            organization = (yield GRAPHQL_TEAMS_QUERY, {
+                'org': required_org,
+                'login': viewer['login'],
+                'teamCursor': team_cursor,
+            })['organization']
+
+            # The organization does not exist or is not visible to the user
+            if organization is None:
+                break
+
+            teams.extend(node['slug'] for node in organization['teams']['nodes'])
+            team_cursor = self._next_cursor(organization['teams'])
+
+            if team_cursor is None:
+                break
+
+        return info, orgs, teams
+
+    @staticmethod
+    def _next_cursor(connection: Dict[str, Any]) -> Optional[str]:
+        """Return the cursor of the next page of a GraphQL connection, if any."""
+        page_info = connection['pageInfo']
+        return page_info['endCursor'] if page_info['hasNextPage'] else None
+
+    @staticmethod
+    def _page_params(page: int) -> Dict[str, int]:
+        """Return the query parameters for one page of a list endpoint."""
+        return {'page': page, 'per_page': PER_PAGE}
+
+    @staticmethod
+    def _last_page(r: Any) -> int:
+        """Return the number of pages of a list, from its ``Link`` header.
+
+        GitHub only sends ``rel="last"`` when there is more than one page.
+        """
+        match = LAST_PAGE_PATTERN.search(r.headers.get('Link', ''))
+        return int(match.group(1)) if match else 1
+
+    @staticmethod
+    def _filter_teams(page_teams: Iterable[Any], org: str) -> Generator[str, None, None]:
+        """Yield the slugs of the teams on a page that belong to ``org``."""
+        org = org.lower()
+
+        for team in page_teams:
+            if (team.get('organization') or {}).get('login', '').lower() == org:
+                yield team.get('slug')
+
+
+class GithubAuth(GithubAuthBase):
+    """Authenticated client for the GitHub REST API.
+
+    Attributes:
+        required_scopes: OAuth scopes the proxy requires before granting access.
+        headers: HTTP headers sent with every request, including the bearer token.
+        token_hash: Hash of the access token, used to key cached responses.
+        scope_headers: Headers of the latest response that reported the
+            token's OAuth scopes, or ``None`` before any such response.
+        cancelled: Once set, no further request is sent with this client.
+            A request already in flight still completes.
+    """
+
+    def __init__(self, access_token: str) -> None:
+        """Initialize the client with an OAuth access token.
+
+        Args:
+            access_token: The GitHub OAuth access token.
+
+        Raises:
+            PermissionError: If ``access_token`` is empty.
+        """
+        super().__init__(access_token)
+        self.cancelled = threading.Event()
+
+    def _request(
+        self,
+        endpoint: str,
+        params: Optional[Dict[str, Any]] = None,
+    ) -> Any:
+        """Perform a GET request against the GitHub API.
+
+        Responses carrying an ``ETag`` are cached per token and endpoint, and
+        later requests send ``If-None-Match`` so that GitHub can answer with
+        HTTP 304, which does not count against the rate limit. The cached
+        response is then returned in place of the empty 304 body.
+
+        Rate-limit rejections are retried after the delay GitHub asks for,
+        as long as it is short. Otherwise the token is held back until the
+        limit resets and ``RateLimitError`` is raised without calling GitHub.
+
+        Args:
+            endpoint: The API path (for example ``/user``).
+            params: Optional query string parameters.
+
+        Returns:
+            The response, when the request succeeds with HTTP 200, or the
+            cached one when GitHub answers HTTP 304.
+
+        Raises:
+            CancelledError: If ``cancelled`` is set.
+            PermissionError: If GitHub returns HTTP 401 or 403.
+            RateLimitError: If the token is rate limited.
+            RuntimeError: If GitHub returns any other non-200 status.
+        """
+        url, cache_key, cached, headers = self._prepare_request(endpoint, params)
+        attempt = 0
+
+        while True:
+            if self.cancelled.is_set():
+                raise CancelledError(f'Request to {endpoint} cancelled')
+
+            started = time.perf_counter()
+            r = session.get(url, headers=headers, params=params, timeout=timeout)
+            self._observe(endpoint, r, started)
+            retry_delay = self._get_retry_delay(r, attempt)
+
+            if retry_delay is None:
+                break
+
+            time.sleep(retry_delay)
+            attempt += 1
+
+        return self._handle_response(r, cache_key, cached)
+
+    def _get_page(self, endpoint: str, page: int, select: Callable[[List[Any]], List[Any]]) -> List[Any]:
+        """Return the selected items of one page of a list endpoint."""
+        return select(self._request(endpoint, params=self._page_params(page)).json())
+
+    def _get_pages(
+        self,
+        endpoint: str,
+        select: Callable[[List[Any]], List[Any]] = list,
+        done: Optional[Callable[[List[Any]], bool]] = None,
+    ) -> List[Any]:
+        """Return the selected items of every page of a list endpoint.
+
+        The first page's ``Link: rel="last"`` header tells how many pages
+        there are, and the remaining pages are then fetched concurrently.
+        Each page is decoded with a single ``json.loads`` and passed through
+        ``select`` as soon as it arrives, so only the selected items of a
+        page outlive it.
+
+        When ``done`` is given, it is called with the items received so far
+        after each page, and once it returns ``True`` the remaining pages are
+        cancelled or ignored. The common case then needs a single request.
+        Pages not yet requested are skipped as well once ``cancelled`` is set.
+
+        Args:
+            endpoint: The API path (for example ``/user/teams``).
+            select: Returns the items to keep from a page.
+            done: Optional check for whether enough items have been received.
+
+        Returns:
+            The selected items, in page order.
+
+        Raises:
+            PermissionError: If GitHub returns HTTP 401 or 403.
+            RateLimitError: If the token is rate limited.
+            RuntimeError: If GitHub returns any other non-200 status.
+        """
+        r = self._request(endpoint, params=self._page_params(1))
+        pages = {1: select(r.json())}
+
+        if done is not None and done(pages[1]):
+            return pages[1]
+
+        futures = {
+            page_executor.submit(self._get_page, endpoint, page, select): page
+            for page in range(2, self._last_page(r) + 1)
+        }
+
+        try:
+            for future in as_completed(futures):
+                pages[futures[future]] = future.result()
+
+                if done is not None and done([item for items in pages.values() for item in items]):
+                    break
+        finally:
+            for future in futures:
+                future.cancel()
+
+        return [item for page in sorted(pages) for item in pages[page]]
+
+    def _graphql(self, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+        """Run a GraphQL query against the GitHub API.
+
+        Args:
+            query: The GraphQL query.
+            variables: The query variables.
+
+        Returns:
+            The ``data`` of the response.
+
+        Raises:
+            PermissionError: If GitHub returns HTTP 401 or 403.
+            RateLimitError: If the token is rate limited.
+            RuntimeError: If GitHub returns any other non-200 status, or the
+                query returns no data.
+        """
+        self._check_rate_limit()
+        attempt = 0
+
+        while True:
+            started = time.perf_counter()
+            r = session.post(
+                self._url('/graphql'),
+                headers=self.headers,
+                json={'query': query, 'variables': variables},
+                timeout=timeout
+            )
+            self._observe('/graphql', r, started)
+            retry_delay = self._get_retry_delay(r, attempt)
+
+            if retry_delay is None:
+                break
+
+            time.sleep(retry_delay)
+            attempt += 1
+
+        return self._get_graphql_data(self._handle_response(r, None, None).json())
+
+    def get_graphql_profile(self, config: Optional[Dict[str, Any]]) -> GraphqlProfile:
+        """Return the profile, organizations and teams using GraphQL.
+
+        Produces the same data as ``get_user_info``, ``get_org_list`` and
+        ``get_user_teams`` with one query per 100 organizations plus one per
+        100 teams in ``github.required.org``, instead of one REST call per
+        endpoint and page. Like ``get_org_list``, organizations stop being
+        paged once the required one has been seen. Email addresses are not available through GraphQL
+        and still come from ``get_email_addresses``.
+
+        Args:
+            config: The loaded configuration, or ``None``.
+
+        Returns:
+            The user's ``login`` and ``name``, their organizations as
+            ``{'login': ...}`` entries, and their team slugs in the required
+            organization.
+
+        Raises:
+            PermissionError: If GitHub returns HTTP 401 or 403.
+            RuntimeError: If GitHub returns any other non-200 status.
+        """
+        queries = self._graphql_profile_queries(config)
+        query = next(queries)
+
+        while True:
+            try:
+                query = queries.send(self._graphql(*query))
+            except StopIteration as done:
+                return done.value
+
     def get_headers(self) -> Mapping[str, str]:
         """Return the headers from a request to the GitHub API root.
 
@@ -85,10 +973,13 @@ class GithubAuth:
         Raises:
             PermissionError: If GitHub does not return HTTP 200.
         """
-        r = requests.get(
-            'https://api.github.com',
-            headers=self.headers
+        started = time.perf_counter()
+        r = session.get(
+            self._url(''),
+            headers=self.headers,
+            timeout=timeout
         )
+        self._observe('/', r, started)
 
         if r.status_code != 200:
             raise PermissionError(f'Github returned HTTP status: {r.status_code}')
@@ -98,20 +989,17 @@ class GithubAuth:
     def get_scopes(self) -> List[str]:
         """Return the OAuth scopes granted to the current token.
 
+        The scopes are read from a response this client has already received
+        when possible, and only otherwise from a request to the API root.
+
         Returns:
             A list of granted scope names.
 
         Raises:
             PermissionError: If the ``X-OAuth-Scopes`` header is missing.
         """
-        headers = self.get_headers()
-
-        if 'X-OAuth-Scopes' not in headers:
-            raise PermissionError('X-OAuth-Scopes header not found in Github response')
-
-        scopes = headers['X-OAuth-Scopes']
-        scopes = scopes.replace(' ', '')
-        return scopes.split(',')
+        headers = self.scope_headers if self.scope_headers is not None else self.get_headers()
+        return self._parse_scopes(headers)
 
     def validate_scopes(self) -> None:
         """Ensure the token grants every required OAuth scope.
@@ -119,18 +1007,7 @@ class GithubAuth:
         Raises:
             PermissionError: If one or more required scopes are missing.
         """
-        missing_scopes = []
-        granted_scopes = self.get_scopes()
-
-        for required_scope in self.required_scopes:
-            if required_scope not in granted_scopes:
-                missing_scopes.append(required_scope)
-
-        if missing_scopes:
-            separator = "' or '"
-            raise PermissionError(
-                f"Token does not have permission for '{separator.join(missing_scopes)}' scope(s)"
-            )
+        self._check_scopes(self.get_scopes())
 
     def call_github_api_endpoint(self, endpoint: str) -> Any:
         """Return the JSON payload from a GitHub API endpoint.
@@ -148,21 +1025,69 @@ class GithubAuth:
         r = self._request(endpoint)
         return r.json()
 
-    def get_email_addresses(self) -> Any:
+    def get_email_addresses(self, config: Optional[Dict[str, Any]] = None) -> List[Any]:
         """Return the email addresses associated with the account.
 
+        Pages are fetched until the primary email and, if
+        ``github.required.email.domain`` is set, an email in that domain have
+        been seen.
+
+        Args:
+            config: The loaded configuration, or ``None``.
+
         Returns:
-            The decoded ``/user/emails`` response.
+            The ``/user/emails`` entries.
+
+        Raises:
+            PermissionError: If GitHub returns HTTP 401 or 403.
+            RateLimitError: If the token is rate limited.
+            RuntimeError: If GitHub returns any other non-200 status.
         """
-        return self.call_github_api_endpoint('/user/emails')
+        return self._get_pages('/user/emails', done=self._found_required_emails(config))
 
-    def get_org_list(self) -> Any:
+    def get_org_list(self, config: Optional[Dict[str, Any]] = None) -> List[Any]:
         """Return the organizations the authenticated user belongs to.
 
+        With ``github.required.org`` set, pages are only fetched until that
+        organization has been seen; otherwise every page is returned.
+
+        Args:
+            config: The loaded configuration, or ``None``.
+
         Returns:
-            The decoded ``/user/orgs`` response.
+            The ``/user/orgs`` entries.
+
+        Raises:
+            PermissionError: If GitHub returns HTTP 401 or 403.
+            RateLimitError: If the token is rate limited.
+            RuntimeError: If GitHub returns any other non-200 status.
+        """
+        return self._get_pages('/user/orgs', done=self._found_required_org(config))
+
+    def get_org_membership(self, org: str) -> bool:
+        """Return whether the user is an active member of ``org``.
+
+        Asks ``/user/memberships/orgs/{org}`` directly, which is a single
+        small request however many organizations the user belongs to.
+
+        Args:
+            org: The organization login.
+
+        Returns:
+            ``True`` if the membership is active, ``False`` if it is pending
+            or the user is not a member.
+
+        Raises:
+            PermissionError: If GitHub returns HTTP 401 or 403.
+            RateLimitError: If the token is rate limited.
+            RuntimeError: If GitHub returns any other non-200 status.
         """
-        return self.call_github_api_endpoint('/user/orgs')
+        try:
+            membership = self._request(f'/user/memberships/orgs/{org}').json()
+        except NotFoundError:
+            return False
+
+        return membership.get('state') == 'active'
 
     def get_user_info(self) -> Any:
         """Return the authenticated user's profile.
@@ -195,29 +1120,109 @@ class GithubAuth:
             PermissionError: If GitHub returns HTTP 401 or 403.
             RuntimeError: If GitHub returns any other non-200 status.
         """
-        teams: List[str] = []
+        org = self._get_required_org(config)
 
-        if not config \
-                or 'github' not in config \
-                or 'required' not in config['github'] \
-                or 'org' not in config['github']['required']:
-            return teams
+        if org is None:
+            return []
 
-        org = config['github']['required']['org']
-        page = 1
+        return self._get_pages('/user/teams', lambda page: list(self._filter_teams(page, org)))
 
-        while True:
-            r = self._request('/user/teams', params={'page': page, 'per_page': 100})
-            page_teams = r.json()
+    def get_org_members(self, org: str) -> List[str]:
+        """Return the logins of every member of ``org``.
 
-            if not page_teams:
-                break
+        Meant for a service token syncing the organization directory, which
+        must be able to see every member, including private ones.
+
+        Args:
+            org: The organization login.
+
+        Returns:
+            The members' logins.
+
+        Raises:
+            PermissionError: If GitHub returns HTTP 401 or 403.
+            RateLimitError: If the token is rate limited.
+            RuntimeError: If GitHub returns any other non-200 status.
+        """
+        return self._get_pages(f'/orgs/{org}/members', lambda page: [member.get('login') for member in page])
+
+    def get_org_teams(self, org: str) -> Dict[str, Optional[str]]:
+        """Return the teams in ``org`` the token can see, with their parents.
+
+        Args:
+            org: The organization login.
+
+        Returns:
+            The slug of each team's parent team, or ``None`` for a top-level
+            team, by team slug.
+
+        Raises:
+            PermissionError: If GitHub returns HTTP 401 or 403.
+            RateLimitError: If the token is rate limited.
+            RuntimeError: If GitHub returns any other non-200 status.
+        """
+        teams = self._get_pages(
+            f'/orgs/{org}/teams',
+            lambda page: [(team.get('slug'), (team.get('parent') or {}).get('slug')) for team in page],
+        )
+        return dict(teams)
+
+    def get_team_members(self, org: str, team: str) -> List[str]:
+        """Return the logins of a team's members.
+
+        As GitHub lists them, members of the team's child teams are included;
+        use ``get_direct_team_members`` for a team that has child teams.
+
+        Args:
+            org: The organization login.
+            team: The team slug.
+
+        Returns:
+            The members' logins.
+
+        Raises:
+            PermissionError: If GitHub returns HTTP 401 or 403.
+            RateLimitError: If the token is rate limited.
+            RuntimeError: If GitHub returns any other non-200 status.
+        """
+        return self._get_pages(
+            f'/orgs/{org}/teams/{team}/members', lambda page: [member.get('login') for member in page]
+        )
+
+    def get_direct_team_members(self, org: str, team: str) -> List[str]:
+        """Return the logins of a team's direct members, using GraphQL.
+
+        Unlike ``get_team_members``, members who only belong to one of the
+        team's child teams are left out, as they are from ``/user/teams``.
+
+        Args:
+            org: The organization login.
+            team: The team slug.
+
+        Returns:
+            The members' logins, or an empty list if the team is not
+            visible to the token.
+
+        Raises:
+            PermissionError: If GitHub returns HTTP 401 or 403.
+            RateLimitError: If the token is rate limited.
+            RuntimeError: If GitHub returns any other non-200 status, or the
+                query returns no data.
+        """
+        logins: List[str] = []
+        cursor: Optional[str] = None
+
+        while True:
+            organization = self._graphql(
+                GRAPHQL_TEAM_MEMBERS_QUERY, {'org': org, 'team': team, 'memberCursor': cursor}
+            )['organization']
 
-            for team in page_teams:
-                org_login = (team.get('organization') or {}).get('login', '')
-                if org_login.lower() == org.lower():
-                    teams.append(team.get('slug'))
+            if organization is None or organization['team'] is None:
+                return logins
 
-            page += 1
+            members = organization['team']['members']
+            logins.extend(node['login'] for node in members['nodes'])
+            cursor = self._next_cursor(members)
 
-        return teams
+            if cursor is None:
+                return logins
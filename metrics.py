@@ -0,0 +1,235 @@
+"""Prometheus metrics for the oAuth2 proxy.
+
+Latencies and status codes are recorded as they happen; cache statistics
+are read from the caches only when ``/metrics`` is scraped, so the request
+path never pays for them.
+"""
+
+import time
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, Metric
+from prometheus_client.registry import Collector
+
+from cache import CacheBackend
+
+# GitHub usually answers in tens of milliseconds, while a full /info fan-out
+# (or a rate-limit retry) can take seconds
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+GITHUB_REQUEST_DURATION = Histogram(
+    'github_oauth_proxy_github_request_duration_seconds',
+    'Latency of GitHub API requests, by endpoint.',
+    ['endpoint'],
+    buckets=LATENCY_BUCKETS,
+)
+GITHUB_RESPONSES = Counter(
+    'github_oauth_proxy_github_responses_total',
+    'GitHub API responses, by endpoint and HTTP status.',
+    ['endpoint', 'status'],
+)
+GITHUB_RATE_LIMIT_REMAINING = Gauge(
+    'github_oauth_proxy_github_rate_limit_remaining',
+    'X-RateLimit-Remaining of the latest GitHub API response.',
+)
+INFO_REQUEST_DURATION = Histogram(
+    'github_oauth_proxy_info_request_duration_seconds',
+    'Latency of /info requests.',
+    buckets=LATENCY_BUCKETS,
+)
+INFO_RESPONSES = Counter(
+    'github_oauth_proxy_info_responses_total',
+    '/info responses, by HTTP status.',
+    ['status'],
+)
+INFO_IN_FLIGHT = Gauge(
+    'github_oauth_proxy_info_requests_in_flight',
+    '/info requests currently being served.',
+)
+STARTUP_DURATION = Gauge(
+    'github_oauth_proxy_startup_duration_seconds',
+    'Time the proxy took to start, by phase.',
+    ['phase'],
+)
+DIRECTORY_SYNCS = Counter(
+    'github_oauth_proxy_directory_syncs_total',
+    'Organization directory syncs, by result.',
+    ['result'],
+)
+DIRECTORY_SYNC_DURATION = Histogram(
+    'github_oauth_proxy_directory_sync_duration_seconds',
+    'Time an organization directory sync took.',
+    buckets=LATENCY_BUCKETS + (60.0, 120.0, 300.0),
+)
+DIRECTORY_MEMBERS = Gauge(
+    'github_oauth_proxy_directory_members',
+    'Organization members in the directory snapshot.',
+)
+DIRECTORY_AGE = Gauge(
+    'github_oauth_proxy_directory_age_seconds',
+    'Seconds since the organization directory was last synced.',
+)
+GITHUB_EVENTS = Counter(
+    'github_oauth_proxy_github_events_total',
+    'GitHub webhook deliveries, by event and result.',
+    ['event', 'result'],
+)
+
+# Event names are exported as label values only when they are known, so
+# deliveries cannot create an unbounded number of series
+GITHUB_EVENT_LABELS = frozenset({'membership', 'member', 'organization', 'ping', 'team', 'unverified'})
+
+CacheGetter = Callable[[], CacheBackend]
+
+
+class CacheCollector(Collector):
+    """Export the statistics of the registered caches at scrape time.
+
+    Attributes:
+        caches: Functions returning each cache, by name. Functions are used
+            rather than the caches themselves because the modules owning them
+            rebuild them when the configuration is reloaded.
+    """
+
+    def __init__(self) -> None:
+        """Initialize with no caches registered."""
+        self.caches: Dict[str, CacheGetter] = {}
+
+    def collect(self) -> Iterator[Metric]:
+        """Yield the hits, misses, hit ratio, size and memory use of every cache.
+
+        The ETag cache also reports how many requests GitHub answered with
+        HTTP 304.
+        """
+        hits = CounterMetricFamily('github_oauth_proxy_cache_hits', 'Cache lookups answered.', labels=['cache'])
+        misses = CounterMetricFamily('github_oauth_proxy_cache_misses', 'Cache lookups missed.', labels=['cache'])
+        ratio = GaugeMetricFamily('github_oauth_proxy_cache_hit_ratio', 'Share of lookups answered.', labels=['cache'])
+        entries = GaugeMetricFamily('github_oauth_proxy_cache_entries', 'Entries currently held.', labels=['cache'])
+        held = GaugeMetricFamily('github_oauth_proxy_cache_bytes', 'Memory held by the entries.', labels=['cache'])
+        not_modified = CounterMetricFamily(
+            'github_oauth_proxy_cache_not_modified', 'Conditional requests answered with HTTP 304.', labels=['cache'],
+        )
+
+        for name, get_cache in sorted(self.caches.items()):
+            stats = get_cache().stats()
+            hits.add_metric([name], stats['hits'])
+            misses.add_metric([name], stats['misses'])
+            ratio.add_metric([name], stats['hit_ratio'])
+            # Counting a Redis cache's entries would scan the server's keyspace
+            if 'entries' in stats:
+                entries.add_metric([name], stats['entries'])
+            # Caches stored outside the process do not report their memory
+            if 'bytes' in stats:
+                held.add_metric([name], stats['bytes'])
+            # Only the ETag cache revalidates its entries
+            if 'not_modified' in stats:
+                not_modified.add_metric([name], stats['not_modified'])
+
+        yield from (hits, misses, ratio, entries, held, not_modified)
+
+
+cache_collector = CacheCollector()
+REGISTRY.register(cache_collector)
+
+
+def register_cache(name: str, get_cache: CacheGetter) -> None:
+    """Export a cache's statistics under the ``cache`` label ``name``.
+
+    Args:
+        name: The label value, for example ``profile``.
+        get_cache: Function returning the current cache.
+    """
+    cache_collector.caches[name] = get_cache
+
+
+def observe_github_request(endpoint: str, status: int, elapsed: float, remaining: Optional[str]) -> None:
+    """Record one GitHub API response.
+
+    Args:
+        endpoint: The API path, without query parameters.
+        status: The HTTP status code.
+        elapsed: Seconds the request took.
+        remaining: The ``X-RateLimit-Remaining`` header, if present.
+    """
+    GITHUB_REQUEST_DURATION.labels(endpoint).observe(elapsed)
+    GITHUB_RESPONSES.labels(endpoint, str(status)).inc()
+
+    if remaining is not None and remaining.isdigit():
+        GITHUB_RATE_LIMIT_REMAINING.set(int(remaining))
+
+
+def start_info_request() -> float:
+    """Count an ``/info`` request as in flight.
+
+    Returns:
+        The start time to pass to ``finish_info_request``.
+    """
+    INFO_IN_FLIGHT.inc()
+    return time.perf_counter()
+
+
+def finish_info_request(started: float, status: int) -> None:
+    """Record a finished ``/info`` request.
+
+    Args:
+        started: The value returned by ``start_info_request``.
+        status: The HTTP status of the response.
+    """
+    INFO_IN_FLIGHT.dec()
+    INFO_REQUEST_DURATION.observe(time.perf_counter() - started)
+    INFO_RESPONSES.labels(str(status)).inc()
+
+
+def observe_startup(phases: Dict[str, float]) -> None:
+    """Record how long each startup phase took.
+
+    Args:
+        phases: Seconds spent, by phase name.
+    """
+    for phase, seconds in phases.items():
+        STARTUP_DURATION.labels(phase).set(seconds)
+
+
+def observe_directory_sync(elapsed: float, members: Optional[int]) -> None:
+    """Record one organization directory sync.
+
+    Args:
+        elapsed: Seconds the sync took.
+        members: Members in the new snapshot, or ``None`` if the sync failed.
+    """
+    DIRECTORY_SYNC_DURATION.observe(elapsed)
+    DIRECTORY_SYNCS.labels('error' if members is None else 'ok').inc()
+
+    if members is not None:
+        DIRECTORY_MEMBERS.set(members)
+
+
+def register_directory(get_age: Callable[[], float]) -> None:
+    """Export the organization directory's age, read at scrape time.
+
+    Args:
+        get_age: Function returning the seconds since the last successful sync.
+    """
+    DIRECTORY_AGE.set_function(get_age)
+
+
+def observe_github_event(event: str, result: str) -> None:
+    """Record one GitHub webhook delivery.
+
+    Args:
+        event: The ``X-GitHub-Event`` header of a verified delivery, or
+            ``unverified``. Events not in ``GITHUB_EVENT_LABELS`` are
+            counted as ``other``.
+        result: ``applied``, ``ignored`` or ``rejected``.
+    """
+    GITHUB_EVENTS.labels(event if event in GITHUB_EVENT_LABELS else 'other', result).inc()
+
+
+def render() -> Tuple[bytes, str]:
+    """Return the current metrics in the Prometheus text format.
+
+    Returns:
+        The response body and its content type.
+    """
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
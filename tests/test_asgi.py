@@ -0,0 +1,464 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from prometheus_client import REGISTRY
+from unittest.mock import AsyncMock, MagicMock, patch
+
+
+@pytest.fixture
+def asgi():
+    with patch('webhook.load_config', return_value=None):
+        import importlib
+        import webhook
+        import asgi
+        importlib.reload(webhook)
+        importlib.reload(asgi)
+        yield asgi
+
+
+def call(asgi, method, path, headers=None):
+    async def request():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://testserver') as client:
+            return await client.request(method, path, headers=headers)
+    return asyncio.run(request())
+
+
+def mock_github(**results):
+    mock_auth = MagicMock()
+    mock_auth.get_user_info = AsyncMock(return_value=results.get('info', {'login': 'testuser', 'name': 'Test User'}))
+    mock_auth.validate_scopes = AsyncMock(side_effect=results.get('scopes_error'))
+    mock_auth.get_org_list = AsyncMock(return_value=results.get('orgs', [{'login': 'MyOrg'}]))
+    mock_auth.get_email_addresses = AsyncMock(
+        return_value=results.get('emails', [{'email': 'test@example.com', 'primary': True}])
+    )
+    mock_auth.get_user_teams = AsyncMock(return_value=results.get('teams', ['backend']))
+    return mock_auth
+
+
+class TestAsgiRoutes:
+    def test_ping(self, asgi):
+        response = call(asgi, 'GET', '/')
+        assert response.status_code == 200
+        assert response.json() == {'status': 'ok'}
+
+    def test_not_found(self, asgi):
+        response = call(asgi, 'GET', '/nonexistent')
+        assert response.status_code == 404
+        assert response.json()['msg'] == 'http://testserver/nonexistent not found'
+
+    def test_method_not_allowed(self, asgi):
+        response = call(asgi, 'POST', '/info')
+        assert response.status_code == 405
+        assert response.headers['Allow'] == 'GET'
+
+    def test_requests_check_for_config_changes(self, asgi):
+        import threading
+        threads = []
+
+        with patch.object(asgi.webhook.config_watcher, 'due', return_value=False), \
+                patch.object(asgi.webhook.config_watcher, 'check') as mock_check:
+            call(asgi, 'GET', '/')
+        mock_check.assert_not_called()
+
+        with patch.object(asgi.webhook.config_watcher, 'due', return_value=True), \
+                patch.object(asgi.webhook.config_watcher, 'check', side_effect=lambda: threads.append(
+                    threading.current_thread()
+                )):
+            call(asgi, 'GET', '/')
+        assert threads and threads[0] is not threading.main_thread()
+
+    def test_metrics(self, asgi):
+        response = call(asgi, 'GET', '/metrics')
+        assert response.status_code == 200
+        assert response.headers['content-type'].startswith('text/plain')
+        assert 'github_oauth_proxy_info_requests_in_flight' in response.text
+
+    def test_missing_authorization_header(self, asgi):
+        response = call(asgi, 'GET', '/info')
+        assert response.status_code == 401
+        assert response.json()['msg'] == 'Authorization header not found in request'
+
+    def test_empty_authorization_header(self, asgi):
+        response = call(asgi, 'GET', '/info', headers={'Authorization': ''})
+        assert response.status_code == 401
+        assert response.json()['msg'] == 'Authorization header not present or empty'
+
+
+class TestAsgiInfo:
+    def test_successful_request(self, asgi):
+        with patch('asgi.AsyncGithubAuth', return_value=mock_github()):
+            response = call(asgi, 'GET', '/info', headers={'Authorization': 'Bearer test_token'})
+
+        assert response.status_code == 200
+        assert response.json() == {
+            'username': 'testuser',
+            'firstname': 'Test',
+            'lastname': 'User',
+            'email': 'test@example.com',
+            'roles': 'backend',
+            'orgs': 'MyOrg',
+            'organizations_url': 'https://api.github.com/user/orgs',
+        }
+
+    def test_graphql_mode(self, asgi):
+        import webhook
+        webhook.config = {'github': {'api': 'graphql'}}
+        mock_auth = mock_github()
+        mock_auth.get_graphql_profile = AsyncMock(return_value=(
+            {'login': 'testuser', 'name': 'Test User'}, [{'login': 'MyOrg'}], []
+        ))
+
+        with patch('asgi.AsyncGithubAuth', return_value=mock_auth):
+            response = call(asgi, 'GET', '/info', headers={'Authorization': 'Bearer test_token'})
+
+        assert response.status_code == 200
+        assert response.json()['orgs'] == 'MyOrg'
+        mock_auth.validate_scopes.assert_awaited_once()
+        mock_auth.get_user_info.assert_not_awaited()
+
+    def test_org_membership_mode(self, asgi):
+        import webhook
+        webhook.config = {'github': {'org_check': 'membership', 'required': {'org': 'MyOrg'}}}
+        mock_auth = mock_github()
+        mock_auth.get_org_membership = AsyncMock(return_value=True)
+
+        with patch('asgi.AsyncGithubAuth', return_value=mock_auth):
+            response = call(asgi, 'GET', '/info', headers={'Authorization': 'Bearer test_token'})
+
+        assert response.status_code == 200
+        assert response.json()['orgs'] == 'MyOrg'
+        mock_auth.get_org_membership.assert_awaited_once_with('MyOrg')
+        mock_auth.get_org_list.assert_not_awaited()
+
+    def test_org_membership_mode_rejects_non_members(self, asgi):
+        import webhook
+        webhook.config = {'github': {'org_check': 'membership', 'required': {'org': 'MyOrg'}}}
+        mock_auth = mock_github()
+        mock_auth.get_org_membership = AsyncMock(return_value=False)
+
+        with patch('asgi.AsyncGithubAuth', return_value=mock_auth):
+            response = call(asgi, 'GET', '/info', headers={'Authorization': 'Bearer test_token'})
+
+        assert response.status_code == 401
+        assert 'not a member of MyOrg' in response.json()['detail']
+
+    def test_org_directory(self, asgi):
+        import time
+        import webhook
+        webhook.config = {'github': {'required': {'org': 'MyOrg'}}}
+        webhook.org_directory.snapshot = webhook.OrgSnapshot(
+            'MyOrg', {'devops': frozenset({'testuser'})}, {'testuser': ('devops',)}, time.monotonic()
+        )
+        member = mock_github()
+        newcomer = mock_github(info={'login': 'newcomer', 'name': 'New Comer'})
+
+        with patch('asgi.AsyncGithubAuth', side_effect=[member, newcomer]):
+            response = call(asgi, 'GET', '/info', headers={'Authorization': 'Bearer test_token'})
+            unknown = call(asgi, 'GET', '/info', headers={'Authorization': 'Bearer other_token'})
+
+        assert response.json()['roles'] == 'devops'
+        assert response.json()['orgs'] == 'MyOrg'
+        member.get_org_list.assert_not_awaited()
+        member.get_user_teams.assert_not_awaited()
+        assert unknown.json()['roles'] == 'backend'
+        newcomer.get_org_list.assert_awaited_once()
+
+    def test_repeat_login_served_from_cache(self, asgi):
+        mock_auth = mock_github()
+        with patch('asgi.AsyncGithubAuth', return_value=mock_auth):
+            call(asgi, 'GET', '/info', headers={'Authorization': 'Bearer test_token'})
+            response = call(asgi, 'GET', '/info', headers={'Authorization': 'Bearer test_token'})
+
+        assert response.status_code == 200
+        mock_auth.get_user_info.assert_awaited_once()
+
+    def test_concurrent_logins_share_one_fetch(self, asgi):
+        mock_auth = mock_github()
+
+        async def slow_user_info():
+            await asyncio.sleep(0.01)
+            return {'login': 'testuser', 'name': 'Test User'}
+
+        mock_auth.get_user_info = AsyncMock(side_effect=slow_user_info)
+
+        async def requests():
+            transport = httpx.ASGITransport(app=asgi.app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://testserver') as client:
+                return await asyncio.gather(*(
+                    client.get('/info', headers={'Authorization': 'Bearer test_token'}) for _ in range(3)
+                ))
+
+        with patch('asgi.AsyncGithubAuth', return_value=mock_auth):
+            responses = asyncio.run(requests())
+
+        assert [response.status_code for response in responses] == [200, 200, 200]
+        mock_auth.get_user_info.assert_awaited_once()
+        assert asgi.profile_flight.shared == 2
+
+    def test_requirements_are_enforced(self, asgi):
+        import webhook
+        webhook.config = {'github': {'required': {'org': 'RequiredOrg'}}}
+        with patch('asgi.AsyncGithubAuth', return_value=mock_github()):
+            response = call(asgi, 'GET', '/info', headers={'Authorization': 'Bearer test_token'})
+
+        assert response.status_code == 401
+        assert 'not a member of RequiredOrg' in response.json()['detail']
+
+    def test_scope_error_cancels_other_calls(self, asgi):
+        mock_auth = mock_github(scopes_error=PermissionError('Missing scopes'))
+
+        async def slow_orgs(config):
+            await asyncio.sleep(10)
+        mock_auth.get_org_list = AsyncMock(side_effect=slow_orgs)
+
+        with patch('asgi.AsyncGithubAuth', return_value=mock_auth):
+            response = call(asgi, 'GET', '/info', headers={'Authorization': 'Bearer test_token'})
+
+        assert response.status_code == 401
+        assert response.json()['detail'] == 'Missing scopes'
+
+    def test_failed_org_requirement_cancels_other_calls(self, asgi):
+        asgi.webhook.config = {'github': {'required': {'org': 'RequiredOrg', 'email': {'domain': 'example.com'}}}}
+        mock_auth = mock_github(orgs=[{'login': 'OtherOrg'}])
+        cancelled = []
+
+        async def slow_emails(config):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append('emails')
+                raise
+        mock_auth.get_email_addresses = AsyncMock(side_effect=slow_emails)
+
+        with patch('asgi.AsyncGithubAuth', return_value=mock_auth):
+            response = call(asgi, 'GET', '/info', headers={'Authorization': 'Bearer test_token'})
+
+        assert response.status_code == 401
+        assert 'not a member of RequiredOrg' in response.json()['detail']
+        assert cancelled == ['emails']
+
+    def test_permission_error_preferred(self, asgi):
+        mock_auth = mock_github(scopes_error=PermissionError('Missing scopes'))
+        mock_auth.get_org_list = AsyncMock(side_effect=RuntimeError('ERROR: 502'))
+
+        with patch('asgi.AsyncGithubAuth', return_value=mock_auth):
+            response = call(asgi, 'GET', '/info', headers={'Authorization': 'Bearer test_token'})
+
+        assert response.status_code == 401
+        assert response.json()['detail'] == 'Missing scopes'
+
+    def test_internal_server_error(self, asgi):
+        mock_auth = mock_github()
+        mock_auth.get_user_info = AsyncMock(side_effect=RuntimeError('boom'))
+
+        with patch('asgi.AsyncGithubAuth', return_value=mock_auth):
+            response = call(asgi, 'GET', '/info', headers={'Authorization': 'Bearer test_token'})
+
+        assert response.status_code == 500
+        assert response.json() == {'status': 'error', 'msg': 'Internal Server Error'}
+        assert REGISTRY.get_sample_value('github_oauth_proxy_info_requests_in_flight') == 0
+
+    def test_repeat_denied_login_skips_github(self, asgi):
+        mock_auth = mock_github(scopes_error=PermissionError('ERROR: Unauthorized: (Bad credentials)'))
+
+        with patch('asgi.AsyncGithubAuth', return_value=mock_auth) as mock_auth_class:
+            first = call(asgi, 'GET', '/info', headers={'Authorization': 'Bearer revoked_token'})
+            second = call(asgi, 'GET', '/info', headers={'Authorization': 'Bearer revoked_token'})
+
+        assert first.status_code == 401
+        assert second.status_code == 401
+        assert second.json() == first.json()
+        mock_auth_class.assert_called_once()
+
+    def test_rate_limited_without_cached_profile(self, asgi):
+        from github_auth import RateLimitError
+        mock_auth = mock_github()
+        mock_auth.get_user_info = AsyncMock(side_effect=RateLimitError('ERROR: Rate limited', 30))
+
+        with patch('asgi.AsyncGithubAuth', return_value=mock_auth):
+            response = call(asgi, 'GET', '/info', headers={'Authorization': 'Bearer test_token'})
+
+        assert response.status_code == 429
+        assert response.headers['Retry-After'] == '30'
+
+    def test_rate_limited_serves_stale_profile(self, asgi):
+        import webhook
+        from cache import hash_token
+        from github_auth import RateLimitError
+        webhook.profile_cache.set(hash_token('test_token'), {'username': 'testuser'})
+        mock_auth = mock_github()
+        mock_auth.get_user_info = AsyncMock(side_effect=RateLimitError('ERROR: Rate limited', 30))
+
+        with patch('asgi.AsyncGithubAuth', return_value=mock_auth), \
+                patch.object(webhook.profile_cache, 'get', return_value=None):
+            response = call(asgi, 'GET', '/info', headers={'Authorization': 'Bearer test_token'})
+
+        assert response.status_code == 200
+        assert response.json() == {'username': 'testuser'}
+
+
+class TestAsgiStaleWhileRevalidate:
+    def test_serves_expired_profile_and_refreshes(self, asgi):
+        import webhook
+        from cache import hash_token
+        webhook.config = {'cache': {'profile': {'stale_while_revalidate': 60}}}
+        webhook.profile_cache.set(hash_token('test_token'), {'username': 'olduser'})
+        mock_auth = mock_github()
+
+        async def request_then_drain():
+            transport = httpx.ASGITransport(app=asgi.app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://testserver') as client:
+                response = await client.get('/info', headers={'Authorization': 'Bearer test_token'})
+            await asyncio.gather(*asgi.background_tasks)
+            return response
+
+        with patch('asgi.AsyncGithubAuth', return_value=mock_auth), \
+                patch.object(webhook.profile_cache, 'get', return_value=None):
+            response = asyncio.run(request_then_drain())
+
+        assert response.json() == {'username': 'olduser'}
+        assert webhook.profile_cache.get_stale(hash_token('test_token'))['username'] == 'testuser'
+        assert not asgi.background_tasks
+
+    def test_revoked_token_is_evicted_on_refresh(self, asgi):
+        import webhook
+        from cache import hash_token
+        webhook.profile_cache.set(hash_token('test_token'), {'username': 'olduser'})
+        mock_auth = mock_github(scopes_error=PermissionError('ERROR: Unauthorized'))
+
+        with patch('asgi.AsyncGithubAuth', return_value=mock_auth):
+            asyncio.run(asgi.refresh_profile('test_token', hash_token('test_token')))
+
+        assert webhook.profile_cache.get_stale(hash_token('test_token')) is None
+        assert webhook.denied_cache.get(hash_token('test_token')) == 'ERROR: Unauthorized'
+
+    def test_failed_refresh_keeps_profile(self, asgi):
+        import webhook
+        from cache import hash_token
+        webhook.profile_cache.set(hash_token('test_token'), {'username': 'olduser'})
+        mock_auth = mock_github()
+        mock_auth.get_user_info = AsyncMock(side_effect=RuntimeError('boom'))
+
+        with patch('asgi.AsyncGithubAuth', return_value=mock_auth):
+            asyncio.run(asgi.refresh_profile('test_token', hash_token('test_token')))
+
+        assert webhook.profile_cache.get_stale(hash_token('test_token')) == {'username': 'olduser'}
+
+
+class TestBlockingCaches:
+    def test_sqlite_profile_cache_runs_in_worker_threads(self, asgi, tmp_path):
+        import threading
+        from cache import SqliteCache
+        cache = SqliteCache(str(tmp_path / 'profiles.db'), ttl=60, max_entries=10)
+        asgi.webhook.profile_cache = cache
+        threads = set()
+
+        def recording(method):
+            def wrapper(*args):
+                threads.add(threading.current_thread())
+                return method(*args)
+            return wrapper
+
+        with patch.object(cache, 'get', recording(cache.get)), patch.object(cache, 'set', recording(cache.set)), \
+                patch('asgi.AsyncGithubAuth', return_value=mock_github()):
+            first = call(asgi, 'GET', '/info', {'Authorization': 'Bearer test_token'})
+            second = call(asgi, 'GET', '/info', {'Authorization': 'Bearer test_token'})
+
+        assert first.json() == second.json()
+        assert second.json()['username'] == 'testuser'
+        assert threads and threading.main_thread() not in threads
+
+    def test_memory_profile_cache_is_called_directly(self, asgi):
+        import threading
+        assert asyncio.run(asgi.cache_io(threading.get_ident)) == threading.get_ident()
+
+
+class TestAsgiGithubWebhook:
+    def test_applies_signed_delivery(self, asgi):
+        import hashlib
+        import hmac
+        import webhook
+        webhook.config = {'github': {'required': {'org': 'MyOrg'}}}
+        webhook.github_webhook_secret = 'secret'
+        webhook.profile_cache.set('hash', {'username': 'alice', 'roles': ''})
+        body = json.dumps({
+            'action': 'member_removed',
+            'membership': {'user': {'login': 'alice'}},
+            'organization': {'login': 'MyOrg'},
+        }).encode()
+        signature = 'sha256=' + hmac.new(b'secret', body, hashlib.sha256).hexdigest()
+
+        async def request():
+            transport = httpx.ASGITransport(app=asgi.app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://testserver') as client:
+                return await client.post('/github/webhook', content=body, headers={
+                    'X-GitHub-Event': 'organization', 'X-Hub-Signature-256': signature,
+                })
+
+        response = asyncio.run(request())
+
+        assert response.status_code == 200
+        assert response.json() == {'status': 'ok', 'evicted': 1}
+        assert webhook.profile_cache.get('hash') is None
+
+    def test_read_body_joins_chunks(self, asgi):
+        messages = iter([{'body': b'{"a":', 'more_body': True}, {'body': b'1}'}])
+
+        async def receive():
+            return next(messages)
+
+        assert asyncio.run(asgi.read_body(receive)) == b'{"a":1}'
+
+    def test_not_found_without_secret(self, asgi):
+        response = call(asgi, 'POST', '/github/webhook')
+        assert response.status_code == 404
+
+    def test_method_not_allowed(self, asgi):
+        response = call(asgi, 'GET', '/github/webhook')
+        assert response.status_code == 405
+        assert response.headers['Allow'] == 'POST'
+
+
+class TestLifespan:
+    def test_startup_and_shutdown(self, asgi):
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        with patch('async_github_auth.client') as mock_client:
+            mock_client.aclose = AsyncMock()
+            asyncio.run(asgi.app({'type': 'lifespan'}, receive, send))
+            mock_client.aclose.assert_awaited_once()
+
+        assert [m['type'] for m in sent] == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+
+
+class TestMain:
+    @patch('webhook.get_args')
+    def test_main_block(self, mock_get_args, asgi):
+        mock_args = MagicMock()
+        mock_args.host = '127.0.0.1'
+        mock_args.port = 9000
+        mock_get_args.return_value = mock_args
+
+        with open(asgi.__file__) as f:
+            lines = f.readlines()
+        main_start = next(i for i, line in enumerate(lines) if line.startswith("if __name__"))
+        main_source = '\n' * main_start + ''.join(lines[main_start:])
+        code = compile(main_source, asgi.__file__, 'exec')
+        globs = dict(vars(asgi))
+        globs['__name__'] = '__main__'
+
+        fake_uvicorn = MagicMock()
+        with patch.dict('sys.modules', {'uvicorn': fake_uvicorn}):
+            exec(code, globs)
+
+        fake_uvicorn.run.assert_called_once_with(asgi.app, host='127.0.0.1', port=9000)
@@ -0,0 +1,284 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from unittest.mock import patch
+
+import async_github_auth
+import github_auth
+from async_github_auth import AsyncGithubAuth, configure_http, create_client
+from github_auth import RateLimitError
+
+
+@pytest.fixture(autouse=True)
+def reset_shared_state():
+    github_auth.configure_response_cache(None)
+    github_auth.configure_rate_limit(None)
+    yield
+    github_auth.configure_response_cache(None)
+    github_auth.configure_rate_limit(None)
+
+
+@pytest.fixture
+def responses():
+    """Route mocked GitHub responses by path and record the requests made."""
+    routes = {}
+    requests_made = []
+
+    def handler(request):
+        requests_made.append(request)
+        route = routes[request.url.path]
+        if callable(route):
+            return route(request)
+        return route
+
+    original_client = async_github_auth.client
+    async_github_auth.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    yield routes, requests_made
+    async_github_auth.client = original_client
+
+
+def json_response(status_code, body, headers=None):
+    return httpx.Response(status_code, content=json.dumps(body).encode(), headers=headers or {})
+
+
+class TestCreateClient:
+    def test_client_does_not_store_cookies(self):
+        client = create_client()
+        assert client.cookies.jar._policy.allowed_domains() == ()
+
+    def test_configure_http_from_config(self):
+        configure_http({'github': {'http': {'max_connections': 7, 'read_timeout': 3}}})
+        try:
+            assert async_github_auth.client.timeout.read == 3
+        finally:
+            configure_http(None)
+        assert async_github_auth.client.timeout.read == 10.0
+
+
+class TestAsyncGithubAuth:
+    def test_init_with_empty_token(self):
+        with pytest.raises(PermissionError, match='No access token provided'):
+            AsyncGithubAuth('')
+
+    def test_get_user_info(self, responses):
+        routes, requests_made = responses
+        routes['/user'] = json_response(200, {'login': 'testuser'}, {'X-OAuth-Scopes': 'user:email, read:org'})
+
+        auth = AsyncGithubAuth('token')
+        assert asyncio.run(auth.get_user_info()) == {'login': 'testuser'}
+        asyncio.run(auth.validate_scopes())
+
+        assert len(requests_made) == 1
+        assert requests_made[0].headers['Authorization'] == 'Bearer token'
+
+    def test_validate_scopes_from_api_root(self, responses):
+        routes, requests_made = responses
+        routes['/'] = json_response(200, {}, {'X-OAuth-Scopes': 'user:email'})
+
+        with pytest.raises(PermissionError, match="'read:org'"):
+            asyncio.run(AsyncGithubAuth('token').validate_scopes())
+
+    def test_get_headers_non_200(self, responses):
+        routes, _ = responses
+        routes['/'] = json_response(500, {})
+
+        with pytest.raises(PermissionError, match='Github returned HTTP status: 500'):
+            asyncio.run(AsyncGithubAuth('token').get_headers())
+
+    def test_get_org_list_and_emails(self, responses):
+        routes, _ = responses
+        routes['/user/orgs'] = json_response(200, [{'login': 'MyOrg'}])
+        routes['/user/emails'] = json_response(200, [{'email': 'test@example.com'}])
+
+        auth = AsyncGithubAuth('token')
+        assert asyncio.run(auth.get_org_list()) == [{'login': 'MyOrg'}]
+        assert asyncio.run(auth.get_email_addresses()) == [{'email': 'test@example.com'}]
+
+    def test_get_org_membership(self, responses):
+        routes, _ = responses
+        routes['/user/memberships/orgs/MyOrg'] = json_response(200, {'state': 'active'})
+        routes['/user/memberships/orgs/OtherOrg'] = json_response(404, {'message': 'Not Found'})
+
+        auth = AsyncGithubAuth('token')
+        assert asyncio.run(auth.get_org_membership('MyOrg')) is True
+        assert asyncio.run(auth.get_org_membership('OtherOrg')) is False
+
+    def test_unauthorized(self, responses):
+        routes, _ = responses
+        routes['/user'] = json_response(401, {'message': 'Bad credentials'})
+
+        with pytest.raises(PermissionError, match='Unauthorized.*Bad credentials'):
+            asyncio.run(AsyncGithubAuth('token').get_user_info())
+
+    def test_not_modified_served_from_cache(self, responses):
+        routes, requests_made = responses
+        routes['/user'] = json_response(200, {'login': 'testuser'}, {'ETag': '"abc"'})
+        asyncio.run(AsyncGithubAuth('token').get_user_info())
+
+        routes['/user'] = httpx.Response(304)
+        assert asyncio.run(AsyncGithubAuth('token').get_user_info()) == {'login': 'testuser'}
+        assert requests_made[1].headers['If-None-Match'] == '"abc"'
+
+    @patch('async_github_auth.asyncio.sleep')
+    def test_retries_rate_limit(self, mock_sleep, responses):
+        routes, _ = responses
+        replies = [
+            json_response(429, {'message': 'slow down'}, {'Retry-After': '1'}),
+            json_response(200, {'login': 'testuser'}),
+        ]
+        routes['/user'] = lambda request: replies.pop(0)
+
+        async def no_sleep(delay):
+            return None
+        mock_sleep.side_effect = no_sleep
+
+        assert asyncio.run(AsyncGithubAuth('token').get_user_info()) == {'login': 'testuser'}
+        mock_sleep.assert_called_once_with(1.0)
+
+    def test_rate_limit_error(self, responses):
+        routes, _ = responses
+        routes['/user'] = json_response(403, {'message': 'API rate limit exceeded'}, {'Retry-After': '600'})
+
+        with pytest.raises(RateLimitError):
+            asyncio.run(AsyncGithubAuth('token').get_user_info())
+
+
+class TestAsyncGetUserTeams:
+    def test_no_org_configured(self, responses):
+        assert asyncio.run(AsyncGithubAuth('token').get_user_teams(None)) == []
+
+    def test_paginates_and_filters(self, responses):
+        routes, requests_made = responses
+        pages = {
+            '1': [
+                {'slug': 'backend', 'organization': {'login': 'MyOrg'}},
+                {'slug': 'frontend', 'organization': {'login': 'OtherOrg'}},
+            ],
+            '2': [{'slug': 'devops', 'organization': {'login': 'myorg'}}],
+            '3': [{'slug': 'qa', 'organization': {'login': 'MyOrg'}}],
+        }
+        link = '<https://api.github.com/user/teams?page=2&per_page=100>; rel="next", ' \
+               '<https://api.github.com/user/teams?page=3&per_page=100>; rel="last"'
+        routes['/user/teams'] = lambda request: json_response(
+            200, pages[request.url.params['page']], {'Link': link} if request.url.params['page'] == '1' else None
+        )
+
+        config = {'github': {'required': {'org': 'MyOrg'}}}
+        teams = asyncio.run(AsyncGithubAuth('token').get_user_teams(config))
+
+        assert teams == ['backend', 'devops', 'qa']
+        assert sorted(request.url.params['page'] for request in requests_made) == ['1', '2', '3']
+
+    def test_single_page_without_link_header(self, responses):
+        routes, requests_made = responses
+        routes['/user/teams'] = lambda request: json_response(
+            200, [{'slug': 'backend', 'organization': {'login': 'MyOrg'}}]
+        )
+
+        config = {'github': {'required': {'org': 'MyOrg'}}}
+        assert asyncio.run(AsyncGithubAuth('token').get_user_teams(config)) == ['backend']
+        assert len(requests_made) == 1
+
+    def test_page_error_cancels_remaining_pages(self, responses):
+        routes, requests_made = responses
+        link = '<https://api.github.com/user/teams?page=3&per_page=100>; rel="last"'
+        routes['/user/teams'] = json_response(200, [], {'Link': link})
+        cancelled = []
+
+        async def get_page(endpoint, page, select):
+            if page == 2:
+                raise PermissionError('ERROR: Unauthorized: (Bad credentials)')
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(page)
+                raise
+
+        config = {'github': {'required': {'org': 'MyOrg'}}}
+        auth = AsyncGithubAuth('token')
+        with patch.object(auth, '_get_page', side_effect=get_page), \
+                pytest.raises(PermissionError, match='Unauthorized'):
+            asyncio.run(auth.get_user_teams(config))
+
+        assert cancelled == [3]
+
+
+class TestAsyncOrgsAndEmails:
+    @staticmethod
+    def paginate(routes, endpoint, pages):
+        link = f'<https://api.github.com{endpoint}?page={len(pages)}&per_page=100>; rel="last"'
+
+        def get_page(request):
+            page = int(request.url.params['page'])
+            return json_response(200, pages[page - 1], {'Link': link} if page == 1 else None)
+
+        routes[endpoint] = get_page
+
+    def test_orgs_stop_once_required_org_is_found(self, responses):
+        routes, requests_made = responses
+        self.paginate(routes, '/user/orgs', [[{'login': 'MyOrg'}], [{'login': 'Other'}]])
+
+        config = {'github': {'required': {'org': 'myorg'}}}
+        assert asyncio.run(AsyncGithubAuth('token').get_org_list(config)) == [{'login': 'MyOrg'}]
+        assert len(requests_made) == 1
+
+    def test_emails_read_pages_until_required_domain(self, responses):
+        routes, requests_made = responses
+        pages = [
+            [{'email': 'me@example.com', 'primary': True}],
+            [{'email': 'me@corp.com', 'primary': False}],
+            [{'email': 'me@third.com', 'primary': False}],
+        ]
+        self.paginate(routes, '/user/emails', pages)
+
+        config = {'github': {'required': {'email': {'domain': 'corp.com'}}}}
+        emails = asyncio.run(AsyncGithubAuth('token').get_email_addresses(config))
+
+        assert emails[:2] == pages[0] + pages[1]
+        assert requests_made[0].url.params['per_page'] == '100'
+
+
+class TestAsyncGraphqlProfile:
+    def test_profile_and_teams(self, responses):
+        routes, requests_made = responses
+        replies = [
+            json_response(200, {'data': {'viewer': {
+                'login': 'testuser',
+                'name': 'Test User',
+                'organizations': {
+                    'nodes': [{'login': 'MyOrg'}],
+                    'pageInfo': {'hasNextPage': False, 'endCursor': None},
+                },
+            }}}),
+            json_response(200, {'data': {'organization': {'teams': {
+                'nodes': [{'slug': 'backend'}],
+                'pageInfo': {'hasNextPage': False, 'endCursor': None},
+            }}}}),
+        ]
+        routes['/graphql'] = lambda request: replies.pop(0)
+
+        config = {'github': {'required': {'org': 'MyOrg'}}}
+        info, orgs, teams = asyncio.run(AsyncGithubAuth('token').get_graphql_profile(config))
+
+        assert info == {'login': 'testuser', 'name': 'Test User'}
+        assert orgs == [{'login': 'MyOrg'}]
+        assert teams == ['backend']
+        assert json.loads(requests_made[1].content)['variables']['login'] == 'testuser'
+
+    @patch('async_github_auth.asyncio.sleep')
+    def test_retries_rate_limit(self, mock_sleep, responses):
+        routes, _ = responses
+        replies = [
+            json_response(429, {'message': 'slow down'}, {'Retry-After': '1'}),
+            json_response(200, {'errors': [{'message': 'boom'}]}),
+        ]
+        routes['/graphql'] = lambda request: replies.pop(0)
+
+        async def no_sleep(delay):
+            return None
+        mock_sleep.side_effect = no_sleep
+
+        with pytest.raises(RuntimeError, match='GraphQL: boom'):
+            asyncio.run(AsyncGithubAuth('token').get_graphql_profile(None))
@@ -0,0 +1,596 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+import fakeredis
+import pytest
+
+from cache import (
+    ENTRY_OVERHEAD,
+    AsyncSingleFlight,
+    CacheBackend,
+    CompactProfile,
+    ProfileCache,
+    RedisCache,
+    ResponseCache,
+    SerializedCache,
+    SingleFlight,
+    SqliteCache,
+    TTLCache,
+    hash_token,
+    sizeof,
+)
+
+
+class TestHashToken:
+    def test_hash_is_stable(self):
+        assert hash_token('token') == hash_token('token')
+
+    def test_hash_does_not_contain_token(self):
+        digest = hash_token('secret_token')
+        assert 'secret_token' not in digest
+        assert len(digest) == 64
+
+    def test_different_tokens_hash_differently(self):
+        assert hash_token('token1') != hash_token('token2')
+
+
+class TestTTLCache:
+    def test_get_missing_key(self):
+        cache = TTLCache(ttl=60, max_entries=10)
+        assert cache.get('missing') is None
+        assert cache.misses == 1
+
+    def test_set_and_get(self):
+        cache = TTLCache(ttl=60, max_entries=10)
+        cache.set('key', {'username': 'testuser'})
+        assert cache.get('key') == {'username': 'testuser'}
+        assert cache.hits == 1
+
+    @patch('cache.time.monotonic')
+    def test_entry_expires(self, mock_monotonic):
+        mock_monotonic.return_value = 1000.0
+        cache = TTLCache(ttl=60, max_entries=10)
+        cache.set('key', 'value')
+
+        mock_monotonic.return_value = 1059.0
+        assert cache.get('key') == 'value'
+
+        mock_monotonic.return_value = 1060.0
+        assert cache.get('key') is None
+        assert len(cache) == 0
+
+    def test_evicts_least_recently_used(self):
+        cache = TTLCache(ttl=60, max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        assert cache.get('a') == 1
+        assert cache.get('b') is None
+        assert cache.get('c') == 3
+
+    def test_delete(self):
+        cache = TTLCache(ttl=60, max_entries=10)
+        cache.set('key', 'value')
+        cache.delete('key')
+        cache.delete('missing')
+        assert cache.get('key') is None
+
+    def test_clear(self):
+        cache = TTLCache(ttl=60, max_entries=10)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.clear()
+        assert len(cache) == 0
+
+    @patch('cache.time.monotonic')
+    def test_get_stale_within_max_stale(self, mock_monotonic):
+        mock_monotonic.return_value = 1000.0
+        cache = TTLCache(ttl=60, max_entries=10, max_stale=30)
+        cache.set('key', 'value')
+
+        mock_monotonic.return_value = 1070.0
+        assert cache.get('key') is None
+        assert cache.get_stale('key') == 'value'
+
+        mock_monotonic.return_value = 1090.0
+        assert cache.get_stale('key') is None
+        assert len(cache) == 0
+
+    @patch('cache.time.monotonic')
+    def test_get_stale_within_window(self, mock_monotonic):
+        mock_monotonic.return_value = 1000.0
+        cache = TTLCache(ttl=60, max_entries=10, max_stale=600)
+        cache.set('key', 'value')
+
+        mock_monotonic.return_value = 1070.0
+        assert cache.get_stale('key', within=30) == 'value'
+        assert cache.get_stale('key', within=10) is None
+
+    def test_get_stale_missing_key(self):
+        cache = TTLCache(ttl=60, max_entries=10, max_stale=30)
+        assert cache.get_stale('missing') is None
+
+    def test_stats(self):
+        cache = TTLCache(ttl=60, max_entries=10)
+        assert cache.stats()['hit_ratio'] == 0.0
+        cache.set('key', 'value')
+        cache.get('key')
+        cache.get('key')
+        cache.get('missing')
+        cache.get('missing')
+        assert cache.stats() == {'hits': 2, 'misses': 2, 'hit_ratio': 0.5, 'entries': 1, 'bytes': cache.bytes}
+
+    def test_zero_ttl_disables_cache(self):
+        cache = TTLCache(ttl=0, max_entries=10)
+        assert cache.enabled is False
+        cache.set('key', 'value')
+        assert cache.get('key') is None
+        assert len(cache) == 0
+
+
+class TestDeleteWhere:
+    @patch('cache.time.monotonic')
+    def test_removes_matching_entries_expired_or_not(self, mock_monotonic):
+        mock_monotonic.return_value = 1000.0
+        cache = TTLCache(ttl=60, max_entries=10, max_stale=600)
+        cache.set('old', {'username': 'alice'})
+        mock_monotonic.return_value = 1100.0
+        cache.set('new', {'username': 'alice'})
+        cache.set('other', {'username': 'bob'})
+
+        assert cache.delete_where(lambda profile: profile['username'] == 'alice') == 2
+        assert cache.get_stale('old') is None
+        assert cache.get('new') is None
+        assert cache.get('other') == {'username': 'bob'}
+
+    def test_profile_cache_matches_full_profiles(self):
+        cache = ProfileCache(ttl=60, max_entries=10)
+        cache.set('key1', make_profile('user1'))
+        cache.set('key2', make_profile('user2', roles='frontend'))
+
+        assert cache.delete_where(lambda profile: 'devops' in profile['roles'].split(',')) == 1
+        assert cache.get('key1') is None
+        assert cache.get('key2') == make_profile('user2', roles='frontend')
+        assert cache.bytes == sum(entry[2] for entry in cache._entries.values()) + sum(
+            sizeof(name) for name, _ in cache._names.values()
+        )
+
+
+class TestMemoryAccounting:
+    def test_sizeof_follows_containers(self):
+        import sys
+        value = {'roles': ['a', 'b']}
+        assert sizeof(value) == (
+            sys.getsizeof(value) + sys.getsizeof('roles') + sys.getsizeof(value['roles'])
+            + sys.getsizeof('a') + sys.getsizeof('b')
+        )
+
+    def test_counts_key_value_and_overhead(self):
+        cache = TTLCache(ttl=60, max_entries=10)
+        cache.set('key', 'value')
+        assert cache.bytes == sizeof('key') + sizeof('value') + ENTRY_OVERHEAD
+
+        cache.set('key', 'other value')
+        assert cache.bytes == sizeof('key') + sizeof('other value') + ENTRY_OVERHEAD
+
+        cache.delete('key')
+        assert cache.bytes == 0
+
+    def test_evicts_least_recently_used_over_max_bytes(self):
+        entry_size = sizeof('key1') + sizeof('value') + ENTRY_OVERHEAD
+        cache = TTLCache(ttl=60, max_entries=10, max_bytes=entry_size * 2)
+        cache.set('key1', 'value')
+        cache.set('key2', 'value')
+        cache.get('key1')
+        cache.set('key3', 'value')
+
+        assert cache.get('key1') == 'value'
+        assert cache.get('key2') is None
+        assert cache.get('key3') == 'value'
+        assert cache.bytes == entry_size * 2
+
+    def test_value_larger_than_max_bytes_is_not_kept(self):
+        cache = TTLCache(ttl=60, max_entries=10, max_bytes=100)
+        cache.set('key', 'x' * 1000)
+        assert cache.get('key') is None
+        assert cache.bytes == 0
+
+    @patch('cache.time.monotonic')
+    def test_dropped_stale_entry_is_uncounted(self, mock_monotonic):
+        mock_monotonic.return_value = 1000.0
+        cache = TTLCache(ttl=60, max_entries=10)
+        cache.set('key', 'value')
+
+        mock_monotonic.return_value = 1061.0
+        assert cache.get_stale('key') is None
+        assert cache.bytes == 0
+
+    def test_response_cache_counts_body_and_headers(self):
+        cache = ResponseCache(ttl=60, max_entries=10)
+        response = MagicMock(content=b'x' * 1000, headers={'ETag': '"abc"'})
+        cache.set('key', response)
+
+        assert cache.get('key') is response
+        assert cache.bytes == sizeof(b'x' * 1000) + sizeof({'ETag': '"abc"'}) + sizeof('key') + ENTRY_OVERHEAD
+
+
+def make_profile(username, roles='backend,devops', orgs='MyOrg'):
+    return {
+        'username': username,
+        'firstname': 'Test',
+        'lastname': 'User',
+        'email': f'{username}@example.com',
+        'roles': roles,
+        'orgs': orgs,
+        'organizations_url': 'https://api.github.com/user/orgs',
+    }
+
+
+class TestProfileCache:
+    def test_profiles_are_stored_compact(self):
+        cache = ProfileCache(ttl=60, max_entries=10)
+        cache.set('key', make_profile('user'))
+
+        assert isinstance(cache._entries['key'][1], CompactProfile)
+        assert cache.get('key') == make_profile('user')
+        assert cache.get_stale('key') == make_profile('user')
+
+    def test_empty_lists_round_trip(self):
+        cache = ProfileCache(ttl=60, max_entries=10)
+        cache.set('key', make_profile('user', roles='', orgs=''))
+        assert cache.get('key') == make_profile('user', roles='', orgs='')
+
+    def test_other_values_are_stored_as_they_are(self):
+        cache = ProfileCache(ttl=60, max_entries=10)
+        cache.set('key', {'username': 'user'})
+        assert cache.get('key') == {'username': 'user'}
+
+    def test_names_are_shared_between_profiles(self):
+        cache = ProfileCache(ttl=60, max_entries=10)
+        cache.set('key1', make_profile('user1'))
+        cache.set('key2', make_profile(''.join(['user', '2']), roles=','.join(['backend', 'devops'])))
+
+        first, second = cache._entries['key1'][1], cache._entries['key2'][1]
+        assert first.roles[0] is second.roles[0]
+        assert first.organizations_url is second.organizations_url
+
+    def test_shared_names_are_counted_once(self):
+        cache = ProfileCache(ttl=60, max_entries=10)
+        cache.set('key1', make_profile('user1'))
+        one = cache.bytes
+        cache.set('key2', make_profile('user2'))
+        shared = sizeof('backend') + sizeof('devops') + sizeof('MyOrg') + sizeof('https://api.github.com/user/orgs')
+
+        assert cache.bytes == 2 * one - shared
+
+        cache.delete('key1')
+        assert cache.bytes == one
+        cache.clear()
+        assert cache.bytes == 0
+        assert cache._names == {}
+
+    def test_smaller_than_the_profile_dicts(self):
+        cache = ProfileCache(ttl=60, max_entries=100)
+        plain = TTLCache(ttl=60, max_entries=100)
+
+        for n in range(100):
+            cache.set(hash_token(str(n)), make_profile(f'user{n}'))
+            plain.set(hash_token(str(n)), make_profile(f'user{n}'))
+
+        assert cache.bytes < plain.bytes * 0.75
+
+    def test_accounting_matches_allocations(self):
+        import tracemalloc
+        cache = ProfileCache(ttl=60, max_entries=10000)
+        profiles = [(hash_token(str(n)), make_profile(f'user{n}', roles=f'team{n % 50},devops')) for n in range(2000)]
+
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            for key, profile in profiles:
+                cache.set(key, profile)
+            allocated = tracemalloc.get_traced_memory()[0] - before
+        finally:
+            tracemalloc.stop()
+
+        # Keys and profile strings were allocated before measuring, and are
+        # counted by the cache because it keeps them alive
+        kept = sum(sizeof(key) + sizeof(profile['username']) + sizeof(profile['email'])
+                   + sizeof(profile['firstname']) + sizeof(profile['lastname']) for key, profile in profiles)
+        assert allocated + kept == pytest.approx(cache.bytes, rel=0.2)
+
+
+class TestResponseCache:
+    def test_counts_not_modified(self):
+        cache = ResponseCache(ttl=60, max_entries=10)
+        assert cache.not_modified == 0
+        cache.record_not_modified()
+        cache.record_not_modified()
+        assert cache.not_modified == 2
+        assert cache.stats()['not_modified'] == 2
+
+
+class TestCacheBackend:
+    def test_interface_is_abstract(self):
+        cache = CacheBackend(ttl=60, max_entries=10)
+        for call in (
+            lambda: cache.get('key'),
+            lambda: cache.get_stale('key'),
+            lambda: cache.set('key', 'value'),
+            lambda: cache.delete('key'),
+            lambda: cache.delete_where(bool),
+            cache.clear,
+            lambda: len(cache),
+        ):
+            with pytest.raises(NotImplementedError):
+                call()
+
+    def test_serialized_storage_is_abstract(self):
+        cache = SerializedCache(ttl=60, max_entries=10)
+        for call in (
+            lambda: cache._load('key'),
+            lambda: cache._store('key', b'[]', 0),
+            lambda: cache._remove('key'),
+            lambda: next(cache._scan()),
+        ):
+            with pytest.raises(NotImplementedError):
+                call()
+
+
+@pytest.fixture(params=['sqlite', 'redis'])
+def shared_cache(request, tmp_path):
+    def create(**kwargs):
+        kwargs.setdefault('ttl', 60)
+        kwargs.setdefault('max_entries', 10)
+        if request.param == 'sqlite':
+            return SqliteCache(str(tmp_path / 'cache.db'), **kwargs)
+        return RedisCache(client=fakeredis.FakeRedis(server=server), **kwargs)
+
+    server = fakeredis.FakeServer()
+    return create
+
+
+class TestSharedCaches:
+    def test_set_and_get(self, shared_cache):
+        cache = shared_cache()
+        assert cache.get('key') is None
+        cache.set('key', {'username': 'testuser'})
+        assert cache.get('key') == {'username': 'testuser'}
+        assert cache.stats()['hit_ratio'] == 0.5
+        assert len(cache) == 1
+
+    def test_corrupt_entries_are_misses(self, shared_cache):
+        cache = shared_cache()
+        cache._store('key', b'not json', time.time() + 60)
+        cache._store('list', b'[1]', time.time() + 60)
+        cache.set('other', {'username': 'testuser'})
+
+        assert cache.get('key') is None
+        assert cache.get_stale('list') is None
+        assert cache.delete_where(lambda profile: True) == 1
+        assert len(cache) == 0
+
+    def test_entries_are_shared_between_instances(self, shared_cache):
+        shared_cache().set('key', {'username': 'testuser'})
+        assert shared_cache().get('key') == {'username': 'testuser'}
+
+    @patch('cache.time.time')
+    def test_entry_expires_and_stays_stale(self, mock_time, shared_cache):
+        mock_time.return_value = 1000.0
+        cache = shared_cache(max_stale=30)
+        cache.set('key', 'value')
+
+        mock_time.return_value = 1070.0
+        assert cache.get('key') is None
+        assert cache.get_stale('key') == 'value'
+        assert cache.get_stale('key', within=5) is None
+
+    def test_delete_and_clear(self, shared_cache):
+        cache = shared_cache()
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.delete('a')
+        assert cache.get('a') is None
+        assert len(cache) == 1
+        cache.clear()
+        assert len(cache) == 0
+        cache.clear()
+
+    def test_zero_ttl_disables_cache(self, shared_cache):
+        cache = shared_cache(ttl=0)
+        cache.set('key', 'value')
+        assert cache.get_stale('key') is None
+
+    def test_entries_are_compact_json(self):
+        client = fakeredis.FakeRedis()
+        cache = RedisCache(ttl=60, max_entries=10, client=client, prefix='test:')
+        cache.set('key', {'username': 'testuser'})
+        assert client.get('test:key').endswith(b',{"username":"testuser"}]')
+        assert 0 < client.pttl('test:key') <= 60000
+
+    def test_removes_matching_entries(self, shared_cache):
+        cache = shared_cache()
+        cache.set('key1', {'username': 'alice'})
+        cache.set('key2', {'username': 'bob'})
+
+        assert cache.delete_where(lambda profile: profile['username'] == 'alice') == 1
+        assert cache.get('key1') is None
+        assert cache.get('key2') == {'username': 'bob'}
+
+
+class TestSqliteCache:
+    @patch('cache.time.time')
+    def test_evicts_entries_closest_to_expiry(self, mock_time, tmp_path):
+        cache = SqliteCache(str(tmp_path / 'cache.db'), ttl=60, max_entries=2)
+        for now, key in ((1000.0, 'a'), (1001.0, 'b'), (1002.0, 'c')):
+            mock_time.return_value = now
+            cache.set(key, ord(key))
+
+        assert len(cache) == 2
+        assert cache.get_stale('a') is None
+        assert cache.get_stale('b') == ord('b')
+        assert cache.get_stale('c') == ord('c')
+
+    @patch('cache.time.time')
+    def test_trims_only_every_interval(self, mock_time, tmp_path):
+        cache = SqliteCache(str(tmp_path / 'cache.db'), ttl=60, max_entries=50)
+        assert cache._trim_interval == 5
+
+        with patch.object(cache, '_trim', wraps=cache._trim) as mock_trim:
+            for n in range(54):
+                mock_time.return_value = 1000.0 + n
+                cache.set(f'key{n}', n)
+            assert mock_trim.call_count == 10
+            assert len(cache) == 54
+
+            cache.set('key54', 54)
+
+        assert mock_trim.call_count == 11
+        assert len(cache) == 50
+        assert cache.get('key4') is None
+        assert cache.get('key5') == 5
+
+
+class TestRedisCache:
+    def test_stats_do_not_scan_the_keyspace(self):
+        client = MagicMock()
+        client.get.return_value = None
+        cache = RedisCache(ttl=60, max_entries=10, client=client)
+        cache.get('key')
+
+        assert cache.stats() == {'hits': 0, 'misses': 1, 'hit_ratio': 0.0}
+        client.scan_iter.assert_not_called()
+
+    def test_connects_to_url(self):
+        cache = RedisCache(ttl=60, max_entries=10, url='redis://cache.example.com:6380/2')
+        assert cache._client.connection_pool.connection_kwargs['host'] == 'cache.example.com'
+        assert cache._client.connection_pool.connection_kwargs['db'] == 2
+
+    def test_server_errors_are_cache_misses(self):
+        client = MagicMock()
+        client.get.side_effect = ConnectionError('down')
+        client.set.side_effect = ConnectionError('down')
+        client.delete.side_effect = ConnectionError('down')
+        cache = RedisCache(ttl=60, max_entries=10, client=client)
+
+        cache.set('key', 'value')
+        cache.delete('key')
+        assert cache.get('key') is None
+        assert cache.get_stale('key') is None
+        assert cache.misses == 1
+
+    def test_server_errors_remove_nothing(self):
+        client = MagicMock()
+        client.scan_iter.side_effect = ConnectionError('down')
+        cache = RedisCache(ttl=60, max_entries=10, client=client)
+
+        assert cache.delete_where(lambda profile: True) == 0
+
+    def test_skips_keys_expired_during_the_scan(self):
+        client = MagicMock()
+        client.scan_iter.return_value = iter(['github-oauth-proxy:gone'])
+        client.mget.return_value = [None]
+        cache = RedisCache(ttl=60, max_entries=10, client=client)
+
+        assert cache.delete_where(lambda profile: True) == 0
+        client.delete.assert_not_called()
+
+
+class TestSingleFlight:
+    def run_concurrently(self, flight, fn):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow_call():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return fn()
+
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            leader = pool.submit(flight.do, 'key', slow_call)
+            started.wait(5)
+            waiters = [pool.submit(flight.do, 'key', slow_call) for _ in range(2)]
+            while flight.shared < 2:
+                time.sleep(0.001)
+            release.set()
+            futures = [leader] + waiters
+            return calls, [future.exception() or future.result() for future in futures]
+
+    def test_concurrent_calls_share_result(self):
+        flight = SingleFlight()
+        calls, results = self.run_concurrently(flight, lambda: {'username': 'testuser'})
+        assert len(calls) == 1
+        assert results == [{'username': 'testuser'}] * 3
+        assert len(flight) == 0
+
+    def test_concurrent_calls_share_exception(self):
+        flight = SingleFlight()
+
+        def fail():
+            raise PermissionError('ERROR: Unauthorized')
+
+        calls, results = self.run_concurrently(flight, fail)
+        assert len(calls) == 1
+        assert all(isinstance(result, PermissionError) for result in results)
+        assert len(flight) == 0
+
+    def test_sequential_calls_are_not_shared(self):
+        flight = SingleFlight()
+        assert flight.do('key', lambda: 1) == 1
+        assert flight.do('key', lambda: 2) == 2
+        assert flight.shared == 0
+
+
+class TestAsyncSingleFlight:
+    def test_concurrent_calls_share_result(self):
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def slow_call(value):
+            calls.append(value)
+            await asyncio.sleep(0.01)
+            return value
+
+        async def run():
+            return await asyncio.gather(*(flight.do('key', slow_call, n) for n in range(3)))
+
+        assert asyncio.run(run()) == [0, 0, 0]
+        assert calls == [0]
+        assert flight.shared == 2
+        assert len(flight) == 0
+
+    def test_concurrent_calls_share_exception(self):
+        flight = AsyncSingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise PermissionError('ERROR: Unauthorized')
+
+        async def run():
+            return await asyncio.gather(flight.do('key', fail), flight.do('key', fail), return_exceptions=True)
+
+        results = asyncio.run(run())
+        assert all(isinstance(result, PermissionError) for result in results)
+
+    def test_cancelled_waiter_does_not_cancel_call(self):
+        flight = AsyncSingleFlight()
+
+        async def slow_call():
+            await asyncio.sleep(0.01)
+            return 'done'
+
+        async def run():
+            first = asyncio.ensure_future(flight.do('key', slow_call))
+            second = asyncio.ensure_future(flight.do('key', slow_call))
+            await asyncio.sleep(0)
+            first.cancel()
+            return await second
+
+        assert asyncio.run(run()) == 'done'
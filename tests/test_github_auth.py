@@ -1,6 +1,30 @@
+import json
 import pytest
 from unittest.mock import patch, MagicMock
-from github_auth import GithubAuth
+import github_auth
+from github_auth import (
+    CachedResponse, GithubAuth, NotFoundError, RateLimiter, RateLimitError, configure_http, configure_rate_limit,
+    configure_response_cache, create_session, endpoint_template, get_rate_limit_delay,
+)
+
+
+@pytest.fixture(autouse=True)
+def reset_shared_state():
+    github_auth.configure_response_cache(None)
+    github_auth.configure_rate_limit(None)
+    yield
+    github_auth.configure_response_cache(None)
+    github_auth.configure_rate_limit(None)
+
+
+def make_json_response(body, status_code=200, headers=None):
+    """Return a response with a JSON body."""
+    response = MagicMock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    response.json.return_value = body
+    response.content = json.dumps(body).encode()
+    return response
 
 
 class TestGithubAuthInit:
@@ -17,8 +41,309 @@ class TestGithubAuthInit:
             GithubAuth(None)
 
 
+class TestSession:
+    def test_session_mounts_pooled_adapter(self):
+        http_session = create_session(pool_connections=2, pool_maxsize=7)
+        adapter = http_session.get_adapter('https://api.github.com')
+        assert adapter._pool_connections == 2
+        assert adapter._pool_maxsize == 7
+
+    def test_session_does_not_store_cookies(self):
+        http_session = create_session()
+        assert http_session.cookies.get_policy().allowed_domains() == ()
+
+    def test_configure_http_defaults(self):
+        configure_http(None)
+        adapter = github_auth.session.get_adapter('https://api.github.com')
+        assert adapter._pool_maxsize == 32
+        assert github_auth.timeout == (5.0, 10.0)
+
+    def test_configure_http_from_config(self):
+        configure_http({'github': {'http': {
+            'pool_connections': 4,
+            'pool_maxsize': 64,
+            'connect_timeout': 1,
+            'read_timeout': 2,
+        }}})
+        try:
+            adapter = github_auth.session.get_adapter('https://api.github.com')
+            assert adapter._pool_connections == 4
+            assert adapter._pool_maxsize == 64
+            assert github_auth.timeout == (1, 2)
+        finally:
+            configure_http(None)
+
+    def test_configure_api_url(self):
+        configure_http({'github': {'api_url': 'https://github.example.com/api/v3/'}})
+        try:
+            with patch.object(github_auth.session, 'get') as mock_get, \
+                    patch.object(github_auth.session, 'post') as mock_post:
+                mock_get.return_value = MagicMock(status_code=200, headers={'X-OAuth-Scopes': ''})
+                mock_post.return_value = make_graphql_response({'viewer': {'login': 'testuser'}})
+                auth = GithubAuth('token')
+                auth.get_user_info()
+                auth.get_headers()
+                auth._graphql('query', {})
+            assert [call.args[0] for call in mock_get.call_args_list] == [
+                'https://github.example.com/api/v3/user',
+                'https://github.example.com/api/v3',
+            ]
+            assert mock_post.call_args.args[0] == 'https://github.example.com/api/v3/graphql'
+        finally:
+            configure_http(None)
+        assert github_auth.api_url == 'https://api.github.com'
+
+    @patch('github_auth.session.get')
+    def test_requests_use_shared_session(self, mock_get):
+        mock_get.return_value = make_json_response([])
+
+        GithubAuth('token1').get_org_list()
+        GithubAuth('token2').get_org_list()
+
+        assert mock_get.call_count == 2
+
+    @patch('github_auth.session.get')
+    def test_prewarm_opens_pooled_connection(self, mock_get):
+        github_auth.prewarm()
+
+        mock_get.assert_called_once_with('https://api.github.com/rate_limit', timeout=github_auth.timeout)
+        mock_get.return_value.close.assert_called_once_with()
+
+
+class TestConditionalRequests:
+    @staticmethod
+    def make_response(status_code, body=None, etag=None):
+        return make_json_response(body, status_code, {'ETag': etag} if etag else {})
+
+    @patch('github_auth.session.get')
+    def test_replays_etag_and_serves_cached_body_on_304(self, mock_get):
+        mock_get.side_effect = [
+            self.make_response(200, {'login': 'testuser'}, etag='"abc"'),
+            self.make_response(304),
+        ]
+
+        auth = GithubAuth('token')
+        assert auth.get_user_info() == {'login': 'testuser'}
+        assert auth.get_user_info() == {'login': 'testuser'}
+
+        second_headers = mock_get.call_args_list[1].kwargs['headers']
+        assert second_headers == {'Authorization': 'Bearer token', 'If-None-Match': '"abc"'}
+        assert github_auth.response_cache.not_modified == 1
+        assert github_auth.response_cache.hits == 1
+
+    @patch('github_auth.session.get')
+    def test_caches_only_the_body_and_replayed_headers(self, mock_get):
+        mock_get.return_value = make_json_response([{'login': 'MyOrg'}], headers={
+            'ETag': '"abc"',
+            'Link': '<https://api.github.com/user/orgs?page=2>; rel="last"',
+            'X-OAuth-Scopes': 'read:org',
+            'Set-Cookie': 'session=secret',
+        })
+
+        auth = GithubAuth('token')
+        auth._request('/user/orgs')
+        cached = github_auth.response_cache.get(auth._cache_key('/user/orgs', None))
+
+        assert cached == CachedResponse(200, {
+            'ETag': '"abc"',
+            'Link': '<https://api.github.com/user/orgs?page=2>; rel="last"',
+            'X-OAuth-Scopes': 'read:org',
+        }, b'[{"login": "MyOrg"}]')
+        assert cached.json() == [{'login': 'MyOrg'}]
+
+    @patch('github_auth.session.get')
+    def test_changed_resource_replaces_cached_response(self, mock_get):
+        mock_get.side_effect = [
+            self.make_response(200, [{'login': 'OldOrg'}], etag='"v1"'),
+            self.make_response(200, [{'login': 'NewOrg'}], etag='"v2"'),
+            self.make_response(304),
+        ]
+
+        auth = GithubAuth('token')
+        auth.get_org_list()
+        assert auth.get_org_list() == [{'login': 'NewOrg'}]
+        assert auth.get_org_list() == [{'login': 'NewOrg'}]
+        assert mock_get.call_args_list[2].kwargs['headers']['If-None-Match'] == '"v2"'
+
+    @patch('github_auth.session.get')
+    def test_cache_is_per_token(self, mock_get):
+        mock_get.side_effect = [
+            self.make_response(200, {'login': 'user1'}, etag='"abc"'),
+            self.make_response(200, {'login': 'user2'}, etag='"abc"'),
+        ]
+
+        assert GithubAuth('token1').get_user_info() == {'login': 'user1'}
+        assert GithubAuth('token2').get_user_info() == {'login': 'user2'}
+        assert 'If-None-Match' not in mock_get.call_args_list[1].kwargs['headers']
+
+    @patch('github_auth.session.get')
+    def test_cache_is_per_page(self, mock_get):
+        mock_get.return_value = self.make_response(200, [], etag='"abc"')
+
+        auth = GithubAuth('token')
+        auth._request('/user/teams', params={'page': 1, 'per_page': 100})
+        auth._request('/user/teams', params={'page': 2, 'per_page': 100})
+        assert 'If-None-Match' not in mock_get.call_args_list[1].kwargs['headers']
+
+    @patch('github_auth.session.get')
+    def test_response_without_etag_is_not_cached(self, mock_get):
+        mock_get.return_value = self.make_response(200, {'login': 'testuser'})
+
+        auth = GithubAuth('token')
+        auth.get_user_info()
+        auth.get_user_info()
+        assert len(github_auth.response_cache) == 0
+
+    def test_configure_response_cache_defaults(self):
+        configure_response_cache(None)
+        assert github_auth.response_cache.ttl == 3600
+        assert github_auth.response_cache.max_entries == 5000
+
+    def test_configure_response_cache_from_config(self):
+        configure_response_cache({'cache': {'etag': {'ttl': 10, 'max_entries': 20}}})
+        try:
+            assert github_auth.response_cache.ttl == 10
+            assert github_auth.response_cache.max_entries == 20
+        finally:
+            configure_response_cache(None)
+
+
+def make_rate_limited_response(status_code, headers=None, message='API rate limit exceeded'):
+    response = MagicMock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    response.json.return_value = {'message': message}
+    return response
+
+
+class TestGetRateLimitDelay:
+    def test_success_is_not_rate_limited(self):
+        assert get_rate_limit_delay(make_rate_limited_response(200)) is None
+
+    def test_retry_after_header(self):
+        response = make_rate_limited_response(403, {'Retry-After': '30'})
+        assert get_rate_limit_delay(response) == 30.0
+
+    def test_invalid_retry_after_header(self):
+        response = make_rate_limited_response(429, {'Retry-After': 'soon'})
+        assert get_rate_limit_delay(response) == 60.0
+
+    @patch('github_auth.time.time', return_value=1000.0)
+    def test_exhausted_primary_limit(self, mock_time):
+        response = make_rate_limited_response(403, {
+            'X-RateLimit-Remaining': '0',
+            'X-RateLimit-Reset': '1120',
+        })
+        assert get_rate_limit_delay(response) == 120.0
+
+    def test_secondary_limit_message(self):
+        response = make_rate_limited_response(
+            403, message='You have exceeded a secondary rate limit'
+        )
+        assert get_rate_limit_delay(response) == 60.0
+
+    def test_429_without_headers(self):
+        assert get_rate_limit_delay(make_rate_limited_response(429, message='')) == 60.0
+
+    def test_authorization_403_is_not_rate_limited(self):
+        response = make_rate_limited_response(403, {'X-RateLimit-Remaining': '4999'}, 'Must have admin rights')
+        assert get_rate_limit_delay(response) is None
+
+
+class TestRateLimiter:
+    def test_unknown_token_is_not_throttled(self):
+        limiter = RateLimiter()
+        assert limiter.retry_after('hash') == 0.0
+        assert limiter.remaining('hash') is None
+
+    def test_update_ignores_missing_headers(self):
+        limiter = RateLimiter()
+        limiter.update('hash', {})
+        assert limiter.remaining('hash') is None
+
+    @patch('github_auth.time.time', return_value=1000.0)
+    def test_tracks_remaining_and_reset(self, mock_time):
+        limiter = RateLimiter()
+        limiter.update('hash', {'X-RateLimit-Remaining': '10', 'X-RateLimit-Reset': '2000'})
+        assert limiter.remaining('hash') == 10
+        assert limiter.retry_after('hash') == 0.0
+
+        limiter.update('hash', {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': '1300'})
+        assert limiter.retry_after('hash') == 300.0
+
+    @patch('github_auth.time.time', return_value=1000.0)
+    def test_block(self, mock_time):
+        limiter = RateLimiter()
+        limiter.block('hash', 45)
+        assert limiter.retry_after('hash') == 45.0
+        assert limiter.retry_after('other') == 0.0
+
+    def test_clear(self):
+        limiter = RateLimiter()
+        limiter.block('hash', 45)
+        limiter.clear()
+        assert limiter.retry_after('hash') == 0.0
+
+    def test_configure_rate_limit(self):
+        configure_rate_limit({'github': {'rate_limit': {'max_retries': 5, 'max_retry_wait': 1}}})
+        try:
+            assert github_auth.rate_limiter.max_retries == 5
+            assert github_auth.rate_limiter.max_retry_wait == 1
+        finally:
+            configure_rate_limit(None)
+        assert github_auth.rate_limiter.max_retries == 2
+
+
+class TestRateLimitedRequests:
+    @patch('github_auth.time.sleep')
+    @patch('github_auth.session.get')
+    def test_retries_short_rate_limit(self, mock_get, mock_sleep):
+        success = MagicMock()
+        success.status_code = 200
+        success.headers = {}
+        success.json.return_value = {'login': 'testuser'}
+        mock_get.side_effect = [make_rate_limited_response(429, {'Retry-After': '2'}), success]
+
+        assert GithubAuth('token').get_user_info() == {'login': 'testuser'}
+        mock_sleep.assert_called_once_with(2.0)
+
+    @patch('github_auth.time.sleep')
+    @patch('github_auth.session.get')
+    def test_gives_up_after_max_retries(self, mock_get, mock_sleep):
+        mock_get.return_value = make_rate_limited_response(403, {'Retry-After': '0'})
+
+        with pytest.raises(RateLimitError, match='Rate limited') as exc_info:
+            GithubAuth('token').get_user_info()
+
+        assert mock_get.call_count == 3
+        assert [c.args[0] for c in mock_sleep.call_args_list] == [1.0, 2.0]
+        assert exc_info.value.retry_after == 0.0
+
+    @patch('github_auth.time.sleep')
+    @patch('github_auth.session.get')
+    def test_long_delay_fails_fast_and_blocks_token(self, mock_get, mock_sleep):
+        mock_get.return_value = make_rate_limited_response(403, {'Retry-After': '600'})
+
+        with pytest.raises(RateLimitError) as exc_info:
+            GithubAuth('token').get_user_info()
+        assert exc_info.value.retry_after == 600.0
+        mock_sleep.assert_not_called()
+
+        with pytest.raises(RateLimitError):
+            GithubAuth('token').get_org_list()
+        assert mock_get.call_count == 1
+
+    @patch('github_auth.session.get')
+    def test_rate_limit_is_not_a_permission_error(self, mock_get):
+        mock_get.return_value = make_rate_limited_response(403, {'Retry-After': '600'})
+
+        with pytest.raises(Exception) as exc_info:
+            GithubAuth('token').get_user_info()
+        assert not isinstance(exc_info.value, PermissionError)
+
+
 class TestGetHeaders:
-    @patch('github_auth.requests.get')
+    @patch('github_auth.session.get')
     def test_get_headers_success(self, mock_get):
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -30,10 +355,11 @@ class TestGetHeaders:
         assert headers == {'X-OAuth-Scopes': 'user:email, read:org'}
         mock_get.assert_called_once_with(
             'https://api.github.com',
-            headers={'Authorization': 'Bearer token'}
+            headers={'Authorization': 'Bearer token'},
+            timeout=(5.0, 10.0)
         )
 
-    @patch('github_auth.requests.get')
+    @patch('github_auth.session.get')
     def test_get_headers_non_200(self, mock_get):
         mock_response = MagicMock()
         mock_response.status_code = 500
@@ -45,7 +371,7 @@ class TestGetHeaders:
 
 
 class TestGetScopes:
-    @patch('github_auth.requests.get')
+    @patch('github_auth.session.get')
     def test_get_scopes_success(self, mock_get):
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -56,7 +382,7 @@ class TestGetScopes:
         scopes = auth.get_scopes()
         assert scopes == ['user:email', 'read:org']
 
-    @patch('github_auth.requests.get')
+    @patch('github_auth.session.get')
     def test_get_scopes_missing_header(self, mock_get):
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -68,8 +394,97 @@ class TestGetScopes:
             auth.get_scopes()
 
 
+class TestScopesFromResponses:
+    @patch('github_auth.session.get')
+    def test_scopes_read_from_user_response(self, mock_get):
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.headers = {'X-OAuth-Scopes': 'user:email, read:org'}
+        mock_response.json.return_value = {'login': 'testuser'}
+        mock_get.return_value = mock_response
+
+        auth = GithubAuth('token')
+        auth.get_user_info()
+        auth.validate_scopes()
+
+        mock_get.assert_called_once()
+        assert mock_get.call_args.args[0] == 'https://api.github.com/user'
+
+    @patch('github_auth.session.get')
+    def test_missing_scope_from_user_response(self, mock_get):
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.headers = {'X-OAuth-Scopes': 'user:email'}
+        mock_response.json.return_value = {'login': 'testuser'}
+        mock_get.return_value = mock_response
+
+        auth = GithubAuth('token')
+        auth.get_user_info()
+        with pytest.raises(PermissionError, match="Token does not have permission for 'read:org' scope"):
+            auth.validate_scopes()
+
+    @patch('github_auth.session.get')
+    def test_missing_scope_from_error_response(self, mock_get):
+        mock_response = MagicMock()
+        mock_response.status_code = 404
+        mock_response.headers = {'X-OAuth-Scopes': 'read:org'}
+        mock_get.return_value = mock_response
+
+        auth = GithubAuth('token')
+        with pytest.raises(PermissionError, match="'user:email' scope"):
+            auth.call_github_api_endpoint('/user/emails')
+        assert auth.scope_headers is mock_response.headers
+
+    @patch('github_auth.session.get')
+    def test_error_response_with_every_scope(self, mock_get):
+        mock_response = MagicMock()
+        mock_response.status_code = 404
+        mock_response.headers = {'X-OAuth-Scopes': 'user:email, read:org'}
+        mock_get.return_value = mock_response
+
+        auth = GithubAuth('token')
+        with pytest.raises(NotFoundError):
+            auth.call_github_api_endpoint('/user/emails')
+
+    @patch('github_auth.session.get')
+    def test_scopes_from_not_modified_response(self, mock_get):
+        first = MagicMock()
+        first.status_code = 200
+        first.headers = {'ETag': '"abc"', 'X-OAuth-Scopes': 'user:email'}
+        first.json.return_value = {'login': 'testuser'}
+        first.content = b'{"login": "testuser"}'
+        not_modified = MagicMock()
+        not_modified.status_code = 304
+        not_modified.headers = {'X-OAuth-Scopes': 'user:email, read:org'}
+        mock_get.side_effect = [first, not_modified]
+
+        GithubAuth('token').get_user_info()
+        auth = GithubAuth('token')
+        auth.get_user_info()
+        auth.validate_scopes()
+        assert auth.scope_headers is not_modified.headers
+
+    @patch('github_auth.session.get')
+    def test_scopes_from_cached_response_when_304_omits_them(self, mock_get):
+        first = MagicMock()
+        first.status_code = 200
+        first.headers = {'ETag': '"abc"', 'X-OAuth-Scopes': 'user:email, read:org'}
+        first.json.return_value = {'login': 'testuser'}
+        first.content = b'{"login": "testuser"}'
+        not_modified = MagicMock()
+        not_modified.status_code = 304
+        not_modified.headers = {}
+        mock_get.side_effect = [first, not_modified]
+
+        GithubAuth('token').get_user_info()
+        auth = GithubAuth('token')
+        auth.get_user_info()
+        assert auth.get_scopes() == ['user:email', 'read:org']
+        assert mock_get.call_count == 2
+
+
 class TestValidateScopes:
-    @patch('github_auth.requests.get')
+    @patch('github_auth.session.get')
     def test_validate_scopes_all_present(self, mock_get):
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -79,7 +494,7 @@ class TestValidateScopes:
         auth = GithubAuth('token')
         auth.validate_scopes()
 
-    @patch('github_auth.requests.get')
+    @patch('github_auth.session.get')
     def test_validate_scopes_missing_scope(self, mock_get):
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -90,7 +505,7 @@ class TestValidateScopes:
         with pytest.raises(PermissionError, match="read:org"):
             auth.validate_scopes()
 
-    @patch('github_auth.requests.get')
+    @patch('github_auth.session.get')
     def test_validate_scopes_all_missing(self, mock_get):
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -103,7 +518,7 @@ class TestValidateScopes:
 
 
 class TestCallGithubApiEndpoint:
-    @patch('github_auth.requests.get')
+    @patch('github_auth.session.get')
     def test_call_endpoint_200(self, mock_get):
         mock_response = MagicMock()
         mock_response.status_code = 200
@@ -115,10 +530,12 @@ class TestCallGithubApiEndpoint:
         assert result == {'login': 'testuser'}
         mock_get.assert_called_once_with(
             'https://api.github.com/user',
-            headers={'Authorization': 'Bearer token'}
+            headers={'Authorization': 'Bearer token'},
+            params=None,
+            timeout=(5.0, 10.0)
         )
 
-    @patch('github_auth.requests.get')
+    @patch('github_auth.session.get')
     def test_call_endpoint_401(self, mock_get):
         mock_response = MagicMock()
         mock_response.status_code = 401
@@ -129,7 +546,7 @@ class TestCallGithubApiEndpoint:
         with pytest.raises(PermissionError, match='Unauthorized.*Bad credentials'):
             auth.call_github_api_endpoint('/user')
 
-    @patch('github_auth.requests.get')
+    @patch('github_auth.session.get')
     def test_call_endpoint_401_non_json(self, mock_get):
         mock_response = MagicMock()
         mock_response.status_code = 401
@@ -140,18 +557,18 @@ class TestCallGithubApiEndpoint:
         with pytest.raises(PermissionError, match='Unauthorized'):
             auth.call_github_api_endpoint('/user')
 
-    @patch('github_auth.requests.get')
+    @patch('github_auth.session.get')
     def test_call_endpoint_403(self, mock_get):
         mock_response = MagicMock()
         mock_response.status_code = 403
-        mock_response.json.return_value = {'message': 'Rate limit exceeded'}
+        mock_response.json.return_value = {'message': 'Resource not accessible by integration'}
         mock_get.return_value = mock_response
 
         auth = GithubAuth('token')
-        with pytest.raises(PermissionError, match='Forbidden.*Rate limit exceeded'):
+        with pytest.raises(PermissionError, match='Forbidden.*Resource not accessible'):
             auth.call_github_api_endpoint('/user')
 
-    @patch('github_auth.requests.get')
+    @patch('github_auth.session.get')
     def test_call_endpoint_other_error(self, mock_get):
         mock_response = MagicMock()
         mock_response.status_code = 502
@@ -164,20 +581,20 @@ class TestCallGithubApiEndpoint:
 
 
 class TestApiEndpointWrappers:
-    @patch.object(GithubAuth, 'call_github_api_endpoint')
-    def test_get_email_addresses(self, mock_call):
-        mock_call.return_value = [{'email': 'test@example.com'}]
+    @patch.object(GithubAuth, '_get_pages')
+    def test_get_email_addresses(self, mock_pages):
+        mock_pages.return_value = [{'email': 'test@example.com'}]
         auth = GithubAuth('token')
         result = auth.get_email_addresses()
-        mock_call.assert_called_once_with('/user/emails')
+        assert mock_pages.call_args.args == ('/user/emails',)
         assert result == [{'email': 'test@example.com'}]
 
-    @patch.object(GithubAuth, 'call_github_api_endpoint')
-    def test_get_org_list(self, mock_call):
-        mock_call.return_value = [{'login': 'myorg'}]
+    @patch.object(GithubAuth, '_get_pages')
+    def test_get_org_list(self, mock_pages):
+        mock_pages.return_value = [{'login': 'myorg'}]
         auth = GithubAuth('token')
         result = auth.get_org_list()
-        mock_call.assert_called_once_with('/user/orgs')
+        mock_pages.assert_called_once_with('/user/orgs', done=None)
         assert result == [{'login': 'myorg'}]
 
     @patch.object(GithubAuth, 'call_github_api_endpoint')
@@ -189,69 +606,114 @@ class TestApiEndpointWrappers:
         assert result == {'login': 'testuser'}
 
 
+class TestRequestMetrics:
+    @patch('github_auth.session.get')
+    def test_requests_are_recorded_per_endpoint(self, mock_get):
+        from prometheus_client import REGISTRY
+        before = REGISTRY.get_sample_value(
+            'github_oauth_proxy_github_request_duration_seconds_count', {'endpoint': '/user/emails'}
+        ) or 0
+        mock_get.return_value = make_json_response([], headers={'X-RateLimit-Remaining': '4321'})
+
+        GithubAuth('token').get_email_addresses()
+
+        assert REGISTRY.get_sample_value(
+            'github_oauth_proxy_github_request_duration_seconds_count', {'endpoint': '/user/emails'}
+        ) == before + 1
+        assert REGISTRY.get_sample_value(
+            'github_oauth_proxy_github_responses_total', {'endpoint': '/user/emails', 'status': '200'}
+        ) >= 1
+        assert REGISTRY.get_sample_value('github_oauth_proxy_github_rate_limit_remaining') == 4321
+
+
 class TestGetUserTeams:
-    @patch('github_auth.requests.get')
+    @patch('github_auth.session.get')
     def test_returns_empty_list_when_no_config(self, mock_get):
         auth = GithubAuth('token')
         assert auth.get_user_teams(None) == []
 
-    @patch('github_auth.requests.get')
+    @patch('github_auth.session.get')
     def test_returns_empty_list_when_no_github_key(self, mock_get):
         auth = GithubAuth('token')
         assert auth.get_user_teams({}) == []
 
-    @patch('github_auth.requests.get')
+    @patch('github_auth.session.get')
     def test_returns_empty_list_when_no_required_key(self, mock_get):
         auth = GithubAuth('token')
         assert auth.get_user_teams({'github': {}}) == []
 
-    @patch('github_auth.requests.get')
+    @patch('github_auth.session.get')
     def test_returns_empty_list_when_no_org_key(self, mock_get):
         auth = GithubAuth('token')
         assert auth.get_user_teams({'github': {'required': {}}}) == []
 
-    @patch('github_auth.requests.get')
+    @patch('github_auth.session.get')
     def test_returns_teams_for_matching_org(self, mock_get):
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = [
+        mock_get.return_value = make_json_response([
             {'slug': 'backend', 'organization': {'login': 'MyOrg'}},
             {'slug': 'frontend', 'organization': {'login': 'OtherOrg'}},
             {'slug': 'devops', 'organization': {'login': 'myorg'}},
-        ]
-        mock_empty = MagicMock()
-        mock_empty.status_code = 200
-        mock_empty.json.return_value = []
-        mock_get.side_effect = [mock_response, mock_empty]
+        ])
 
         config = {'github': {'required': {'org': 'MyOrg'}}}
         auth = GithubAuth('token')
         teams = auth.get_user_teams(config)
         assert teams == ['backend', 'devops']
+        # Without a Link header there is only one page, so no empty page is requested
+        mock_get.assert_called_once()
 
-    @patch('github_auth.requests.get')
-    def test_handles_pagination(self, mock_get):
-        page1 = MagicMock()
-        page1.status_code = 200
-        page1.json.return_value = [
-            {'slug': 'team1', 'organization': {'login': 'MyOrg'}},
-        ]
-        page2 = MagicMock()
-        page2.status_code = 200
-        page2.json.return_value = [
-            {'slug': 'team2', 'organization': {'login': 'MyOrg'}},
-        ]
-        page3 = MagicMock()
-        page3.status_code = 200
-        page3.json.return_value = []
-        mock_get.side_effect = [page1, page2, page3]
+    @patch('github_auth.session.get')
+    def test_fetches_remaining_pages_from_link_header(self, mock_get):
+        link = '<https://api.github.com/user/teams?page=2&per_page=100>; rel="next", ' \
+               '<https://api.github.com/user/teams?page=3&per_page=100>; rel="last"'
+
+        def get_page(url, headers, params, timeout):
+            page = params['page']
+            return make_json_response(
+                [{'slug': f'team{page}', 'organization': {'login': 'MyOrg'}}],
+                headers={'Link': link} if page == 1 else {},
+            )
+
+        mock_get.side_effect = get_page
 
         config = {'github': {'required': {'org': 'MyOrg'}}}
         auth = GithubAuth('token')
         teams = auth.get_user_teams(config)
-        assert teams == ['team1', 'team2']
+        assert teams == ['team1', 'team2', 'team3']
+        assert sorted(call.kwargs['params']['page'] for call in mock_get.call_args_list) == [1, 2, 3]
+        assert all(call.kwargs['params']['per_page'] == 100 for call in mock_get.call_args_list)
+
+    @patch('github_auth.session.get')
+    def test_cancelled_client_stops_paging(self, mock_get):
+        from concurrent.futures import CancelledError
+        auth = GithubAuth('token')
+
+        def get_page(url, headers, params, timeout):
+            # The login is denied while the first page is in flight
+            auth.cancelled.set()
+            return make_json_response(
+                [{'slug': 'team1', 'organization': {'login': 'MyOrg'}}],
+                headers={'Link': '<https://api.github.com/user/teams?page=3>; rel="last"'},
+            )
+
+        mock_get.side_effect = get_page
+
+        with pytest.raises(CancelledError, match='/user/teams cancelled'):
+            auth.get_user_teams({'github': {'required': {'org': 'MyOrg'}}})
+        mock_get.assert_called_once()
+
+    @patch('github_auth.session.get')
+    def test_page_error_is_raised(self, mock_get):
+        first = make_json_response([], headers={'Link': '<https://api.github.com/user/teams?page=2>; rel="last"'})
+        failed = MagicMock(status_code=401, headers={})
+        failed.json.return_value = {'message': 'Bad credentials'}
+        mock_get.side_effect = [first, failed]
+
+        config = {'github': {'required': {'org': 'MyOrg'}}}
+        with pytest.raises(PermissionError, match='Unauthorized'):
+            GithubAuth('token').get_user_teams(config)
 
-    @patch('github_auth.requests.get')
+    @patch('github_auth.session.get')
     def test_raises_on_non_200(self, mock_get):
         mock_response = MagicMock()
         mock_response.status_code = 401
@@ -263,7 +725,7 @@ class TestGetUserTeams:
         with pytest.raises(PermissionError, match='Unauthorized'):
             auth.get_user_teams(config)
 
-    @patch('github_auth.requests.get')
+    @patch('github_auth.session.get')
     def test_raises_on_server_error(self, mock_get):
         mock_response = MagicMock()
         mock_response.status_code = 500
@@ -273,3 +735,360 @@ class TestGetUserTeams:
         auth = GithubAuth('token')
         with pytest.raises(RuntimeError, match='ERROR: 500'):
             auth.get_user_teams(config)
+
+
+def make_page_getter(pages, requested):
+    """Answer ``session.get`` with ``pages``, announcing the last one on page 1."""
+    def get_page(url, headers, params, timeout):
+        page = params['page']
+        requested.append(page)
+        return make_json_response(
+            pages[page - 1],
+            headers={'Link': f'<{url}?page={len(pages)}>; rel="last"'} if page == 1 else {},
+        )
+
+    return get_page
+
+
+class TestGetOrgList:
+    @patch('github_auth.session.get')
+    def test_fetches_every_page_without_required_org(self, mock_get):
+        requested = []
+        mock_get.side_effect = make_page_getter([[{'login': 'A'}], [{'login': 'B'}], [{'login': 'C'}]], requested)
+
+        orgs = GithubAuth('token').get_org_list()
+
+        assert orgs == [{'login': 'A'}, {'login': 'B'}, {'login': 'C'}]
+        assert sorted(requested) == [1, 2, 3]
+        assert all(call.kwargs['params']['per_page'] == 100 for call in mock_get.call_args_list)
+
+    @patch('github_auth.session.get')
+    def test_stops_after_first_page_with_required_org(self, mock_get):
+        requested = []
+        mock_get.side_effect = make_page_getter([[{'login': 'myorg'}], [{'login': 'B'}]], requested)
+
+        config = {'github': {'required': {'org': 'MyOrg'}}}
+        assert GithubAuth('token').get_org_list(config) == [{'login': 'myorg'}]
+        assert requested == [1]
+
+    @patch('github_auth.session.get')
+    def test_stops_once_required_org_is_found(self, mock_get):
+        requested = []
+        pages = [[{'login': 'A'}], [{'login': 'MyOrg'}], [{'login': 'C'}]]
+        mock_get.side_effect = make_page_getter(pages, requested)
+
+        config = {'github': {'required': {'org': 'MyOrg'}}}
+        orgs = GithubAuth('token').get_org_list(config)
+
+        assert {'login': 'MyOrg'} in orgs
+        assert orgs[0] == {'login': 'A'}
+
+    @patch('github_auth.session.get')
+    def test_missing_required_org_reads_every_page(self, mock_get):
+        requested = []
+        mock_get.side_effect = make_page_getter([[{'login': 'A'}], [{'login': 'B'}]], requested)
+
+        config = {'github': {'required': {'org': 'MyOrg'}}}
+        assert GithubAuth('token').get_org_list(config) == [{'login': 'A'}, {'login': 'B'}]
+        assert sorted(requested) == [1, 2]
+
+
+class TestGetOrgMembership:
+    @patch('github_auth.session.get')
+    def test_active_membership(self, mock_get):
+        mock_get.return_value = MagicMock(status_code=200, headers={})
+        mock_get.return_value.json.return_value = {'state': 'active', 'organization': {'login': 'MyOrg'}}
+
+        assert GithubAuth('token').get_org_membership('MyOrg') is True
+        assert mock_get.call_args.args[0] == 'https://api.github.com/user/memberships/orgs/MyOrg'
+
+    @patch('github_auth.session.get')
+    def test_pending_membership(self, mock_get):
+        mock_get.return_value = MagicMock(status_code=200, headers={})
+        mock_get.return_value.json.return_value = {'state': 'pending'}
+
+        assert GithubAuth('token').get_org_membership('MyOrg') is False
+
+    @patch('github_auth.session.get')
+    def test_not_a_member(self, mock_get):
+        mock_get.return_value = MagicMock(status_code=404, headers={})
+
+        assert GithubAuth('token').get_org_membership('MyOrg') is False
+
+    @patch('github_auth.session.get')
+    def test_not_found_is_a_runtime_error(self, mock_get):
+        mock_get.return_value = MagicMock(status_code=404, headers={})
+
+        with pytest.raises(RuntimeError, match='ERROR: 404'):
+            GithubAuth('token').get_user_info()
+
+
+class TestOrgDirectoryEndpoints:
+    @patch('github_auth.session.get')
+    def test_get_org_members_reads_every_page(self, mock_get):
+        requested = []
+        mock_get.side_effect = make_page_getter([[{'login': 'alice'}], [{'login': 'bob'}]], requested)
+
+        assert GithubAuth('token').get_org_members('MyOrg') == ['alice', 'bob']
+        assert mock_get.call_args.args[0] == 'https://api.github.com/orgs/MyOrg/members'
+        assert sorted(requested) == [1, 2]
+
+    @patch('github_auth.session.get')
+    def test_get_org_teams(self, mock_get):
+        mock_get.return_value = make_json_response([
+            {'slug': 'backend', 'parent': {'slug': 'engineering'}},
+            {'slug': 'engineering', 'parent': None},
+        ])
+
+        assert GithubAuth('token').get_org_teams('MyOrg') == {'backend': 'engineering', 'engineering': None}
+        assert mock_get.call_args.args[0] == 'https://api.github.com/orgs/MyOrg/teams'
+
+    @patch('github_auth.session.get')
+    def test_get_team_members(self, mock_get):
+        mock_get.return_value = make_json_response([{'login': 'alice'}])
+
+        assert GithubAuth('token').get_team_members('MyOrg', 'backend') == ['alice']
+        assert mock_get.call_args.args[0] == 'https://api.github.com/orgs/MyOrg/teams/backend/members'
+
+    @patch('github_auth.session.post')
+    def test_get_direct_team_members_reads_every_page(self, mock_post):
+        def members_page(logins, end_cursor=None):
+            return make_graphql_response({'organization': {'team': {'members': {
+                'nodes': [{'login': login} for login in logins],
+                'pageInfo': {'hasNextPage': end_cursor is not None, 'endCursor': end_cursor},
+            }}}})
+
+        mock_post.side_effect = [members_page(['alice'], end_cursor='m1'), members_page(['bob'])]
+
+        assert GithubAuth('token').get_direct_team_members('MyOrg', 'engineering') == ['alice', 'bob']
+        variables = [c.kwargs['json']['variables'] for c in mock_post.call_args_list]
+        assert variables == [
+            {'org': 'MyOrg', 'team': 'engineering', 'memberCursor': None},
+            {'org': 'MyOrg', 'team': 'engineering', 'memberCursor': 'm1'},
+        ]
+        assert 'membership: IMMEDIATE' in mock_post.call_args.kwargs['json']['query']
+
+    @pytest.mark.parametrize('data', [{'organization': None}, {'organization': {'team': None}}])
+    @patch('github_auth.session.post')
+    def test_get_direct_team_members_of_invisible_team(self, mock_post, data):
+        mock_post.return_value = make_graphql_response(data)
+
+        assert GithubAuth('token').get_direct_team_members('MyOrg', 'engineering') == []
+
+    @patch('github_auth.metrics.observe_github_request')
+    @patch('github_auth.session.get')
+    def test_team_names_are_not_metric_labels(self, mock_get, mock_observe):
+        mock_get.return_value = make_json_response([{'login': 'alice'}])
+
+        GithubAuth('token').get_team_members('MyOrg', 'backend')
+
+        assert mock_observe.call_args.args[0] == '/orgs/:org/teams/:team/members'
+
+    @pytest.mark.parametrize('endpoint, template', [
+        ('/user/teams', '/user/teams'),
+        ('/user/memberships/orgs/MyOrg', '/user/memberships/orgs/:org'),
+        ('/orgs/MyOrg/members', '/orgs/:org/members'),
+        ('/orgs/MyOrg/teams', '/orgs/:org/teams'),
+        ('/orgs/MyOrg/teams/backend/members', '/orgs/:org/teams/:team/members'),
+    ])
+    def test_endpoint_template(self, endpoint, template):
+        assert endpoint_template(endpoint) == template
+
+
+class TestGetEmailAddresses:
+    @patch('github_auth.session.get')
+    def test_stops_at_primary_email(self, mock_get):
+        requested = []
+        pages = [[{'email': 'me@example.com', 'primary': True}], [{'email': 'me@other.com'}]]
+        mock_get.side_effect = make_page_getter(pages, requested)
+
+        assert GithubAuth('token').get_email_addresses() == [{'email': 'me@example.com', 'primary': True}]
+        assert requested == [1]
+
+    @patch('github_auth.session.get')
+    def test_reads_pages_until_required_domain(self, mock_get):
+        requested = []
+        pages = [
+            [{'email': 'me@example.com', 'primary': True}],
+            [{'email': 'me@corp.com', 'primary': False}],
+        ]
+        mock_get.side_effect = make_page_getter(pages, requested)
+
+        config = {'github': {'required': {'email': {'domain': 'Corp.com'}}}}
+        emails = GithubAuth('token').get_email_addresses(config)
+
+        assert emails == pages[0] + pages[1]
+        assert sorted(requested) == [1, 2]
+
+    @patch('github_auth.session.get')
+    def test_stops_when_first_page_has_primary_and_domain(self, mock_get):
+        requested = []
+        pages = [[{'email': 'me@corp.com', 'primary': True}], [{'email': 'me@example.com'}]]
+        mock_get.side_effect = make_page_getter(pages, requested)
+
+        config = {'github': {'required': {'email': {'domain': 'corp.com'}}}}
+        assert GithubAuth('token').get_email_addresses(config) == pages[0]
+        assert requested == [1]
+
+    @patch('github_auth.session.get')
+    def test_email_requirement_without_domain(self, mock_get):
+        requested = []
+        mock_get.side_effect = make_page_getter([[{'email': None, 'primary': True}]], requested)
+
+        config = {'github': {'required': {'email': {}}}}
+        assert GithubAuth('token').get_email_addresses(config) == [{'email': None, 'primary': True}]
+
+
+def make_graphql_response(data, headers=None, errors=None):
+    response = MagicMock()
+    response.status_code = 200
+    response.headers = headers or {}
+    payload = {'data': data}
+    if errors:
+        payload['errors'] = errors
+    response.json.return_value = payload
+    return response
+
+
+def viewer_page(logins, end_cursor=None):
+    return {'viewer': {
+        'login': 'testuser',
+        'name': 'Test User',
+        'organizations': {
+            'nodes': [{'login': login} for login in logins],
+            'pageInfo': {'hasNextPage': end_cursor is not None, 'endCursor': end_cursor},
+        },
+    }}
+
+
+def teams_page(slugs, end_cursor=None):
+    return {'organization': {'teams': {
+        'nodes': [{'slug': slug} for slug in slugs],
+        'pageInfo': {'hasNextPage': end_cursor is not None, 'endCursor': end_cursor},
+    }}}
+
+
+class TestGraphqlProfile:
+    @patch('github_auth.session.post')
+    def test_profile_without_required_org(self, mock_post):
+        mock_post.return_value = make_graphql_response(
+            viewer_page(['MyOrg']), {'X-OAuth-Scopes': 'user:email, read:org'}
+        )
+
+        auth = GithubAuth('token')
+        info, orgs, teams = auth.get_graphql_profile(None)
+
+        assert info == {'login': 'testuser', 'name': 'Test User'}
+        assert orgs == [{'login': 'MyOrg'}]
+        assert teams == []
+        mock_post.assert_called_once()
+        assert mock_post.call_args.args[0] == 'https://api.github.com/graphql'
+        assert mock_post.call_args.kwargs['json']['variables'] == {'orgCursor': None}
+        auth.validate_scopes()
+
+    @patch('github_auth.session.post')
+    def test_paginates_orgs_and_teams(self, mock_post):
+        mock_post.side_effect = [
+            make_graphql_response(viewer_page(['OrgA'], end_cursor='c1')),
+            make_graphql_response(viewer_page(['MyOrg'])),
+            make_graphql_response(teams_page(['backend'], end_cursor='t1')),
+            make_graphql_response(teams_page(['devops'])),
+        ]
+
+        config = {'github': {'required': {'org': 'MyOrg'}}}
+        info, orgs, teams = GithubAuth('token').get_graphql_profile(config)
+
+        assert orgs == [{'login': 'OrgA'}, {'login': 'MyOrg'}]
+        assert teams == ['backend', 'devops']
+        variables = [c.kwargs['json']['variables'] for c in mock_post.call_args_list]
+        assert variables == [
+            {'orgCursor': None},
+            {'orgCursor': 'c1'},
+            {'org': 'MyOrg', 'login': 'testuser', 'teamCursor': None},
+            {'org': 'MyOrg', 'login': 'testuser', 'teamCursor': 't1'},
+        ]
+
+    @patch('github_auth.session.post')
+    def test_stops_paging_orgs_at_required_org(self, mock_post):
+        mock_post.side_effect = [
+            make_graphql_response(viewer_page(['myorg'], end_cursor='c1')),
+            make_graphql_response(teams_page(['backend'])),
+        ]
+
+        config = {'github': {'required': {'org': 'MyOrg'}}}
+        info, orgs, teams = GithubAuth('token').get_graphql_profile(config)
+
+        assert orgs == [{'login': 'myorg'}]
+        assert teams == ['backend']
+        variables = [c.kwargs['json']['variables'] for c in mock_post.call_args_list]
+        assert variables == [
+            {'orgCursor': None},
+            {'org': 'MyOrg', 'login': 'testuser', 'teamCursor': None},
+        ]
+
+    @patch('github_auth.session.post')
+    def test_invisible_org_has_no_teams(self, mock_post):
+        mock_post.side_effect = [
+            make_graphql_response(viewer_page([])),
+            make_graphql_response({'organization': None}, errors=[{'type': 'NOT_FOUND', 'message': 'Not found'}]),
+        ]
+
+        config = {'github': {'required': {'org': 'MyOrg'}}}
+        assert GithubAuth('token').get_graphql_profile(config)[2] == []
+
+    @patch('github_auth.session.post')
+    def test_query_without_data_raises(self, mock_post):
+        response = MagicMock()
+        response.status_code = 200
+        response.headers = {}
+        response.json.return_value = {'errors': [{'message': 'Something went wrong'}]}
+        mock_post.return_value = response
+
+        with pytest.raises(RuntimeError, match='GraphQL: Something went wrong'):
+            GithubAuth('token').get_graphql_profile(None)
+
+    @patch('github_auth.session.post')
+    def test_unauthorized(self, mock_post):
+        response = MagicMock()
+        response.status_code = 401
+        response.headers = {}
+        response.json.return_value = {'message': 'Bad credentials'}
+        mock_post.return_value = response
+
+        with pytest.raises(PermissionError, match='Unauthorized'):
+            GithubAuth('token').get_graphql_profile(None)
+
+    @patch('github_auth.time.sleep')
+    @patch('github_auth.session.post')
+    def test_retries_rate_limit(self, mock_post, mock_sleep):
+        mock_post.side_effect = [
+            make_rate_limited_response(403, {'Retry-After': '1'}),
+            make_graphql_response(viewer_page([])),
+        ]
+
+        assert GithubAuth('token').get_graphql_profile(None)[0]['login'] == 'testuser'
+
+    @patch('github_auth.session.post')
+    @patch('github_auth.session.get')
+    def test_matches_rest_output(self, mock_get, mock_post):
+        mock_get.side_effect = [
+            make_json_response({'login': 'testuser', 'name': 'Test User', 'id': 1}),
+            make_json_response([{'login': 'MyOrg', 'id': 2}]),
+            make_json_response([{'slug': 'backend', 'organization': {'login': 'MyOrg'}}]),
+            make_json_response([]),
+        ]
+        mock_post.side_effect = [
+            make_graphql_response(viewer_page(['MyOrg'])),
+            make_graphql_response(teams_page(['backend'])),
+        ]
+
+        config = {'github': {'required': {'org': 'MyOrg'}}}
+        auth = GithubAuth('token')
+        rest_info = auth.get_user_info()
+        rest_orgs = auth.get_org_list()
+        rest_teams = auth.get_user_teams(config)
+        info, orgs, teams = auth.get_graphql_profile(config)
+
+        assert info['login'] == rest_info['login'] and info['name'] == rest_info['name']
+        assert [org['login'] for org in orgs] == [org['login'] for org in rest_orgs]
+        assert teams == rest_teams
@@ -0,0 +1,155 @@
+from unittest.mock import patch
+
+from prometheus_client import REGISTRY
+
+import metrics
+from cache import TTLCache
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class TestCacheCollector:
+    def test_exports_registered_cache_stats(self):
+        cache = TTLCache(ttl=60, max_entries=10)
+        cache.set('key', 'value')
+        cache.get('key')
+        cache.get('missing')
+        metrics.register_cache('test', lambda: cache)
+
+        try:
+            assert sample('github_oauth_proxy_cache_hits_total', cache='test') == 1
+            assert sample('github_oauth_proxy_cache_misses_total', cache='test') == 1
+            assert sample('github_oauth_proxy_cache_hit_ratio', cache='test') == 0.5
+            assert sample('github_oauth_proxy_cache_entries', cache='test') == 1
+            assert sample('github_oauth_proxy_cache_bytes', cache='test') == cache.bytes > 0
+        finally:
+            del metrics.cache_collector.caches['test']
+
+    def test_skips_memory_of_external_caches(self, tmp_path):
+        from cache import SqliteCache
+        cache = SqliteCache(str(tmp_path / 'cache.db'), ttl=60, max_entries=10)
+        metrics.register_cache('test', lambda: cache)
+
+        try:
+            assert REGISTRY.get_sample_value('github_oauth_proxy_cache_bytes', {'cache': 'test'}) is None
+        finally:
+            del metrics.cache_collector.caches['test']
+
+    def test_skips_entries_of_redis_caches(self):
+        import fakeredis
+        from cache import RedisCache
+        cache = RedisCache(ttl=60, max_entries=10, client=fakeredis.FakeRedis())
+        cache.set('key', 'value')
+        metrics.register_cache('test', lambda: cache)
+
+        try:
+            with patch.object(cache._client, 'scan_iter') as mock_scan:
+                assert REGISTRY.get_sample_value('github_oauth_proxy_cache_entries', {'cache': 'test'}) is None
+                assert sample('github_oauth_proxy_cache_hit_ratio', cache='test') == 0
+            mock_scan.assert_not_called()
+        finally:
+            del metrics.cache_collector.caches['test']
+
+    def test_exports_not_modified_of_response_caches(self):
+        from cache import ResponseCache
+        cache = ResponseCache(ttl=60, max_entries=10)
+        cache.record_not_modified()
+        metrics.register_cache('test', lambda: cache)
+        metrics.register_cache('other', lambda: TTLCache(ttl=60, max_entries=10))
+
+        try:
+            assert sample('github_oauth_proxy_cache_not_modified_total', cache='test') == 1
+            assert REGISTRY.get_sample_value('github_oauth_proxy_cache_not_modified_total', {'cache': 'other'}) is None
+        finally:
+            del metrics.cache_collector.caches['test']
+            del metrics.cache_collector.caches['other']
+
+    def test_reads_the_current_cache(self):
+        caches = [TTLCache(ttl=60, max_entries=10)]
+        metrics.register_cache('test', lambda: caches[0])
+
+        try:
+            caches[0] = TTLCache(ttl=60, max_entries=10)
+            caches[0].set('key', 'value')
+            assert sample('github_oauth_proxy_cache_entries', cache='test') == 1
+        finally:
+            del metrics.cache_collector.caches['test']
+
+
+class TestGithubRequests:
+    def test_observe_github_request(self):
+        before = sample('github_oauth_proxy_github_request_duration_seconds_count', endpoint='/test')
+        metrics.observe_github_request('/test', 200, 0.02, '4999')
+        metrics.observe_github_request('/test', 304, 0.01, None)
+
+        assert sample('github_oauth_proxy_github_request_duration_seconds_count', endpoint='/test') == before + 2
+        assert sample('github_oauth_proxy_github_responses_total', endpoint='/test', status='304') >= 1
+        assert sample('github_oauth_proxy_github_rate_limit_remaining') == 4999
+
+    def test_ignores_invalid_rate_limit_header(self):
+        metrics.observe_github_request('/test', 200, 0.02, '42')
+        metrics.observe_github_request('/test', 200, 0.02, 'invalid')
+        assert sample('github_oauth_proxy_github_rate_limit_remaining') == 42
+
+
+class TestInfoRequests:
+    def test_tracks_in_flight_latency_and_status(self):
+        in_flight = sample('github_oauth_proxy_info_requests_in_flight')
+        count = sample('github_oauth_proxy_info_request_duration_seconds_count')
+        responses = sample('github_oauth_proxy_info_responses_total', status='418')
+
+        started = metrics.start_info_request()
+        assert sample('github_oauth_proxy_info_requests_in_flight') == in_flight + 1
+        metrics.finish_info_request(started, 418)
+
+        assert sample('github_oauth_proxy_info_requests_in_flight') == in_flight
+        assert sample('github_oauth_proxy_info_request_duration_seconds_count') == count + 1
+        assert sample('github_oauth_proxy_info_responses_total', status='418') == responses + 1
+
+
+class TestRender:
+    def test_render_prometheus_text(self):
+        body, content_type = metrics.render()
+        assert content_type.startswith('text/plain')
+        assert b'# TYPE github_oauth_proxy_info_request_duration_seconds histogram' in body
+
+
+class TestStartup:
+    def test_observe_startup(self):
+        metrics.observe_startup({'config': 0.25, 'setup': 0.5})
+
+        assert sample('github_oauth_proxy_startup_duration_seconds', phase='config') == 0.25
+        assert sample('github_oauth_proxy_startup_duration_seconds', phase='setup') == 0.5
+
+
+class TestDirectory:
+    def test_observe_directory_sync(self):
+        ok = sample('github_oauth_proxy_directory_syncs_total', result='ok')
+        errors = sample('github_oauth_proxy_directory_syncs_total', result='error')
+
+        metrics.observe_directory_sync(1.5, 42)
+        metrics.observe_directory_sync(0.5, None)
+
+        assert sample('github_oauth_proxy_directory_syncs_total', result='ok') == ok + 1
+        assert sample('github_oauth_proxy_directory_syncs_total', result='error') == errors + 1
+        assert sample('github_oauth_proxy_directory_members') == 42
+
+    def test_register_directory(self):
+        metrics.register_directory(lambda: 12.5)
+        assert sample('github_oauth_proxy_directory_age_seconds') == 12.5
+
+
+class TestGithubEvents:
+    def test_observe_github_event(self):
+        applied = sample('github_oauth_proxy_github_events_total', event='team', result='applied')
+        metrics.observe_github_event('team', 'applied')
+        assert sample('github_oauth_proxy_github_events_total', event='team', result='applied') == applied + 1
+
+    def test_unknown_events_share_a_label(self):
+        other = sample('github_oauth_proxy_github_events_total', event='other', result='rejected')
+        metrics.observe_github_event('made-up', 'rejected')
+
+        assert sample('github_oauth_proxy_github_events_total', event='other', result='rejected') == other + 1
+        assert sample('github_oauth_proxy_github_events_total', event='made-up', result='rejected') == 0
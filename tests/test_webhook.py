@@ -32,6 +32,13 @@ class TestGetArgs:
             assert args.port == 9000
             assert args.host == '127.0.0.1'
 
+    def test_precompile_config_flag(self):
+        from webhook import get_args
+        with patch('sys.argv', ['webhook.py']):
+            assert get_args().precompile_config is False
+        with patch('sys.argv', ['webhook.py', '--precompile-config']):
+            assert get_args().precompile_config is True
+
 
 class TestLoadConfig:
     def test_load_config_file_exists(self):
@@ -56,6 +63,101 @@ class TestLoadConfig:
         assert webhook.config == {'github': {'required': {'org': 'MyOrg'}}}
 
 
+class TestPrecompiledConfig:
+    @pytest.fixture
+    def config_dir(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / 'config.yml').write_text('github:\n  required:\n    org: MyOrg\n')
+        return tmp_path
+
+    def test_precompile_writes_json(self, config_dir):
+        from webhook import precompile_config
+        assert precompile_config() == {'github': {'required': {'org': 'MyOrg'}}}
+
+        compiled = json.loads((config_dir / 'config.compiled.json').read_text())
+        assert compiled['config'] == {'github': {'required': {'org': 'MyOrg'}}}
+        assert not (config_dir / 'config.compiled.json.tmp').exists()
+
+    def test_precompile_without_config(self, tmp_path, monkeypatch):
+        from webhook import precompile_config
+        monkeypatch.chdir(tmp_path)
+        assert precompile_config() is None
+        assert not (tmp_path / 'config.compiled.json').exists()
+
+    def test_precompile_validates_config(self, config_dir):
+        from webhook import precompile_config
+        (config_dir / 'config.yml').write_text('github:\n  api: soap\n')
+        with pytest.raises(ValueError):
+            precompile_config()
+        assert not (config_dir / 'config.compiled.json').exists()
+
+    def test_load_prefers_up_to_date_precompiled_config(self, config_dir):
+        from webhook import load_config, precompile_config
+        precompile_config()
+        compiled = json.loads((config_dir / 'config.compiled.json').read_text())
+        compiled['config'] = {'github': {'required': {'org': 'FromJson'}}}
+        (config_dir / 'config.compiled.json').write_text(json.dumps(compiled))
+
+        with patch('yaml.safe_load') as mock_safe_load:
+            assert load_config() == {'github': {'required': {'org': 'FromJson'}}}
+        mock_safe_load.assert_not_called()
+
+    def test_load_ignores_stale_precompiled_config(self, config_dir):
+        from webhook import load_config, precompile_config
+        precompile_config()
+        (config_dir / 'config.yml').write_text('github:\n  required:\n    org: OtherOrg\n')
+
+        assert load_config() == {'github': {'required': {'org': 'OtherOrg'}}}
+
+    def test_load_ignores_invalid_precompiled_config(self, config_dir):
+        from webhook import load_config
+        (config_dir / 'config.compiled.json').write_text('not json')
+
+        assert load_config() == {'github': {'required': {'org': 'MyOrg'}}}
+
+
+class TestStartup:
+    def test_get_prewarm(self):
+        from webhook import get_prewarm
+        assert get_prewarm(None) is False
+        assert get_prewarm({'github': {}}) is False
+        assert get_prewarm({'github': {'prewarm': True}}) is True
+
+    @patch('webhook.github_auth.prewarm')
+    def test_prewarm_connections(self, mock_prewarm):
+        from webhook import prewarm_connections
+        prewarm_connections()
+        mock_prewarm.assert_called_once_with()
+
+    @patch('webhook.github_auth.prewarm', side_effect=OSError('unreachable'))
+    def test_prewarm_failure_is_logged(self, mock_prewarm):
+        import webhook
+        with patch.object(webhook.app.logger, 'warning') as mock_warning:
+            webhook.prewarm_connections()
+        mock_warning.assert_called_once()
+
+    def test_module_prewarms_when_configured(self):
+        import importlib
+        import webhook
+        from prometheus_client import REGISTRY
+        yaml_content = 'github:\n  prewarm: true\n'
+        with patch('builtins.open', mock_open(read_data=yaml_content)), \
+                patch('github_auth.prewarm') as mock_prewarm:
+            importlib.reload(webhook)
+        mock_prewarm.assert_called_once_with()
+        assert REGISTRY.get_sample_value(
+            'github_oauth_proxy_startup_duration_seconds', {'phase': 'prewarm'}) is not None
+
+    def test_report_startup(self):
+        import webhook
+        from prometheus_client import REGISTRY
+        with patch.object(webhook.app.logger, 'info') as mock_info:
+            webhook.report_startup({'config': 0.002, 'setup': 0.001})
+        assert 'config 2.0 ms' in mock_info.call_args[0][0] % mock_info.call_args[0][1:]
+        assert REGISTRY.get_sample_value(
+            'github_oauth_proxy_startup_duration_seconds', {'phase': 'config'}) == 0.002
+
+
 class TestPing:
     def test_ping(self, client):
         response = client.get('/')
@@ -64,6 +166,25 @@ class TestPing:
         assert data['status'] == 'ok'
 
 
+class TestMetrics:
+    def test_metrics_endpoint(self, client):
+        response = client.get('/metrics')
+        assert response.status_code == 200
+        assert response.content_type.startswith('text/plain')
+        assert b'github_oauth_proxy_cache_hit_ratio{cache="profile"}' in response.data
+        assert b'github_oauth_proxy_cache_hit_ratio{cache="etag"}' in response.data
+
+    def test_info_requests_are_recorded(self, client):
+        from prometheus_client import REGISTRY
+        before = REGISTRY.get_sample_value('github_oauth_proxy_info_responses_total', {'status': '401'}) or 0
+
+        client.get('/info')
+        client.get('/')
+
+        assert REGISTRY.get_sample_value('github_oauth_proxy_info_responses_total', {'status': '401'}) == before + 1
+        assert REGISTRY.get_sample_value('github_oauth_proxy_info_requests_in_flight') == 0
+
+
 class TestNotFound:
     def test_404(self, client):
         response = client.get('/nonexistent')
@@ -101,21 +222,67 @@ class TestValidateConfig:
         with pytest.raises(KeyError):
             validate_config(config)
 
+    def test_invalid_profile_cache_backend(self):
+        from webhook import validate_config
+        with pytest.raises(ValueError, match='cache.profile.backend'):
+            validate_config({'cache': {'profile': {'backend': 'memcached'}}})
+
+
+class TestGetApiMode:
+    def test_default_is_rest(self):
+        from webhook import get_api_mode
+        assert get_api_mode(None) == 'rest'
+        assert get_api_mode({'github': {}}) == 'rest'
+
+    def test_configured_mode(self):
+        from webhook import get_api_mode
+        assert get_api_mode({'github': {'api': 'graphql'}}) == 'graphql'
+
+    def test_invalid_mode_rejected(self):
+        from webhook import validate_config
+        with pytest.raises(ValueError, match='github.api'):
+            validate_config({'github': {'api': 'soap'}})
+
+
+class TestOrgCheck:
+    def test_default_is_list(self):
+        from webhook import get_membership_org, get_org_check
+        assert get_org_check(None) == 'list'
+        assert get_membership_org({'github': {'required': {'org': 'MyOrg'}}}) is None
+
+    def test_membership_mode(self):
+        from webhook import get_membership_org, get_org_check
+        config = {'github': {'org_check': 'membership', 'required': {'org': 'MyOrg'}}}
+        assert get_org_check(config) == 'membership'
+        assert get_membership_org(config) == 'MyOrg'
+
+    def test_membership_mode_needs_rest_and_required_org(self):
+        from webhook import get_membership_org
+        assert get_membership_org({'github': {'org_check': 'membership'}}) is None
+        assert get_membership_org({'github': {
+            'api': 'graphql', 'org_check': 'membership', 'required': {'org': 'MyOrg'},
+        }}) is None
+
+    def test_invalid_org_check_rejected(self):
+        from webhook import validate_config
+        with pytest.raises(ValueError, match='github.org_check'):
+            validate_config({'github': {'org_check': 'search'}})
+
 
 class TestValidateOrg:
     def test_valid_org(self):
         from webhook import validate_org
         orgs = [{'login': 'MyOrg'}, {'login': 'OtherOrg'}]
-        assert validate_org(orgs, 'MyOrg') is True
+        assert validate_org(orgs, 'myorg') is True
 
     def test_invalid_org(self):
         from webhook import validate_org
         orgs = [{'login': 'OtherOrg'}]
-        assert validate_org(orgs, 'MyOrg') is False
+        assert validate_org(orgs, 'myorg') is False
 
     def test_empty_orgs(self):
         from webhook import validate_org
-        assert validate_org([], 'MyOrg') is False
+        assert validate_org([], 'myorg') is False
 
 
 class TestValidateEmailDomain:
@@ -175,6 +342,45 @@ class TestValidatePrimaryEmail:
         assert validate_primary_email(emails, 'example.com') is False
 
 
+class TestGetRequirementChecks:
+    def test_no_requirements(self):
+        from webhook import get_requirement_checks
+        assert get_requirement_checks(None) == []
+        assert get_requirement_checks({'github': {'required': {'email': {}}}}) == []
+
+    def test_checks_name_their_source(self):
+        from webhook import get_requirement_checks
+        config = {'github': {'required': {'org': 'MyOrg', 'email': {'domain': 'example.com'}}}}
+        assert [source for source, _ in get_requirement_checks(config)] == ['orgs', 'emails']
+
+    def test_checks_bind_lowercased_requirements(self):
+        from webhook import get_requirement_checks, run_requirement_checks
+        config = {'github': {'required': {'org': 'MyOrg', 'email': {
+            'domain': 'Example.COM', 'domain_required_as_primary': True,
+        }}}}
+        checks = get_requirement_checks(config)
+
+        assert [check.keywords for _, check in checks] == [{'org_key': 'myorg'}, {'domain_key': 'example.com'}]
+        run_requirement_checks(checks, {
+            'info': {'login': 'testuser'},
+            'orgs': [{'login': 'MYORG'}],
+            'emails': [{'email': 'user@example.com', 'primary': True}],
+        })
+
+    def test_checks_wait_for_the_profile(self):
+        from webhook import get_requirement_checks, run_requirement_checks
+        checks = get_requirement_checks({'github': {'required': {'org': 'MyOrg'}}})
+        run_requirement_checks(checks, {'orgs': []})
+
+        with pytest.raises(PermissionError, match='not a member of MyOrg'):
+            run_requirement_checks(checks, {'info': {'login': 'testuser'}, 'orgs': []})
+
+    def test_checks_skip_missing_data(self):
+        from webhook import get_requirement_checks, run_requirement_checks
+        checks = get_requirement_checks({'github': {'required': {'email': {'domain': 'example.com'}}}})
+        run_requirement_checks(checks, {'info': {'login': 'testuser'}, 'orgs': []})
+
+
 class TestValidateAuthRequirements:
     def test_no_config(self):
         from webhook import validate_auth_requirements
@@ -258,6 +464,169 @@ class TestGetUsername:
             webhook.config = original_config
 
 
+class TestCompiledConfig:
+    def test_defaults_without_config(self):
+        from webhook import compile_config
+        compiled = compile_config(None)
+        assert compiled.api_mode == 'rest'
+        assert compiled.required_org is None
+        assert compiled.email_domain is None
+        assert compiled.checks == ()
+        assert dict(compiled.username_mapping) == {}
+
+    def test_values_are_resolved(self):
+        from webhook import compile_config
+        compiled = compile_config({
+            'github': {'required': {'org': 'MyOrg', 'email': {
+                'domain': 'Example.COM', 'domain_required_as_primary': True,
+            }}},
+            'spinnaker': {'username_mapping': {'githubuser': 'mapped'}},
+        })
+        assert compiled.required_org == 'myorg'
+        assert compiled.email_domain == 'example.com'
+        assert compiled.domain_required_as_primary is True
+        assert [source for source, _ in compiled.checks] == ['orgs', 'emails']
+        assert compiled.username_mapping['githubuser'] == 'mapped'
+
+    def test_is_immutable(self):
+        from webhook import compile_config
+        compiled = compile_config({'spinnaker': {'username_mapping': {'a': 'b'}}})
+        with pytest.raises(AttributeError):
+            compiled.required_org = 'other'
+        with pytest.raises(TypeError):
+            compiled.username_mapping['c'] = 'd'
+
+    def test_recompiled_when_config_is_replaced(self, app):
+        import webhook
+        assert webhook.get_settings().required_org is None
+        webhook.config = {'github': {'required': {'org': 'MyOrg'}}}
+        assert webhook.get_settings().required_org == 'myorg'
+        assert webhook.get_settings() is webhook.get_settings()
+
+
+class TestConfigReload:
+    @pytest.fixture
+    def config_dir(self, app, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        return tmp_path
+
+    def test_reload_interval(self):
+        from webhook import get_config_reload_interval
+        assert get_config_reload_interval(None) == 5
+        assert get_config_reload_interval({'reload_interval': 0}) == 0
+
+    def test_reload_applies_new_config(self, config_dir):
+        import webhook
+        (config_dir / 'config.yml').write_text('spinnaker:\n  username_mapping:\n    githubuser: mapped\n')
+
+        assert webhook.reload_config() is True
+        assert webhook.get_username('githubuser') == 'mapped'
+
+    def test_invalid_config_is_ignored(self, config_dir):
+        import webhook
+        webhook.config = {'github': {'required': {'org': 'MyOrg'}}}
+        (config_dir / 'config.yml').write_text('github:\n  api: soap\n')
+
+        assert webhook.reload_config() is False
+        assert webhook.config == {'github': {'required': {'org': 'MyOrg'}}}
+
+    def test_unreadable_config_is_ignored(self, config_dir):
+        import webhook
+        webhook.config = {'github': {'required': {'org': 'MyOrg'}}}
+        (config_dir / 'config.yml').mkdir()
+
+        assert webhook.reload_config() is False
+        assert webhook.get_settings().required_org == 'myorg'
+
+    @pytest.mark.parametrize('content', ['', '---\n', '{}\n'])
+    def test_empty_config_is_ignored(self, config_dir, content):
+        import webhook
+        webhook.config = {'github': {'required': {'org': 'MyOrg', 'email': {'domain': 'example.com'}}}}
+        watcher = webhook.ConfigWatcher('config.yml', 1)
+        (config_dir / 'config.yml').write_text(content)
+
+        with patch('webhook.time.monotonic', return_value=watcher._next_check + 0.5):
+            assert watcher.check() is False
+        assert webhook.get_settings().required_org == 'myorg'
+        assert webhook.get_settings().checks
+
+    def test_changed_requirements_clear_cached_profiles(self, config_dir):
+        import webhook
+        webhook.profile_cache.set('token', {'username': 'testuser'})
+        webhook.denied_cache.set('denied', 'not a member')
+        (config_dir / 'config.yml').write_text('github:\n  required:\n    org: MyOrg\n')
+
+        assert webhook.reload_config() is True
+        assert webhook.profile_cache.get('token') is None
+        assert webhook.denied_cache.get('denied') is None
+
+    def test_unrelated_changes_keep_cached_profiles(self, config_dir):
+        import webhook
+        webhook.profile_cache.set('token', {'username': 'testuser'})
+        (config_dir / 'config.yml').write_text('reload_interval: 30\n')
+
+        assert webhook.reload_config() is True
+        assert webhook.profile_cache.get('token') == {'username': 'testuser'}
+        assert webhook.config_watcher.interval == 30
+
+    def test_watcher_reloads_changed_file(self, config_dir):
+        import webhook
+        watcher = webhook.ConfigWatcher('config.yml', 1)
+        assert watcher.loaded is None
+        (config_dir / 'config.yml').write_text('github:\n  required:\n    org: MyOrg\n')
+
+        with patch('webhook.time.monotonic', return_value=watcher._next_check - 0.5):
+            assert watcher.check() is False
+        with patch('webhook.time.monotonic', return_value=watcher._next_check + 0.5):
+            assert watcher.check() is True
+        assert webhook.get_settings().required_org == 'myorg'
+
+        with patch('webhook.time.monotonic', return_value=watcher._next_check + 0.5):
+            assert watcher.check() is False
+
+    def test_removed_file_keeps_config(self, config_dir):
+        import webhook
+        (config_dir / 'config.yml').write_text('github:\n  required:\n    org: MyOrg\n')
+        webhook.reload_config()
+        watcher = webhook.ConfigWatcher('config.yml', 1)
+        (config_dir / 'config.yml').unlink()
+
+        with patch('webhook.time.monotonic', return_value=watcher._next_check + 0.5):
+            assert watcher.check() is False
+        assert watcher.loaded is None
+        assert webhook.get_settings().required_org == 'myorg'
+
+    def test_watcher_disabled(self, config_dir):
+        import webhook
+        watcher = webhook.ConfigWatcher('config.yml', 0)
+        (config_dir / 'config.yml').write_text('github:\n  required:\n    org: MyOrg\n')
+        assert watcher.due() is False
+        assert watcher.check() is False
+
+    def test_watcher_due(self, config_dir):
+        import webhook
+        watcher = webhook.ConfigWatcher('config.yml', 1)
+
+        with patch('webhook.time.monotonic', return_value=watcher._next_check - 0.5):
+            assert watcher.due() is False
+        with patch('webhook.time.monotonic', return_value=watcher._next_check + 0.5):
+            assert watcher.due() is True
+
+    def test_one_check_at_a_time(self, config_dir):
+        import webhook
+        watcher = webhook.ConfigWatcher('config.yml', 1)
+        (config_dir / 'config.yml').write_text('github:\n  required:\n    org: MyOrg\n')
+
+        with watcher._lock, patch('webhook.time.monotonic', return_value=watcher._next_check + 0.5):
+            assert watcher.check() is False
+
+    def test_requests_check_for_changes(self, client):
+        import webhook
+        with patch.object(webhook.config_watcher, 'check') as mock_check:
+            client.get('/')
+        mock_check.assert_called_once()
+
+
 class TestWebhookHandler:
     def test_missing_authorization_header(self, client):
         response = client.get('/info')
@@ -375,14 +744,1154 @@ class TestWebhookHandler:
         assert data['roles'] == ''
 
 
+class TestCreateProfileCache:
+    def test_defaults_without_config(self):
+        from cache import ProfileCache
+        from webhook import create_profile_cache
+        cache = create_profile_cache(None)
+        assert isinstance(cache, ProfileCache)
+        assert cache.ttl == 60
+        assert cache.max_entries == 10000
+        assert cache.max_bytes == 64 * 1024 * 1024
+
+    def test_defaults_without_profile_section(self):
+        from webhook import create_profile_cache
+        cache = create_profile_cache({'cache': None})
+        assert cache.ttl == 60
+
+    def test_configured_values(self):
+        from webhook import create_profile_cache
+        cache = create_profile_cache({'cache': {'profile': {'ttl': 5, 'max_entries': 3, 'max_bytes': 4096}}})
+        assert cache.ttl == 5
+        assert cache.max_entries == 3
+        assert cache.max_bytes == 4096
+
+    def test_sqlite_backend(self, tmp_path):
+        from cache import SqliteCache
+        from webhook import create_profile_cache
+        path = str(tmp_path / 'profiles.db')
+        cache = create_profile_cache({'cache': {'profile': {'backend': 'sqlite', 'path': path}}})
+        assert isinstance(cache, SqliteCache)
+        assert cache.path == path
+        assert cache.ttl == 60
+
+    def test_redis_backend(self):
+        from cache import RedisCache
+        from webhook import create_profile_cache
+        cache = create_profile_cache({'cache': {'profile': {
+            'backend': 'redis', 'url': 'redis://cache:6379/0', 'prefix': 'proxy:', 'max_stale': 0,
+        }}})
+        assert isinstance(cache, RedisCache)
+        assert cache.prefix == 'proxy:'
+        assert cache.max_stale == 0
+
+
+class TestCreateDeniedCache:
+    def test_defaults_without_config(self):
+        from webhook import create_denied_cache
+        cache = create_denied_cache(None)
+        assert cache.ttl == 30
+        assert cache.max_entries == 10000
+
+    def test_configured_values(self):
+        from webhook import create_denied_cache
+        cache = create_denied_cache({'cache': {'denied': {'ttl': 0, 'max_entries': 3}}})
+        assert cache.enabled is False
+        assert cache.max_entries == 3
+
+
+class TestCreateExecutor:
+    def test_default_max_workers(self):
+        from webhook import create_executor
+        executor = create_executor(None)
+        assert executor._max_workers == 16
+        executor.shutdown()
+
+    def test_configured_max_workers(self):
+        from webhook import create_executor
+        executor = create_executor({'github': {'max_workers': 4}})
+        assert executor._max_workers == 4
+        executor.shutdown()
+
+
+class TestGetUserInfoWithScopes:
+    def test_validates_scopes_after_user_call(self):
+        from webhook import get_user_info_with_scopes
+        mock_auth = MagicMock()
+        mock_auth.get_user_info.return_value = {'login': 'testuser'}
+
+        assert get_user_info_with_scopes(mock_auth) == {'login': 'testuser'}
+        assert [c[0] for c in mock_auth.method_calls] == ['get_user_info', 'validate_scopes']
+
+
+class TestFetchGithubData:
+    def test_returns_all_results(self, app):
+        import webhook
+        mock_auth = MagicMock()
+        mock_auth.get_user_info.return_value = {'login': 'testuser'}
+        mock_auth.get_org_list.return_value = [{'login': 'MyOrg'}]
+        mock_auth.get_email_addresses.return_value = [{'email': 'test@example.com'}]
+        mock_auth.get_user_teams.return_value = ['backend']
+
+        info, orgs, emails, teams = webhook.fetch_github_data(mock_auth)
+
+        assert info == {'login': 'testuser'}
+        assert orgs == [{'login': 'MyOrg'}]
+        assert emails == [{'email': 'test@example.com'}]
+        assert teams == ['backend']
+        mock_auth.validate_scopes.assert_called_once()
+        mock_auth.get_org_list.assert_called_once_with(webhook.config)
+        mock_auth.get_email_addresses.assert_called_once_with(webhook.config)
+        mock_auth.get_user_teams.assert_called_once_with(webhook.config)
+
+    def test_first_error_cancels_pending_calls(self, app):
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        import webhook
+        release = threading.Event()
+        mock_auth = MagicMock()
+        mock_auth.validate_scopes.side_effect = PermissionError('Missing scopes')
+        mock_auth.get_org_list.side_effect = lambda config: release.wait(5)
+
+        with patch('webhook.executor', ThreadPoolExecutor(max_workers=1)) as executor:
+            with pytest.raises(PermissionError, match='Missing scopes'):
+                webhook.fetch_github_data(mock_auth)
+            release.set()
+            executor.shutdown(wait=True)
+
+        mock_auth.get_email_addresses.assert_not_called()
+        mock_auth.get_user_teams.assert_not_called()
+
+    def test_failed_requirement_cancels_remaining_calls(self, app):
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        import webhook
+        release = threading.Event()
+        mock_auth = MagicMock()
+        mock_auth.get_user_info.return_value = {'login': 'testuser'}
+        mock_auth.get_org_list.return_value = [{'login': 'OtherOrg'}]
+        mock_auth.get_email_addresses.side_effect = lambda config: release.wait(5)
+        checks = webhook.get_requirement_checks({'github': {'required': {'org': 'MyOrg'}}})
+
+        with patch('webhook.executor', ThreadPoolExecutor(max_workers=1)) as executor:
+            with pytest.raises(PermissionError, match='not a member of MyOrg'):
+                webhook.fetch_github_data(mock_auth, checks)
+            release.set()
+            executor.shutdown(wait=True)
+
+        mock_auth.get_user_teams.assert_not_called()
+
+    def test_failure_tells_running_calls_to_stop(self, app):
+        import threading
+        import webhook
+        mock_auth = MagicMock()
+        mock_auth.cancelled = threading.Event()
+        mock_auth.get_user_info.return_value = {'login': 'testuser'}
+        mock_auth.get_org_list.return_value = [{'login': 'OtherOrg'}]
+        checks = webhook.get_requirement_checks({'github': {'required': {'org': 'MyOrg'}}})
+
+        webhook.fetch_github_data(mock_auth)
+        assert not mock_auth.cancelled.is_set()
+
+        with pytest.raises(PermissionError, match='not a member of MyOrg'):
+            webhook.fetch_github_data(mock_auth, checks)
+        assert mock_auth.cancelled.is_set()
+
+    def test_requirements_wait_for_the_profile(self, app):
+        import threading
+        import webhook
+        profile_requested = threading.Event()
+        release = threading.Event()
+        mock_auth = MagicMock()
+
+        def get_user_info():
+            profile_requested.set()
+            release.wait(5)
+            return {'login': 'testuser'}
+
+        def get_org_list(config):
+            # Return the organizations while the profile is still pending
+            profile_requested.wait(5)
+            release.set()
+            return []
+
+        mock_auth.get_user_info.side_effect = get_user_info
+        mock_auth.get_org_list.side_effect = get_org_list
+        checks = webhook.get_requirement_checks({'github': {'required': {'org': 'MyOrg'}}})
+
+        with pytest.raises(PermissionError, match='User testuser is not a member'):
+            webhook.fetch_github_data(mock_auth, checks)
+
+    def test_graphql_requirements(self, app):
+        import webhook
+        webhook.config = {'github': {'api': 'graphql'}}
+        mock_auth = MagicMock()
+        mock_auth.get_graphql_profile.return_value = ({'login': 'testuser'}, [], [])
+        mock_auth.get_email_addresses.return_value = [{'email': 'test@other.com', 'primary': True}]
+        checks = webhook.get_requirement_checks({'github': {'required': {'email': {'domain': 'example.com'}}}})
+
+        with pytest.raises(PermissionError, match='does not have a @example.com email'):
+            webhook.fetch_github_data(mock_auth, checks)
+
+    def test_membership_mode_skips_org_list(self, app):
+        import webhook
+        webhook.config = {'github': {'org_check': 'membership', 'required': {'org': 'MyOrg'}}}
+        mock_auth = MagicMock()
+        mock_auth.get_user_info.return_value = {'login': 'testuser'}
+        mock_auth.get_org_membership.return_value = True
+        mock_auth.get_email_addresses.return_value = []
+        mock_auth.get_user_teams.return_value = ['backend']
+
+        info, orgs, emails, teams = webhook.fetch_github_data(mock_auth, webhook.get_requirement_checks(webhook.config))
+
+        assert orgs == [{'login': 'MyOrg'}]
+        assert teams == ['backend']
+        mock_auth.get_org_membership.assert_called_once_with('MyOrg')
+        mock_auth.get_org_list.assert_not_called()
+
+    def test_membership_mode_rejects_non_members(self, app):
+        import webhook
+        webhook.config = {'github': {'org_check': 'membership', 'required': {'org': 'MyOrg'}}}
+        mock_auth = MagicMock()
+        mock_auth.get_user_info.return_value = {'login': 'testuser'}
+        mock_auth.get_org_membership.return_value = False
+
+        with pytest.raises(PermissionError, match='User testuser is not a member of MyOrg'):
+            webhook.fetch_github_data(mock_auth, webhook.get_requirement_checks(webhook.config))
+
+        assert webhook.fetch_github_data(mock_auth)[1] == []
+
+    def test_prefers_permission_error(self, app):
+        import webhook
+        mock_auth = MagicMock()
+
+        with patch('webhook.wait') as mock_wait:
+            failed_runtime = MagicMock()
+            failed_runtime.exception.return_value = RuntimeError('ERROR: 502')
+            failed_permission = MagicMock()
+            failed_permission.exception.return_value = PermissionError('ERROR: Unauthorized')
+            mock_wait.return_value = ([failed_runtime, failed_permission], set())
+            with pytest.raises(PermissionError, match='Unauthorized'):
+                webhook.fetch_github_data(mock_auth)
+
+    def test_graphql_mode(self, app):
+        import webhook
+        webhook.config = {'github': {'api': 'graphql', 'required': {'org': 'MyOrg'}}}
+        mock_auth = MagicMock()
+        mock_auth.get_graphql_profile.return_value = (
+            {'login': 'testuser', 'name': 'Test User'}, [{'login': 'MyOrg'}], ['backend']
+        )
+        mock_auth.get_email_addresses.return_value = [{'email': 'test@example.com'}]
+
+        info, orgs, emails, teams = webhook.fetch_github_data(mock_auth)
+
+        assert info == {'login': 'testuser', 'name': 'Test User'}
+        assert orgs == [{'login': 'MyOrg'}]
+        assert emails == [{'email': 'test@example.com'}]
+        assert teams == ['backend']
+        mock_auth.get_graphql_profile.assert_called_once_with(webhook.config)
+        mock_auth.validate_scopes.assert_called_once()
+        mock_auth.get_user_info.assert_not_called()
+        mock_auth.get_org_list.assert_not_called()
+        mock_auth.get_user_teams.assert_not_called()
+
+    @patch('webhook.GithubAuth')
+    def test_org_permission_error_returns_401(self, mock_auth_class, client):
+        mock_auth = MagicMock()
+        mock_auth.get_org_list.side_effect = PermissionError('ERROR: Forbidden')
+        mock_auth_class.return_value = mock_auth
+
+        response = client.get('/info', headers={'Authorization': 'Bearer test_token'})
+
+        assert response.status_code == 401
+        assert json.loads(response.data)['detail'] == 'ERROR: Forbidden'
+
+
+class TestProfileCaching:
+    @patch('webhook.validate_auth_requirements')
+    @patch('webhook.GithubAuth')
+    def test_repeat_login_served_from_cache(self, mock_auth_class, mock_validate, client):
+        mock_auth = MagicMock()
+        mock_auth.get_user_info.return_value = {'login': 'testuser', 'name': 'Test User'}
+        mock_auth.get_org_list.return_value = [{'login': 'MyOrg'}]
+        mock_auth.get_email_addresses.return_value = [
+            {'email': 'test@example.com', 'primary': True},
+        ]
+        mock_auth.get_user_teams.return_value = ['backend']
+        mock_auth_class.return_value = mock_auth
+
+        first = client.get('/info', headers={'Authorization': 'Bearer test_token'})
+        second = client.get('/info', headers={'Authorization': 'Bearer test_token'})
+
+        assert first.status_code == 200
+        assert second.status_code == 200
+        assert json.loads(first.data) == json.loads(second.data)
+        mock_auth.get_user_info.assert_called_once()
+        mock_auth.validate_scopes.assert_called_once()
+
+    @patch('webhook.validate_auth_requirements')
+    @patch('webhook.GithubAuth')
+    def test_cache_is_keyed_by_token_hash(self, mock_auth_class, mock_validate, client):
+        import webhook
+        from cache import hash_token
+        mock_auth = MagicMock()
+        mock_auth.get_user_info.return_value = {'login': 'testuser', 'name': 'Test User'}
+        mock_auth.get_org_list.return_value = []
+        mock_auth.get_email_addresses.return_value = []
+        mock_auth.get_user_teams.return_value = []
+        mock_auth_class.return_value = mock_auth
+
+        client.get('/info', headers={'Authorization': 'Bearer test_token'})
+
+        assert webhook.profile_cache.get(hash_token('test_token'))['username'] == 'testuser'
+        assert webhook.profile_cache.get('test_token') is None
+
+    @patch('webhook.GithubAuth')
+    def test_permission_error_evicts_cached_profile(self, mock_auth_class, client):
+        import webhook
+        from cache import hash_token
+        mock_auth = MagicMock()
+        mock_auth.validate_scopes.side_effect = PermissionError('ERROR: Unauthorized: (Bad credentials)')
+        mock_auth_class.return_value = mock_auth
+
+        with patch.object(webhook.profile_cache, 'delete') as mock_delete:
+            response = client.get('/info', headers={'Authorization': 'Bearer revoked_token'})
+
+        assert response.status_code == 401
+        mock_delete.assert_called_once_with(hash_token('revoked_token'))
+
+
+
+class TestConcurrentLogins:
+    @patch('webhook.GithubAuth')
+    def test_concurrent_logins_share_one_fetch(self, mock_auth_class, app):
+        import threading
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        import webhook
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_load_profile(github):
+            started.set()
+            release.wait(5)
+            return {'username': 'testuser'}
+
+        def login():
+            return app.test_client().get('/info', headers={'Authorization': 'Bearer test_token'})
+
+        with patch('webhook.load_profile', side_effect=slow_load_profile) as mock_load, \
+                ThreadPoolExecutor(max_workers=3) as pool:
+            leader = pool.submit(login)
+            started.wait(5)
+            waiters = [pool.submit(login) for _ in range(2)]
+            while webhook.profile_flight.shared < 2:
+                time.sleep(0.001)
+            release.set()
+            responses = [future.result() for future in [leader] + waiters]
+
+        assert [json.loads(response.data) for response in responses] == [{'username': 'testuser'}] * 3
+        mock_load.assert_called_once()
+
+
+class TestDeniedTokens:
+    @patch('webhook.GithubAuth')
+    def test_repeat_denied_login_skips_github(self, mock_auth_class, client):
+        import webhook
+        mock_auth = MagicMock()
+        mock_auth.validate_scopes.side_effect = PermissionError('ERROR: Unauthorized: (Bad credentials)')
+        mock_auth_class.return_value = mock_auth
+
+        first = client.get('/info', headers={'Authorization': 'Bearer revoked_token'})
+        second = client.get('/info', headers={'Authorization': 'Bearer revoked_token'})
+
+        assert first.status_code == 401
+        assert second.status_code == 401
+        assert json.loads(second.data) == json.loads(first.data)
+        mock_auth_class.assert_called_once()
+        assert webhook.denied_cache.stats()['hits'] == 1
+
+    def test_missing_scope_reported_by_first_failing_call(self, client):
+        import threading
+        release = threading.Event()
+        calls = []
+
+        def get(url, **kwargs):
+            calls.append(url)
+            if not url.endswith('/user/emails'):
+                # /user and the other calls answer only after the failure
+                release.wait(5)
+            response = MagicMock()
+            response.status_code = 404
+            response.headers = {'X-OAuth-Scopes': 'read:org'}
+            response.json.return_value = {'message': 'Not Found'}
+            return response
+
+        with patch('github_auth.session.get', side_effect=get):
+            first = client.get('/info', headers={'Authorization': 'Bearer narrow_token'})
+            emails = calls.count('https://api.github.com/user/emails')
+            second = client.get('/info', headers={'Authorization': 'Bearer narrow_token'})
+            release.set()
+
+        assert first.status_code == second.status_code == 401
+        assert "'user:email' scope" in json.loads(first.data)['detail']
+        assert json.loads(second.data) == json.loads(first.data)
+        assert calls.count('https://api.github.com/user/emails') == emails == 1
+
+    @patch('webhook.GithubAuth')
+    def test_denial_is_per_token(self, mock_auth_class, client):
+        import webhook
+        from cache import hash_token
+        webhook.denied_cache.set(hash_token('revoked_token'), 'ERROR: Unauthorized')
+        mock_auth_class.return_value.get_user_info.side_effect = PermissionError('ERROR: Forbidden')
+
+        response = client.get('/info', headers={'Authorization': 'Bearer other_token'})
+
+        assert json.loads(response.data)['detail'] == 'ERROR: Forbidden'
+        mock_auth_class.assert_called_once_with('other_token')
+
+
+class TestRateLimitedLogins:
+    @patch('webhook.GithubAuth')
+    def test_serves_stale_profile_while_rate_limited(self, mock_auth_class, client):
+        import webhook
+        from cache import hash_token
+        from github_auth import RateLimitError
+        webhook.profile_cache.set(hash_token('test_token'), {'username': 'testuser'})
+
+        mock_auth = MagicMock()
+        mock_auth.get_user_info.side_effect = RateLimitError('ERROR: Rate limited', 60)
+        mock_auth_class.return_value = mock_auth
+
+        with patch.object(webhook.profile_cache, 'get', return_value=None):
+            response = client.get('/info', headers={'Authorization': 'Bearer test_token'})
+
+        assert response.status_code == 200
+        assert json.loads(response.data) == {'username': 'testuser'}
+
+    @patch('webhook.GithubAuth')
+    def test_returns_429_without_cached_profile(self, mock_auth_class, client):
+        from github_auth import RateLimitError
+        mock_auth = MagicMock()
+        mock_auth.get_user_info.side_effect = RateLimitError('ERROR: Rate limited', 59.5)
+        mock_auth_class.return_value = mock_auth
+
+        response = client.get('/info', headers={'Authorization': 'Bearer test_token'})
+
+        assert response.status_code == 429
+        assert response.headers['Retry-After'] == '60'
+        data = json.loads(response.data)
+        assert data['msg'] == 'Too Many Requests'
+
+    def test_profile_cache_max_stale(self):
+        from webhook import create_profile_cache
+        assert create_profile_cache(None).max_stale == 600
+        assert create_profile_cache({'cache': {'profile': {'max_stale': 0}}}).max_stale == 0
+
+
+class TestStaleWhileRevalidate:
+    @pytest.fixture
+    def expired_profile(self, app):
+        import webhook
+        from cache import hash_token
+        webhook.config = {'cache': {'profile': {'stale_while_revalidate': 60}}}
+        webhook.profile_cache.set(hash_token('test_token'), {'username': 'olduser'})
+        with patch.object(webhook.profile_cache, 'get', return_value=None), \
+                patch.object(webhook.refresh_executor, 'submit') as mock_submit:
+            yield mock_submit
+
+    def test_window_defaults_to_disabled(self):
+        from webhook import get_stale_while_revalidate
+        assert get_stale_while_revalidate(None) == 0
+        assert get_stale_while_revalidate({'cache': {'profile': {'stale_while_revalidate': 30}}}) == 30
+
+    @patch('webhook.GithubAuth')
+    def test_serves_expired_profile_and_refreshes(self, mock_auth_class, expired_profile, client):
+        import webhook
+
+        response = client.get('/info', headers={'Authorization': 'Bearer test_token'})
+        client.get('/info', headers={'Authorization': 'Bearer test_token'})
+
+        assert response.status_code == 200
+        assert json.loads(response.data) == {'username': 'olduser'}
+        expired_profile.assert_called_once()
+        assert expired_profile.call_args.args[0] == webhook.refresh_profile
+        mock_auth_class.return_value.get_user_info.assert_not_called()
+
+    @patch('webhook.load_profile', return_value={'username': 'newuser'})
+    def test_refresh_replaces_profile(self, mock_load, expired_profile):
+        import webhook
+        from cache import hash_token
+        token_hash = hash_token('test_token')
+        assert webhook.claim_refresh(token_hash)
+
+        webhook.refresh_profile('test_token', token_hash)
+
+        assert webhook.profile_cache.get_stale(token_hash) == {'username': 'newuser'}
+        assert webhook.claim_refresh(token_hash)
+
+    @patch('webhook.load_profile', side_effect=PermissionError('ERROR: Unauthorized: (Bad credentials)'))
+    def test_revoked_token_is_evicted_on_refresh(self, mock_load, expired_profile, client):
+        import webhook
+        from cache import hash_token
+        webhook.refresh_profile('test_token', hash_token('test_token'))
+
+        response = client.get('/info', headers={'Authorization': 'Bearer test_token'})
+
+        assert webhook.profile_cache.get_stale(hash_token('test_token')) is None
+        assert response.status_code == 401
+        assert json.loads(response.data)['detail'] == 'ERROR: Unauthorized: (Bad credentials)'
+
+    @patch('webhook.load_profile', side_effect=RuntimeError('ERROR: Bad gateway'))
+    def test_failed_refresh_keeps_profile(self, mock_load, expired_profile):
+        import webhook
+        from cache import hash_token
+        webhook.refresh_profile('test_token', hash_token('test_token'))
+        assert webhook.profile_cache.get_stale(hash_token('test_token')) == {'username': 'olduser'}
+
+
+class TestPreRefresh:
+    @pytest.fixture
+    def refresher(self, app):
+        import webhook
+        webhook.pre_refresher = webhook.create_pre_refresher({'cache': {'profile': {'pre_refresh': {
+            'active_window': 3600, 'lead': 5, 'jitter': 0, 'max_tokens': 2,
+        }}}})
+        with patch('webhook.threading.Thread'):
+            yield webhook.pre_refresher
+
+    @staticmethod
+    def later():
+        import time
+        # Past every scheduled refresh, but within the active window
+        return time.monotonic() + 60
+
+    def test_disabled_by_default(self, app):
+        import webhook
+        assert webhook.pre_refresher.enabled is False
+        webhook.pre_refresher.seen('token', 'hash')
+        webhook.pre_refresher.schedule('hash')
+        assert webhook.pre_refresher.pop_due(self.later()) == []
+
+    def test_profile_is_due_before_expiry(self, refresher):
+        import time
+        refresher.seen('token', 'hash')
+        refresher.schedule('hash')
+        now = time.monotonic()
+
+        assert refresher.pop_due(now) == []
+        assert refresher.pop_due(now + 55) == [('token', 'hash')]
+        assert refresher.pop_due(now + 55) == []
+
+    def test_short_ttl_waits_half_of_it(self, refresher):
+        import time
+        import webhook
+        from cache import TTLCache
+        webhook.profile_cache = TTLCache(ttl=4, max_entries=10)
+        refresher.seen('token', 'hash')
+        refresher.schedule('hash')
+        now = time.monotonic()
+
+        assert refresher.pop_due(now + 1.9) == []
+        assert refresher.pop_due(now + 2.1) == [('token', 'hash')]
+
+    def test_unseen_token_is_not_scheduled(self, refresher):
+        refresher.schedule('hash')
+        assert refresher.pop_due(self.later()) == []
+
+    def test_rescheduled_profile_is_refreshed_once(self, refresher):
+        refresher.seen('token', 'hash')
+        refresher.schedule('hash')
+        refresher.schedule('hash')
+        assert refresher.pop_due(self.later()) == [('token', 'hash')]
+
+    def test_inactive_token_is_dropped(self, refresher):
+        import time
+        refresher.seen('token', 'hash')
+        refresher.schedule('hash')
+
+        assert refresher.pop_due(time.monotonic() + 3600) == []
+        refresher.schedule('hash')
+        assert refresher.pop_due(self.later()) == []
+
+    def test_least_recently_seen_token_is_dropped(self, refresher):
+        for n in range(3):
+            refresher.seen(f'token{n}', f'hash{n}')
+            refresher.schedule(f'hash{n}')
+
+        assert sorted(refresher.pop_due(self.later())) == [('token1', 'hash1'), ('token2', 'hash2')]
+
+    def test_forget_and_clear(self, refresher):
+        refresher.seen('token1', 'hash1')
+        refresher.schedule('hash1')
+        refresher.seen('token2', 'hash2')
+        refresher.schedule('hash2')
+
+        refresher.forget('hash1')
+        assert refresher.pop_due(self.later()) == [('token2', 'hash2')]
+
+        refresher.schedule('hash2')
+        refresher.clear()
+        assert refresher.pop_due(self.later()) == []
+
+    def test_budget_follows_rate_limit(self, refresher):
+        import github_auth
+        assert refresher.within_budget('unknown')
+
+        github_auth.rate_limiter.update('low', {'X-RateLimit-Remaining': '499', 'X-RateLimit-Reset': '0'})
+        github_auth.rate_limiter.update('high', {'X-RateLimit-Remaining': '500', 'X-RateLimit-Reset': '0'})
+        github_auth.rate_limiter.block('blocked', 60)
+
+        assert not refresher.within_budget('low')
+        assert refresher.within_budget('high')
+        assert not refresher.within_budget('blocked')
+
+    def test_refresh_due_submits_refreshes(self, refresher):
+        import webhook
+        refresher.seen('token1', 'hash1')
+        refresher.schedule('hash1')
+        refresher.seen('token2', 'hash2')
+        refresher.schedule('hash2')
+        assert webhook.claim_refresh('hash2')
+
+        with patch.object(webhook.refresh_executor, 'submit') as mock_submit, \
+                patch.object(refresher, 'within_budget', return_value=True):
+            assert refresher.refresh_due(self.later()) == 1
+
+        mock_submit.assert_called_once_with(webhook.refresh_profile, 'token1', 'hash1')
+
+    @patch('webhook.load_profile', return_value={'username': 'testuser'})
+    def test_logins_schedule_refreshes(self, mock_load, refresher, client):
+        from cache import hash_token
+        response = client.get('/info', headers={'Authorization': 'Bearer test_token'})
+
+        assert response.status_code == 200
+        assert refresher.pop_due(self.later()) == [('test_token', hash_token('test_token'))]
+
+    @patch('webhook.load_profile', side_effect=PermissionError('ERROR: Unauthorized: (Bad credentials)'))
+    def test_denied_token_is_forgotten(self, mock_load, refresher, client):
+        from cache import hash_token
+        refresher.seen('test_token', hash_token('test_token'))
+        refresher.schedule(hash_token('test_token'))
+
+        response = client.get('/info', headers={'Authorization': 'Bearer test_token'})
+
+        assert response.status_code == 401
+        assert refresher.pop_due(self.later()) == []
+
+    @patch('webhook.load_profile', return_value={'username': 'testuser'})
+    def test_refresh_thread(self, mock_load, app):
+        import threading
+        import webhook
+        from cache import TTLCache
+        webhook.profile_cache = TTLCache(ttl=0.02, max_entries=10)
+        refresher = webhook.create_pre_refresher({'cache': {'profile': {'pre_refresh': {'active_window': 60}}}})
+        webhook.pre_refresher = refresher
+        refreshed = threading.Event()
+
+        with patch.object(webhook.refresh_executor, 'submit', side_effect=lambda *args: refreshed.set()):
+            refresher.seen('test_token', 'hash')
+            refresher.schedule('hash')
+            assert refreshed.wait(5)
+
+        refresher.stop()
+        refresher._thread.join(5)
+        assert not refresher._thread.is_alive()
+
+    @patch('webhook.load_profile', return_value={'username': 'testuser'})
+    def test_refresh_thread_survives_errors(self, mock_load, app):
+        import threading
+        import webhook
+        from cache import TTLCache
+        webhook.profile_cache = TTLCache(ttl=0.02, max_entries=10)
+        refresher = webhook.create_pre_refresher({'cache': {'profile': {'pre_refresh': {'active_window': 60}}}})
+        webhook.pre_refresher = refresher
+        failed = threading.Event()
+        refreshed = threading.Event()
+
+        def submit(*args):
+            if not failed.is_set():
+                failed.set()
+                raise RuntimeError('cannot schedule new futures after shutdown')
+            refreshed.set()
+
+        with patch.object(webhook.refresh_executor, 'submit', side_effect=submit), \
+                patch.object(webhook.app.logger, 'exception') as mock_log:
+            refresher.seen('test_token', 'hash')
+            refresher.schedule('hash')
+            assert failed.wait(5)
+
+            refresher.seen('other_token', 'other')
+            refresher.schedule('other')
+            assert refreshed.wait(5)
+
+        mock_log.assert_called_once_with('Could not start profile pre-refreshes')
+        refresher.stop()
+        refresher._thread.join(5)
+        assert not refresher._thread.is_alive()
+
+
+class TestOrgDirectory:
+    CONFIG = {'github': {'required': {'org': 'MyOrg'}, 'directory': {'interval': 300}}}
+
+    @staticmethod
+    def service_github(members, teams, parents=None, direct=None):
+        mock_auth = MagicMock()
+        mock_auth.get_org_members.return_value = members
+        mock_auth.get_org_teams.return_value = {slug: (parents or {}).get(slug) for slug in teams}
+        mock_auth.get_team_members.side_effect = lambda org, slug: teams[slug]
+        mock_auth.get_direct_team_members.side_effect = lambda org, slug: (direct or {})[slug]
+        return mock_auth
+
+    @pytest.fixture
+    def directory(self, app, monkeypatch):
+        import webhook
+        monkeypatch.setenv('GITHUB_DIRECTORY_TOKEN', 'service_token')
+        webhook.config = self.CONFIG
+        webhook.org_directory = webhook.create_org_directory(self.CONFIG)
+        service = self.service_github(['Alice', 'bob', 'carol'], {'backend': ['alice', 'Bob'], 'devops': ['alice']})
+
+        with patch('webhook.GithubAuth', return_value=service):
+            webhook.org_directory.sync()
+
+        return webhook.org_directory
+
+    def test_disabled_by_default(self, app):
+        import webhook
+        assert webhook.org_directory.enabled is False
+        assert webhook.org_directory.current() is None
+
+    def test_disabled_without_token(self, app, monkeypatch):
+        import webhook
+        monkeypatch.delenv('GITHUB_DIRECTORY_TOKEN', raising=False)
+        directory = webhook.create_org_directory({'github': {'directory': {'interval': 300, 'token_env': 'TOKEN'}}})
+        assert directory.enabled is False
+
+    def test_configured_values(self, app, monkeypatch):
+        import webhook
+        monkeypatch.setenv('DIRECTORY_TOKEN', 'service_token')
+        directory = webhook.create_org_directory({'github': {'directory': {
+            'interval': 60, 'max_age': 120, 'token_env': 'DIRECTORY_TOKEN',
+        }}})
+        assert directory.enabled is True
+        assert directory.interval == 60
+        assert directory.max_age == 120
+
+    def test_sync_indexes_members_and_teams(self, directory):
+        snapshot = directory.current()
+
+        assert snapshot.org == 'MyOrg'
+        assert dict(snapshot.roles) == {'alice': ('backend', 'devops'), 'bob': ('backend',), 'carol': ()}
+        assert snapshot.teams['backend'] == frozenset({'alice', 'bob'})
+
+    def test_parent_team_roles_only_go_to_direct_members(self, app, monkeypatch):
+        import webhook
+        monkeypatch.setenv('GITHUB_DIRECTORY_TOKEN', 'service_token')
+        webhook.config = self.CONFIG
+        directory = webhook.create_org_directory(self.CONFIG)
+        service = self.service_github(
+            ['alice', 'bob'],
+            {'engineering': ['alice', 'bob'], 'backend': ['bob']},
+            parents={'backend': 'engineering'},
+            direct={'engineering': ['Alice']},
+        )
+
+        with patch('webhook.GithubAuth', return_value=service):
+            snapshot = directory.sync()
+
+        assert dict(snapshot.roles) == {'alice': ('engineering',), 'bob': ('backend',)}
+        service.get_direct_team_members.assert_called_once_with('MyOrg', 'engineering')
+        service.get_team_members.assert_called_once_with('MyOrg', 'backend')
+
+    def test_sync_uses_the_service_token(self, app, monkeypatch):
+        import webhook
+        monkeypatch.setenv('GITHUB_DIRECTORY_TOKEN', 'service_token')
+        webhook.config = self.CONFIG
+        directory = webhook.create_org_directory(self.CONFIG)
+
+        with patch('webhook.GithubAuth', return_value=self.service_github([], {})) as mock_auth_class:
+            directory.sync()
+
+        mock_auth_class.assert_called_once_with('service_token')
+
+    def test_sync_without_required_org(self, directory):
+        import webhook
+        webhook.config = {'github': {'directory': {'interval': 300}}}
+        assert directory.sync() is None
+
+    def test_index_roles_only_updates_changed_members(self):
+        from webhook import OrgSnapshot, index_roles
+        teams = {'backend': frozenset({'alice', 'bob'}), 'devops': frozenset({'alice'})}
+        previous = OrgSnapshot('MyOrg', teams, index_roles({'alice', 'bob', 'carol'}, teams), 0.0)
+
+        teams = {'backend': frozenset({'alice', 'carol'}), 'frontend': frozenset({'dave'})}
+        roles = index_roles({'alice', 'carol', 'dave'}, teams, previous)
+
+        assert roles == {'alice': ('backend',), 'carol': ('backend',), 'dave': ('frontend',)}
+        previous = OrgSnapshot('MyOrg', teams, roles, 0.0)
+        assert index_roles({'alice', 'carol', 'dave'}, teams, previous)['dave'] is roles['dave']
+
+    def test_stale_snapshot_is_not_used(self, directory):
+        import time
+        directory.max_age = 60
+
+        with patch('webhook.time.monotonic', return_value=time.monotonic() + 61):
+            assert directory.current() is None
+            assert directory.age() > 60
+
+    def test_snapshot_of_another_org_is_not_used(self, directory):
+        import webhook
+        webhook.config = {'github': {'required': {'org': 'OtherOrg'}}}
+        assert directory.current() is None
+
+    def test_age_counts_from_startup_without_a_snapshot(self, app):
+        import webhook
+        assert 0 <= webhook.org_directory.age() < 60
+
+    def test_member_is_answered_from_the_snapshot(self, directory):
+        import webhook
+        mock_auth = MagicMock()
+        mock_auth.get_user_info.return_value = {'login': 'alice'}
+        mock_auth.get_email_addresses.return_value = []
+
+        info, orgs, emails, teams = webhook.fetch_github_data(mock_auth, webhook.get_requirement_checks(webhook.config))
+
+        assert orgs == [{'login': 'MyOrg'}]
+        assert teams == ['backend', 'devops']
+        mock_auth.get_org_list.assert_not_called()
+        mock_auth.get_user_teams.assert_not_called()
+
+    def test_unknown_user_is_checked_with_github(self, directory):
+        import webhook
+        mock_auth = MagicMock()
+        mock_auth.get_user_info.return_value = {'login': 'newcomer'}
+        mock_auth.get_email_addresses.return_value = []
+        mock_auth.get_org_list.return_value = [{'login': 'MyOrg'}]
+        mock_auth.get_user_teams.return_value = ['backend']
+
+        info, orgs, emails, teams = webhook.fetch_github_data(mock_auth, webhook.get_requirement_checks(webhook.config))
+
+        assert orgs == [{'login': 'MyOrg'}]
+        assert teams == ['backend']
+        mock_auth.get_org_list.assert_called_once_with(webhook.config)
+
+    def test_unknown_user_is_denied_by_github(self, directory):
+        import webhook
+        mock_auth = MagicMock()
+        mock_auth.get_user_info.return_value = {'login': 'stranger'}
+        mock_auth.get_email_addresses.return_value = []
+        mock_auth.get_org_list.return_value = []
+
+        with pytest.raises(PermissionError, match='User stranger is not a member of MyOrg'):
+            webhook.fetch_github_data(mock_auth, webhook.get_requirement_checks(webhook.config))
+
+    def test_unknown_user_membership_mode(self, directory):
+        import webhook
+        webhook.config = {**self.CONFIG, 'github': {**self.CONFIG['github'], 'org_check': 'membership'}}
+        mock_auth = MagicMock()
+        mock_auth.get_user_info.return_value = {'login': 'newcomer'}
+        mock_auth.get_email_addresses.return_value = []
+        mock_auth.get_org_membership.return_value = True
+        mock_auth.get_user_teams.return_value = []
+
+        assert webhook.fetch_github_data(mock_auth)[1] == [{'login': 'MyOrg'}]
+        mock_auth.get_org_membership.assert_called_once_with('MyOrg')
+
+    @patch('webhook.GithubAuth')
+    def test_info_uses_the_snapshot(self, mock_auth_class, directory, client):
+        mock_auth = MagicMock()
+        mock_auth.get_user_info.return_value = {'login': 'Bob', 'name': 'Bob Smith'}
+        mock_auth.get_email_addresses.return_value = [{'email': 'bob@example.com', 'primary': True}]
+        mock_auth_class.return_value = mock_auth
+
+        response = client.get('/info', headers={'Authorization': 'Bearer test_token'})
+
+        assert response.status_code == 200
+        assert json.loads(response.data)['roles'] == 'backend'
+        assert json.loads(response.data)['orgs'] == 'MyOrg'
+
+    def test_sync_thread(self, app, monkeypatch):
+        import threading
+        import webhook
+        monkeypatch.setenv('GITHUB_DIRECTORY_TOKEN', 'service_token')
+        webhook.config = self.CONFIG
+        directory = webhook.create_org_directory({'github': {'directory': {'interval': 0.01}}})
+        synced = threading.Event()
+        results = [RuntimeError('ERROR: 502'), None, MagicMock(roles={'alice': ()})]
+
+        def sync():
+            result = results.pop(0) if results else synced.set()
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        with patch.object(directory, 'sync', side_effect=sync), patch('webhook.metrics') as mock_metrics:
+            directory.start()
+            directory.start()
+            assert synced.wait(5)
+            directory.stop()
+            directory._thread.join(5)
+
+        assert not directory._thread.is_alive()
+        mock_metrics.register_directory.assert_called_once_with(directory.age)
+        assert mock_metrics.observe_directory_sync.call_args_list[0].args[1] is None
+        assert mock_metrics.observe_directory_sync.call_args_list[1].args[1] == 1
+
+
+def sign(body, secret='secret'):
+    import hashlib
+    import hmac
+    return 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+class TestGithubWebhook:
+    CONFIG = {'github': {'required': {'org': 'MyOrg'}}}
+
+    @pytest.fixture
+    def hooks(self, app):
+        import time
+        import webhook
+        webhook.config = self.CONFIG
+        webhook.github_webhook_secret = 'secret'
+        webhook.org_directory.snapshot = webhook.OrgSnapshot(
+            'MyOrg',
+            {'backend': frozenset({'alice', 'bob'}), 'devops': frozenset({'alice'})},
+            {'alice': ('backend', 'devops'), 'bob': ('backend',)},
+            time.monotonic(),
+        )
+        webhook.profile_cache.set('alice1', {'username': 'alice', 'roles': 'backend,devops'})
+        webhook.profile_cache.set('alice2', {'username': 'alice', 'roles': 'backend,devops'})
+        webhook.profile_cache.set('bob', {'username': 'bob', 'roles': 'backend'})
+        return webhook
+
+    @staticmethod
+    def deliver(client, event, payload, signature=None):
+        body = json.dumps(payload).encode()
+        return client.post('/github/webhook', data=body, headers={
+            'X-GitHub-Event': event,
+            'X-Hub-Signature-256': signature or sign(body),
+            'Content-Type': 'application/json',
+        })
+
+    def test_not_found_without_secret(self, client):
+        response = self.deliver(client, 'ping', {})
+        assert response.status_code == 404
+
+    def test_secret_from_environment(self, app, monkeypatch):
+        from webhook import get_github_webhook_secret
+        monkeypatch.setenv('GITHUB_WEBHOOK_SECRET', 'default')
+        monkeypatch.setenv('HOOK_SECRET', 'custom')
+
+        assert get_github_webhook_secret(None) == 'default'
+        assert get_github_webhook_secret({'github': {'webhook': {'secret_env': 'HOOK_SECRET'}}}) == 'custom'
+        assert get_github_webhook_secret({'github': {'webhook': {'secret_env': 'MISSING'}}}) is None
+
+    def test_verify_github_signature(self):
+        from webhook import verify_github_signature
+        assert verify_github_signature('secret', b'{}', sign(b'{}'))
+        assert not verify_github_signature('secret', b'{}', sign(b'{}', 'other'))
+        assert not verify_github_signature('secret', b'{}', None)
+
+    def test_invalid_signature_is_rejected(self, hooks, client):
+        response = self.deliver(client, 'organization', {}, signature=sign(b'{}', 'other'))
+
+        assert response.status_code == 401
+        assert json.loads(response.data)['detail'] == 'Invalid signature'
+        assert len(hooks.profile_cache) == 3
+
+    def test_malformed_delivery(self, hooks, client):
+        response = self.deliver(client, 'organization', {
+            'action': 'member_removed', 'organization': {'login': 'MyOrg'},
+        })
+
+        assert response.status_code == 400
+        assert 'Malformed organization event' in json.loads(response.data)['detail']
+
+    @pytest.mark.parametrize('event, payload', [
+        ('ping', {'zen': 'Keep it logically awesome.', 'organization': {'login': 'MyOrg'}}),
+        ('organization', {'action': 'member_removed', 'organization': {'login': 'OtherOrg'}}),
+        ('organization', {'action': 'renamed', 'organization': {'login': 'MyOrg'}}),
+        ('member', {'action': 'added', 'member': {'login': 'alice'}, 'organization': {'login': 'MyOrg'}}),
+        ('team', {'action': 'edited', 'changes': {'description': {}}, 'organization': {'login': 'MyOrg'}}),
+    ])
+    def test_other_events_are_ignored(self, hooks, client, event, payload):
+        response = self.deliver(client, event, payload)
+
+        assert response.status_code == 200
+        assert json.loads(response.data) == {'status': 'ignored'}
+        assert len(hooks.profile_cache) == 3
+
+    def test_ignored_without_required_org(self, hooks):
+        hooks.config = None
+        payload = {'action': 'member_removed', 'organization': {'login': 'MyOrg'}}
+        assert hooks.apply_github_event('organization', payload) is None
+
+    def test_member_removed_from_org(self, hooks, client):
+        response = self.deliver(client, 'organization', {
+            'action': 'member_removed',
+            'membership': {'user': {'login': 'Alice'}},
+            'organization': {'login': 'myorg'},
+        })
+
+        assert json.loads(response.data) == {'status': 'ok', 'evicted': 0}
+        response = self.deliver(client, 'organization', {
+            'action': 'member_removed',
+            'membership': {'user': {'login': 'alice'}},
+            'organization': {'login': 'MyOrg'},
+        })
+
+        assert json.loads(response.data) == {'status': 'ok', 'evicted': 2}
+        assert hooks.profile_cache.get('bob') is not None
+        snapshot = hooks.org_directory.current()
+        assert dict(snapshot.roles) == {'bob': ('backend',)}
+        assert snapshot.teams['devops'] == frozenset()
+
+    def test_member_added_to_org(self, hooks):
+        hooks.apply_github_event('organization', {
+            'action': 'member_added',
+            'membership': {'user': {'login': 'Carol'}},
+            'organization': {'login': 'MyOrg'},
+        })
+        assert hooks.org_directory.current().roles['carol'] == ()
+
+    def test_mapped_username_is_evicted(self, hooks):
+        hooks.config = {**self.CONFIG, 'spinnaker': {'username_mapping': {'bob': 'robert'}}}
+        hooks.profile_cache.set('robert', {'username': 'robert', 'roles': ''})
+
+        assert hooks.apply_github_event('organization', {
+            'action': 'member_removed',
+            'membership': {'user': {'login': 'bob'}},
+            'organization': {'login': 'MyOrg'},
+        }) == 1
+        assert hooks.profile_cache.get('bob') is not None
+
+    def test_team_membership_changes(self, hooks):
+        def change(action, login, team):
+            return hooks.apply_github_event('membership', {
+                'action': action,
+                'scope': 'team',
+                'member': {'login': login},
+                'team': {'slug': team},
+                'organization': {'login': 'MyOrg'},
+            })
+
+        assert change('removed', 'alice', 'devops') == 2
+        assert change('added', 'bob', 'frontend') == 1
+        assert dict(hooks.org_directory.current().roles) == {'alice': ('backend',), 'bob': ('backend', 'frontend')}
+
+    def test_team_deleted(self, hooks):
+        assert hooks.apply_github_event('team', {
+            'action': 'deleted', 'team': {'slug': 'devops'}, 'organization': {'login': 'MyOrg'},
+        }) == 2
+        assert hooks.profile_cache.get('bob') is not None
+        assert 'devops' not in hooks.org_directory.current().teams
+        assert hooks.org_directory.current().roles['alice'] == ('backend',)
+
+    def test_team_renamed(self, hooks):
+        with patch.object(hooks.org_directory, 'resync') as mock_resync:
+            assert hooks.apply_github_event('team', {
+                'action': 'edited',
+                'changes': {'name': {'from': 'Dev Ops'}},
+                'team': {'slug': 'platform'},
+                'organization': {'login': 'MyOrg'},
+            }) == 3
+
+        mock_resync.assert_called_once()
+        assert len(hooks.profile_cache) == 0
+
+    def test_directory_of_another_org_is_not_patched(self, hooks):
+        snapshot = hooks.org_directory.snapshot
+        hooks.org_directory.update_member('OtherOrg', 'carol', True)
+        assert hooks.org_directory.snapshot is snapshot
+
+    def test_sync_overlapping_an_event_is_discarded(self, hooks):
+        service = MagicMock()
+        service.get_org_teams.return_value = {}
+
+        def members(org):
+            hooks.org_directory.update_member(org, 'alice', False)
+            return ['alice', 'bob']
+
+        service.get_org_members.side_effect = members
+        hooks.org_directory._token = 'service_token'
+
+        with patch('webhook.GithubAuth', return_value=service):
+            assert hooks.org_directory.sync() is None
+
+        assert 'alice' not in hooks.org_directory.current().roles
+
+    def test_counts_deliveries(self, hooks, client):
+        from prometheus_client import REGISTRY
+
+        def count(event, result):
+            return REGISTRY.get_sample_value(
+                'github_oauth_proxy_github_events_total', {'event': event, 'result': result}
+            ) or 0
+
+        before = count('ping', 'ignored'), count('unverified', 'rejected'), count('other', 'ignored')
+        self.deliver(client, 'ping', {})
+        self.deliver(client, 'ping', {}, signature='sha256=0')
+        self.deliver(client, 'random-1234', {})
+
+        assert count('ping', 'ignored') == before[0] + 1
+        assert count('unverified', 'rejected') == before[1] + 1
+        assert count('other', 'ignored') == before[2] + 1
+        assert count('random-1234', 'ignored') == 0
+
+    def test_resync_wakes_the_sync_thread(self, app, monkeypatch):
+        import threading
+        import webhook
+        monkeypatch.setenv('GITHUB_DIRECTORY_TOKEN', 'service_token')
+        directory = webhook.create_org_directory({'github': {'directory': {'interval': 3600}}})
+        syncs = threading.Semaphore(0)
+
+        with patch.object(directory, 'sync', side_effect=lambda: syncs.release()), patch('webhook.metrics'):
+            directory.start()
+            assert syncs.acquire(timeout=5)
+            directory.resync()
+            assert syncs.acquire(timeout=5)
+            directory.stop()
+            directory._thread.join(5)
+
+        assert not directory._thread.is_alive()
+
+
 class TestMain:
     @patch('webhook.get_args')
     def test_main_block(self, mock_get_args):
         mock_args = MagicMock()
         mock_args.host = '127.0.0.1'
         mock_args.port = 9000
+        mock_args.precompile_config = False
         mock_get_args.return_value = mock_args
 
+        code, globs = self.compile_main()
+
+        mock_serve = MagicMock()
+        fake_waitress = MagicMock()
+        fake_waitress.serve = mock_serve
+        with patch.dict('sys.modules', {'waitress': fake_waitress}):
+            exec(code, globs)
+
+        import webhook
+        mock_get_args.assert_called_once()
+        mock_serve.assert_called_once_with(webhook.app, host='127.0.0.1', port=9000)
+
+    @patch('webhook.precompile_config')
+    @patch('webhook.get_args')
+    def test_main_block_precompiles_config(self, mock_get_args, mock_precompile_config):
+        mock_get_args.return_value = MagicMock(precompile_config=True)
+
+        code, globs = self.compile_main()
+        mock_serve = MagicMock()
+        with patch.dict('sys.modules', {'waitress': MagicMock(serve=mock_serve)}), pytest.raises(SystemExit):
+            exec(code, globs)
+
+        mock_precompile_config.assert_called_once_with()
+        mock_serve.assert_not_called()
+
+    @staticmethod
+    def compile_main():
         import webhook
         # Read only the __main__ block, padded with newlines to preserve
         # line numbers so coverage tracks the main block
@@ -393,12 +1902,4 @@ class TestMain:
         code = compile(main_source, webhook.__file__, 'exec')
         globs = dict(vars(webhook))
         globs['__name__'] = '__main__'
-
-        mock_serve = MagicMock()
-        fake_waitress = MagicMock()
-        fake_waitress.serve = mock_serve
-        with patch.dict('sys.modules', {'waitress': fake_waitress}):
-            exec(code, globs)
-
-        mock_get_args.assert_called_once()
-        mock_serve.assert_called_once_with(webhook.app, host='127.0.0.1', port=9000)
+        return code, globs
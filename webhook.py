@@ -6,22 +6,82 @@ a Spinnaker-compatible user profile, optionally enforcing organization,
 email-domain and primary-email requirements from ``config.yml``.
 """
 
-import argparse
+import hashlib
+import heapq
+import hmac
+import json
 import logging
-from typing import Any, Dict, List, Optional
-
-import yaml
-from flask import Flask, request, jsonify, make_response
-
-from github_auth import GithubAuth
-
-
-def get_args() -> argparse.Namespace:
+import math
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from functools import partial
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any, Callable, Dict, FrozenSet, List, Mapping, NamedTuple, Optional, Set, Tuple
+
+from flask import Flask, Response, g, request, jsonify, make_response
+
+import github_auth
+import metrics
+
+from cache import (
+    CACHE_BACKENDS,
+    DEFAULT_REDIS_PREFIX,
+    DEFAULT_REDIS_URL,
+    DEFAULT_SQLITE_PATH,
+    CacheBackend,
+    ProfileCache,
+    RedisCache,
+    SingleFlight,
+    SqliteCache,
+    TTLCache,
+    hash_token,
+)
+from github_auth import GithubAuth, RateLimitError, configure_http, configure_rate_limit, configure_response_cache
+
+if TYPE_CHECKING:
+    import argparse
+
+DEFAULT_PROFILE_CACHE_TTL = 60
+DEFAULT_PROFILE_CACHE_MAX_ENTRIES = 10000
+DEFAULT_PROFILE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_PROFILE_CACHE_MAX_STALE = 600
+DEFAULT_PROFILE_CACHE_STALE_WHILE_REVALIDATE = 0
+DEFAULT_REFRESH_WORKERS = 4
+DEFAULT_PRE_REFRESH_ACTIVE_WINDOW = 0
+DEFAULT_PRE_REFRESH_LEAD = 5
+DEFAULT_PRE_REFRESH_JITTER = 10
+DEFAULT_PRE_REFRESH_MIN_RATE_LIMIT_REMAINING = 500
+DEFAULT_PRE_REFRESH_MAX_TOKENS = 10000
+DEFAULT_DIRECTORY_INTERVAL = 0
+DEFAULT_DIRECTORY_MAX_AGE = 900
+DEFAULT_DIRECTORY_TOKEN_ENV = 'GITHUB_DIRECTORY_TOKEN'
+DEFAULT_GITHUB_WEBHOOK_SECRET_ENV = 'GITHUB_WEBHOOK_SECRET'
+GITHUB_WEBHOOK_PATH = '/github/webhook'
+DEFAULT_DENIED_CACHE_TTL = 30
+DEFAULT_DENIED_CACHE_MAX_ENTRIES = 10000
+DEFAULT_MAX_WORKERS = 16
+DEFAULT_CONFIG_RELOAD_INTERVAL = 5
+CONFIG_PATH = 'config.yml'
+PRECOMPILED_CONFIG_PATH = 'config.compiled.json'
+API_MODES = ('rest', 'graphql')
+ORG_CHECKS = ('list', 'membership')
+
+RequirementCheck = Callable[[str, Any], None]
+
+
+def get_args() -> 'argparse.Namespace':
     """Parse command-line arguments for the local development server.
 
     Returns:
-        The parsed arguments (``host`` and ``port``).
+        The parsed arguments (``host``, ``port`` and ``precompile_config``).
     """
+    # Deferred import: argparse is only needed for the command line.
+    import argparse
+
     parser = argparse.ArgumentParser(
         description='Github Webhook proxy for Jenkins'
     )
@@ -39,21 +99,129 @@ def get_args() -> argparse.Namespace:
         default='0.0.0.0'
     )
 
+    parser.add_argument(
+        '--precompile-config',
+        help=f'Validate {CONFIG_PATH}, write it to {PRECOMPILED_CONFIG_PATH} and exit',
+        action='store_true'
+    )
+
     return parser.parse_args()
 
 
 def load_config() -> Optional[Dict[str, Any]]:
     """Load ``config.yml`` from the current directory.
 
+    When ``config.compiled.json`` (see ``precompile_config``) was written
+    from the same ``config.yml`` content, it is read instead: decoding JSON
+    is much faster than parsing YAML, and PyYAML is then not imported at
+    all, which shortens cold starts.
+
     Returns:
         The parsed configuration, or ``None`` if the file does not exist.
     """
     try:
-        with open('config.yml', 'r') as stream:
-            return yaml.safe_load(stream)
+        with open(CONFIG_PATH, 'r') as stream:
+            source = stream.read()
+    except FileNotFoundError:
+        return None
+
+    digest = hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+    try:
+        with open(PRECOMPILED_CONFIG_PATH, 'r') as stream:
+            precompiled = json.load(stream)
+        if precompiled['sha256'] == digest:
+            return precompiled['config']
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    # Deferred import: PyYAML is only needed without an up-to-date
+    # precompiled configuration.
+    import yaml
+    return yaml.safe_load(source)
+
+
+def precompile_config() -> Optional[Dict[str, Any]]:
+    """Validate ``config.yml`` and write it to ``config.compiled.json``.
+
+    Meant to run at build time (for example before ``zappa deploy``) so
+    that ``load_config`` can skip the YAML parser at startup. The file
+    records a hash of ``config.yml`` and is ignored once they differ.
+
+    Returns:
+        The configuration that was written, or ``None`` without ``config.yml``.
+
+    Raises:
+        KeyError: If the configuration is invalid.
+        ValueError: If the configuration is invalid.
+    """
+    try:
+        with open(CONFIG_PATH, 'r') as stream:
+            source = stream.read()
     except FileNotFoundError:
         return None
 
+    # Deferred import: PyYAML is only needed at build time and without a
+    # precompiled configuration.
+    import yaml
+    config = yaml.safe_load(source)
+
+    if config:
+        validate_config(config)
+
+    temporary_path = f'{PRECOMPILED_CONFIG_PATH}.tmp'
+    with open(temporary_path, 'w') as stream:
+        json.dump({'sha256': hashlib.sha256(source.encode('utf-8')).hexdigest(), 'config': config}, stream)
+    os.replace(temporary_path, PRECOMPILED_CONFIG_PATH)
+    return config
+
+
+def get_api_mode(config: Optional[Dict[str, Any]]) -> str:
+    """Return which GitHub API is used to build profiles.
+
+    Args:
+        config: The loaded configuration, or ``None``.
+
+    Returns:
+        ``'rest'`` (the default) or ``'graphql'``, from ``github.api``.
+    """
+    if config and 'github' in config and 'api' in config['github']:
+        return config['github']['api']
+    return 'rest'
+
+
+def get_org_check(config: Optional[Dict[str, Any]]) -> str:
+    """Return how membership of ``github.required.org`` is checked.
+
+    Args:
+        config: The loaded configuration, or ``None``.
+
+    Returns:
+        ``'list'`` (the default), which looks for the organization in
+        ``/user/orgs``, or ``'membership'``, from ``github.org_check``.
+    """
+    if config and 'github' in config and 'org_check' in config['github']:
+        return config['github']['org_check']
+    return 'list'
+
+
+def get_membership_org(config: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Return the organization to check with the membership endpoint.
+
+    The membership endpoint is only used with the REST API, when
+    ``github.org_check`` is ``membership`` and an organization is required.
+
+    Args:
+        config: The loaded configuration, or ``None``.
+
+    Returns:
+        The required organization login, or ``None`` when ``/user/orgs``
+        is used instead.
+    """
+    if not config or get_api_mode(config) != 'rest' or get_org_check(config) != 'membership':
+        return None
+    return (config['github'].get('required') or {}).get('org')
+
 
 def validate_config(config: Dict[str, Any]) -> None:
     """Validate the loaded configuration.
@@ -63,7 +231,19 @@ def validate_config(config: Dict[str, Any]) -> None:
 
     Raises:
         KeyError: If ``domain_required_as_primary`` is set without a domain.
+        ValueError: If ``github.api`` is not a supported API mode,
+            ``github.org_check`` is not a supported check, or
+            ``cache.profile.backend`` is not a supported cache backend.
     """
+    if get_api_mode(config) not in API_MODES:
+        raise ValueError(f"Configuration github.api must be one of {', '.join(API_MODES)}")
+
+    if get_org_check(config) not in ORG_CHECKS:
+        raise ValueError(f"Configuration github.org_check must be one of {', '.join(ORG_CHECKS)}")
+
+    if get_profile_cache_settings(config).get('backend', 'memory') not in CACHE_BACKENDS:
+        raise ValueError(f"Configuration cache.profile.backend must be one of {', '.join(CACHE_BACKENDS)}")
+
     if 'github' in config and 'required' in config['github']:
         required = config['github']['required']
         if 'email' in required and 'domain_required_as_primary' in required['email']:
@@ -77,13 +257,13 @@ def validate_org(orgs: List[Dict[str, Any]], required_org: str) -> bool:
 
     Args:
         orgs: The list of organizations from GitHub.
-        required_org: The required organization login.
+        required_org: The required organization login, lowercased.
 
     Returns:
         ``True`` if the required organization is present (case-insensitive).
     """
     for org in orgs:
-        if org.get('login', '').lower() == required_org.lower():
+        if org.get('login', '').lower() == required_org:
             return True
     return False
 
@@ -96,7 +276,7 @@ def validate_email_domain(
 
     Args:
         email_list: The list of email entries from GitHub.
-        required_domain: The required email domain.
+        required_domain: The required email domain, lowercased.
 
     Returns:
         A dict describing the matching email, or ``None`` when there is no match.
@@ -104,7 +284,7 @@ def validate_email_domain(
     for email_item in email_list:
         email_address = email_item.get('email') or ''
         email_domain = email_address.partition('@')[2].lower()
-        if email_domain and email_domain == required_domain.lower():
+        if email_domain and email_domain == required_domain:
             return {
                 'email': email_address,
                 'domain': email_domain,
@@ -121,7 +301,7 @@ def validate_primary_email(
 
     Args:
         email_list: The list of email entries from GitHub.
-        required_email_domain: The required email domain.
+        required_email_domain: The required email domain, lowercased.
 
     Returns:
         ``True`` if a primary email with the required domain exists.
@@ -129,11 +309,141 @@ def validate_primary_email(
     for email_item in email_list:
         email_address = email_item.get('email') or ''
         email_domain = email_address.partition('@')[2].lower()
-        if email_item.get('primary') and email_domain == required_email_domain.lower():
+        if email_item.get('primary') and email_domain == required_email_domain:
             return True
     return False
 
 
+def get_required(config: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Return the ``github.required`` settings.
+
+    Args:
+        config: The loaded configuration, or ``None``.
+
+    Returns:
+        The settings, or an empty dict when nothing is required.
+    """
+    if config and 'github' in config and 'required' in config['github']:
+        return config['github']['required'] or {}
+    return {}
+
+
+def check_org_requirement(
+    required_org: str,
+    username: str,
+    orgs: List[Dict[str, Any]],
+    org_key: Optional[str] = None,
+) -> None:
+    """Raise unless the user belongs to ``required_org``.
+
+    Args:
+        required_org: The required organization login, as configured.
+        username: The GitHub login of the authenticated user.
+        orgs: The list of organizations from GitHub.
+        org_key: ``required_org`` lowercased, if already known.
+
+    Raises:
+        PermissionError: If the user is not a member of the organization.
+    """
+    if not validate_org(orgs, org_key or required_org.lower()):
+        raise PermissionError(f'User {username} is not a member of {required_org} Github organization')
+
+
+def check_membership_requirement(required_org: str, username: str, is_member: bool) -> None:
+    """Raise unless the membership endpoint reported the user as a member.
+
+    Args:
+        required_org: The required organization login.
+        username: The GitHub login of the authenticated user.
+        is_member: The result of ``get_org_membership(required_org)``.
+
+    Raises:
+        PermissionError: If the user is not an active member of the organization.
+    """
+    if not is_member:
+        raise PermissionError(f'User {username} is not a member of {required_org} Github organization')
+
+
+def check_email_requirement(
+    required_email: Dict[str, Any],
+    username: str,
+    emails: List[Dict[str, Any]],
+    domain_key: Optional[str] = None,
+) -> None:
+    """Raise unless the user's emails satisfy ``github.required.email``.
+
+    Args:
+        required_email: The ``github.required.email`` settings, with a ``domain``.
+        username: The GitHub login of the authenticated user.
+        emails: The list of email entries from GitHub.
+        domain_key: The domain lowercased, if already known.
+
+    Raises:
+        PermissionError: If no email, or no primary email, is in the domain.
+    """
+    domain = required_email['domain']
+    domain_key = domain_key or domain.lower()
+    validated_email = validate_email_domain(emails, domain_key)
+    if not validated_email:
+        raise PermissionError(f'User {username} does not have a @{domain} email ' +
+                              'address associated with their Github account')
+
+    if required_email.get('domain_required_as_primary'):
+        if not validate_primary_email(emails, domain_key):
+            raise PermissionError(f'User {username} does not have an @{domain} address ' +
+                                  'set as their primary email address')
+
+
+def get_requirement_checks(config: Optional[Dict[str, Any]]) -> List[Tuple[str, RequirementCheck]]:
+    """Return the configured requirements, each with the GitHub data it needs.
+
+    Args:
+        config: The loaded configuration, or ``None``.
+
+    Returns:
+        ``(source, check)`` pairs, where ``source`` is ``'orgs'``,
+        ``'membership'`` or ``'emails'`` and ``check(username, data)``
+        raises ``PermissionError`` when the requirement is not met. The
+        organization and domain are lowercased here, as in
+        ``CompiledConfig``, rather than on every login.
+    """
+    required = get_required(config)
+    checks: List[Tuple[str, RequirementCheck]] = []
+
+    if 'org' in required and get_membership_org(config) is not None:
+        checks.append(('membership', partial(check_membership_requirement, required['org'])))
+    elif 'org' in required:
+        org_key = required['org'].lower()
+        checks.append(('orgs', partial(check_org_requirement, required['org'], org_key=org_key)))
+
+    if 'email' in required and 'domain' in required['email']:
+        domain_key = required['email']['domain'].lower()
+        checks.append(('emails', partial(check_email_requirement, required['email'], domain_key=domain_key)))
+
+    return checks
+
+
+def run_requirement_checks(checks: List[Tuple[str, RequirementCheck]], data: Dict[str, Any]) -> None:
+    """Run the checks whose data has been fetched.
+
+    Nothing runs before the profile (``data['info']``) is known, since
+    every error message names the user.
+
+    Args:
+        checks: The pairs returned by ``get_requirement_checks``.
+        data: The GitHub data fetched so far, by source.
+
+    Raises:
+        PermissionError: If any of the checks fails.
+    """
+    if 'info' not in data:
+        return
+
+    for source, check in checks:
+        if source in data:
+            check(data['info']['login'], data[source])
+
+
 def validate_auth_requirements(
     config: Optional[Dict[str, Any]],
     username: str,
@@ -151,26 +461,1397 @@ def validate_auth_requirements(
     Raises:
         PermissionError: If any configured requirement is not satisfied.
     """
-    required: Dict[str, Any] = {}
-    if config and 'github' in config and 'required' in config['github']:
-        required = config['github']['required']
+    data = {'info': {'login': username}, 'orgs': orgs, 'emails': emails}
+    run_requirement_checks(get_requirement_checks(config), data)
+
+
+class CompiledConfig(NamedTuple):
+    """The settings read on every login, resolved once per configuration.
+
+    Attributes:
+        raw: The configuration it was compiled from, or ``None``.
+        api_mode: ``github.api``, see ``get_api_mode``.
+        membership_org: See ``get_membership_org``.
+        required_org: ``github.required.org``, lowercased, or ``None``.
+        email_domain: ``github.required.email.domain``, lowercased, or ``None``.
+        domain_required_as_primary: Whether the domain must be the primary email's.
+        username_mapping: Spinnaker usernames by GitHub login.
+        checks: The requirement checks, see ``get_requirement_checks``.
+    """
 
-    if 'org' in required:
-        required_org = required['org']
-        if not validate_org(orgs, required_org):
-            raise PermissionError(f'User {username} is not a member of {required_org} Github organization')
+    raw: Optional[Dict[str, Any]]
+    api_mode: str
+    membership_org: Optional[str]
+    required_org: Optional[str]
+    email_domain: Optional[str]
+    domain_required_as_primary: bool
+    username_mapping: Mapping[str, str]
+    checks: Tuple[Tuple[str, RequirementCheck], ...]
+
+    def profile_inputs(self) -> Tuple[Any, ...]:
+        """Return the settings that cached profiles and denials depend on."""
+        return (
+            self.api_mode,
+            self.membership_org,
+            self.required_org,
+            self.email_domain,
+            self.domain_required_as_primary,
+            tuple(sorted(self.username_mapping.items())),
+        )
+
+
+def compile_config(config: Optional[Dict[str, Any]]) -> CompiledConfig:
+    """Resolve the per-login settings of a configuration.
 
-    if 'email' in required and 'domain' in required['email']:
-        domain = required['email']['domain']
-        validated_email = validate_email_domain(emails, domain)
-        if not validated_email:
-            raise PermissionError(f'User {username} does not have a @{domain} email ' +
-                                  'address associated with their Github account')
+    Args:
+        config: A validated configuration, or ``None``.
+
+    Returns:
+        The compiled settings.
+    """
+    required = get_required(config)
+    email = required.get('email') or {}
+    mapping: Dict[str, str] = {}
+
+    if config and 'spinnaker' in config:
+        mapping = dict((config['spinnaker'] or {}).get('username_mapping') or {})
+
+    return CompiledConfig(
+        raw=config,
+        api_mode=get_api_mode(config),
+        membership_org=get_membership_org(config),
+        required_org=required['org'].lower() if 'org' in required else None,
+        email_domain=email['domain'].lower() if 'domain' in email else None,
+        domain_required_as_primary=bool(email.get('domain_required_as_primary')),
+        username_mapping=MappingProxyType(mapping),
+        checks=tuple(get_requirement_checks(config)),
+    )
+
+
+def get_settings() -> CompiledConfig:
+    """Return the compiled form of the current ``config``.
+
+    ``config`` is only ever replaced as a whole, so it is recompiled
+    whenever the compiled form no longer matches it.
+
+    Returns:
+        The compiled settings.
+    """
+    global settings
+    current = settings
+
+    if current.raw is not config:
+        current = settings = compile_config(config)
+
+    return current
+
+
+def get_config_reload_interval(config: Optional[Dict[str, Any]]) -> float:
+    """Return how often, in seconds, ``config.yml`` is checked for changes.
+
+    Args:
+        config: The loaded configuration, or ``None``.
+
+    Returns:
+        ``reload_interval``, or the default. ``0`` disables reloading.
+    """
+    if config and 'reload_interval' in config:
+        return config['reload_interval']
+    return DEFAULT_CONFIG_RELOAD_INTERVAL
+
+
+class ConfigWatcher:
+    """Reload ``config.yml`` when it changes on disk.
+
+    There is no watcher thread: ``check`` is called on every request and
+    compares the file's modification time and size with the loaded ones,
+    at most once every ``interval`` seconds.
+
+    Attributes:
+        path: The configuration file.
+        interval: Seconds between checks; ``0`` disables reloading.
+        loaded: The ``(mtime, size)`` of the loaded file, or ``None`` when
+            it did not exist.
+    """
+
+    def __init__(self, path: str, interval: float) -> None:
+        """Initialize the watcher with the file as it is now.
+
+        Args:
+            path: The configuration file.
+            interval: Seconds between checks.
+        """
+        self.path = path
+        self.interval = interval
+        self.loaded = self.stat()
+        self._next_check = time.monotonic() + interval
+        self._lock = threading.Lock()
+
+    def stat(self) -> Optional[Tuple[int, int]]:
+        """Return the file's modification time and size, or ``None`` if it is missing."""
+        try:
+            result = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return result.st_mtime_ns, result.st_size
+
+    def due(self) -> bool:
+        """Return whether ``check`` would look at the file now."""
+        return self.interval > 0 and time.monotonic() >= self._next_check
+
+    def check(self) -> bool:
+        """Reload the configuration if the file changed since it was loaded.
+
+        Only one caller checks at a time; the others carry on with the
+        current configuration.
+
+        Returns:
+            ``True`` if a new configuration was applied.
+        """
+        now = time.monotonic()
+
+        if not self.due() or not self._lock.acquire(blocking=False):
+            return False
 
-        if required['email'].get('domain_required_as_primary'):
-            if not validate_primary_email(emails, domain):
-                raise PermissionError(f'User {username} does not have an @{domain} address ' +
-                                      'set as their primary email address')
+        try:
+            self._next_check = now + self.interval
+            current = self.stat()
+
+            if current == self.loaded:
+                return False
+
+            self.loaded = current
+
+            if current is None:
+                # Dropping every requirement because the file went away
+                # would open the proxy up; keep the last configuration
+                app.logger.warning('%s was removed; keeping the loaded configuration', self.path)
+                return False
+
+            return reload_config()
+        finally:
+            self._lock.release()
+
+
+def reload_config() -> bool:
+    """Load ``config.yml`` again and apply it without a restart.
+
+    The new configuration is validated and compiled first and then swapped
+    in with a single assignment, so logins in flight keep the settings they
+    started with. An invalid file is logged and ignored. When a change
+    affects the profiles (requirements, username mapping, API mode), the
+    cached profiles and denials are dropped. An empty file, which is also
+    what a file read in the middle of being rewritten can look like, is
+    logged and ignored as well, as it would drop every requirement, and so
+    is a file that cannot be read.
+
+    HTTP, thread pool, rate-limit and cache settings are only read at
+    startup.
+
+    Returns:
+        ``True`` if the new configuration was applied.
+    """
+    global config
+    # Deferred import: PyYAML is only needed here to catch its parse errors,
+    # and a reload is rare enough not to matter for cold starts.
+    import yaml
+
+    try:
+        new_config = load_config()
+        if not new_config:
+            app.logger.warning('%s is empty; keeping the loaded configuration', CONFIG_PATH)
+            return False
+        validate_config(new_config)
+    except OSError as e:
+        app.logger.error('Could not read %s; keeping the loaded configuration: %s', CONFIG_PATH, e)
+        return False
+    except (yaml.YAMLError, KeyError, ValueError, TypeError, AttributeError) as e:
+        app.logger.error('Ignoring invalid %s: %s', CONFIG_PATH, e)
+        return False
+
+    previous = get_settings()
+    compiled = compile_config(new_config)
+    config = new_config
+    config_watcher.interval = get_config_reload_interval(new_config)
+
+    if compiled.profile_inputs() != previous.profile_inputs():
+        profile_cache.clear()
+        denied_cache.clear()
+        app.logger.info('Reloaded %s; cleared cached profiles', CONFIG_PATH)
+    else:
+        app.logger.info('Reloaded %s', CONFIG_PATH)
+
+    return True
+
+
+def get_profile_cache_settings(config: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Return the ``cache.profile`` settings.
+
+    Args:
+        config: The loaded configuration, or ``None``.
+
+    Returns:
+        The settings, or an empty dict when none are configured.
+    """
+    if config and 'cache' in config and 'profile' in (config['cache'] or {}):
+        return config['cache']['profile'] or {}
+    return {}
+
+
+def create_profile_cache(config: Optional[Dict[str, Any]]) -> CacheBackend:
+    """Create the ``/info`` profile cache from the ``cache.profile`` settings.
+
+    ``backend`` selects where profiles are kept: ``memory`` (the default) in
+    this process only, as compact records bounded by ``max_bytes``,
+    ``sqlite`` in the database file at ``path`` shared by every process on
+    the host, or ``redis`` on the server at ``url`` shared by every replica.
+
+    Args:
+        config: The loaded configuration, or ``None``.
+
+    Returns:
+        A cache of Spinnaker user profiles keyed by token hash. Expired
+        profiles are kept for ``max_stale`` seconds so they can still be
+        served while GitHub is rate limiting the token.
+    """
+    settings = get_profile_cache_settings(config)
+    backend = settings.get('backend', 'memory')
+    ttl = settings.get('ttl', DEFAULT_PROFILE_CACHE_TTL)
+    max_entries = settings.get('max_entries', DEFAULT_PROFILE_CACHE_MAX_ENTRIES)
+    max_stale = settings.get('max_stale', DEFAULT_PROFILE_CACHE_MAX_STALE)
+
+    if backend == 'sqlite':
+        return SqliteCache(settings.get('path', DEFAULT_SQLITE_PATH), ttl, max_entries, max_stale)
+
+    if backend == 'redis':
+        return RedisCache(
+            ttl,
+            max_entries,
+            max_stale,
+            url=settings.get('url', DEFAULT_REDIS_URL),
+            prefix=settings.get('prefix', DEFAULT_REDIS_PREFIX),
+        )
+
+    return ProfileCache(ttl, max_entries, max_stale, settings.get('max_bytes', DEFAULT_PROFILE_CACHE_MAX_BYTES))
+
+
+def get_stale_while_revalidate(config: Optional[Dict[str, Any]]) -> float:
+    """Return how long after expiry a profile is served while it is refreshed.
+
+    Args:
+        config: The loaded configuration, or ``None``.
+
+    Returns:
+        The ``cache.profile.stale_while_revalidate`` window in seconds, where
+        ``0`` (the default) always fetches expired profiles in the request.
+    """
+    return get_profile_cache_settings(config).get(
+        'stale_while_revalidate', DEFAULT_PROFILE_CACHE_STALE_WHILE_REVALIDATE
+    )
+
+
+def create_denied_cache(config: Optional[Dict[str, Any]]) -> TTLCache:
+    """Create the cache of denied tokens from the ``cache.denied`` settings.
+
+    Args:
+        config: The loaded configuration, or ``None``.
+
+    Returns:
+        A cache of denial reasons keyed by token hash, so that clients
+        retrying a rejected token are answered without calling GitHub.
+    """
+    settings: Dict[str, Any] = {}
+    if config and 'cache' in config and 'denied' in (config['cache'] or {}):
+        settings = config['cache']['denied'] or {}
+
+    return TTLCache(
+        ttl=settings.get('ttl', DEFAULT_DENIED_CACHE_TTL),
+        max_entries=settings.get('max_entries', DEFAULT_DENIED_CACHE_MAX_ENTRIES),
+    )
+
+
+def deny_token(token_hash: str, reason: str) -> None:
+    """Forget a token's cached profile and remember why it was denied.
+
+    Args:
+        token_hash: Hash of the denied token.
+        reason: The ``PermissionError`` message.
+    """
+    profile_cache.delete(token_hash)
+    denied_cache.set(token_hash, reason)
+    pre_refresher.forget(token_hash)
+
+
+def create_executor(config: Optional[Dict[str, Any]]) -> ThreadPoolExecutor:
+    """Create the thread pool used to call the GitHub API concurrently.
+
+    Args:
+        config: The loaded configuration, or ``None``.
+
+    Returns:
+        A thread pool bounded by ``github.max_workers``.
+    """
+    max_workers = DEFAULT_MAX_WORKERS
+    if config and 'github' in config and 'max_workers' in config['github']:
+        max_workers = config['github']['max_workers']
+
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='github')
+
+
+def get_user_info_with_scopes(github: GithubAuth) -> Any:
+    """Return the user's profile after validating the token's scopes.
+
+    The scopes are read from the ``/user`` response headers, which saves a
+    separate request to the GitHub API root.
+
+    Args:
+        github: The authenticated GitHub client.
+
+    Returns:
+        The decoded ``/user`` response.
+
+    Raises:
+        PermissionError: If GitHub rejects the token or a scope is missing.
+    """
+    info = github.get_user_info()
+    github.validate_scopes()
+    return info
+
+
+def get_graphql_profile_with_scopes(github: GithubAuth) -> Any:
+    """Return the GraphQL profile after validating the token's scopes.
+
+    Args:
+        github: The authenticated GitHub client.
+
+    Returns:
+        The profile, organizations and team slugs.
+
+    Raises:
+        PermissionError: If GitHub rejects the token or a scope is missing.
+    """
+    profile = github.get_graphql_profile(config)
+    github.validate_scopes()
+    return profile
+
+
+def wait_for_all(
+    futures: List[Future],
+    on_result: Optional[Callable[[int, Any], None]] = None,
+    cancelled: Optional[threading.Event] = None,
+) -> List[Any]:
+    """Return the results of ``futures``, failing on the first error.
+
+    As soon as any future fails, or ``on_result`` raises, futures that have
+    not started yet are cancelled and the error is re-raised. Cancelling is
+    best effort: a thread cannot be interrupted, so calls already running
+    go on in the background. Setting ``cancelled`` lets them stop before
+    their next GitHub request, for example before the next page of a list.
+
+    Args:
+        futures: The submitted calls.
+        on_result: Optional function called with the index and result of
+            each future as it completes.
+        cancelled: Optional event to set when failing.
+
+    Returns:
+        The results, in the order of ``futures``.
+    """
+    indexes = {future: index for index, future in enumerate(futures)}
+    pending = set(futures)
+
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+            errors: List[BaseException] = [
+                error for error in (future.exception() for future in done) if error is not None
+            ]
+            if errors:
+                # Prefer an authorization failure so the caller still gets a 401
+                raise next((e for e in errors if isinstance(e, PermissionError)), errors[0])
+
+            if on_result is not None:
+                for future in done:
+                    on_result(indexes[future], future.result())
+    except BaseException:
+        if cancelled is not None:
+            cancelled.set()
+        raise
+    finally:
+        for future in pending:
+            future.cancel()
+
+    return [future.result() for future in futures]
+
+
+def fetch_github_data(
+    github: GithubAuth,
+    checks: Optional[List[Tuple[str, RequirementCheck]]] = None,
+) -> Tuple[Any, Any, Any, List[str]]:
+    """Fetch everything ``/info`` needs from GitHub concurrently.
+
+    The profile, organizations, emails and teams do not depend on each
+    other, so they are issued together and the total latency is roughly that
+    of the slowest call. With ``github.api: graphql``, the profile,
+    organizations and teams come from GraphQL and only the emails from REST.
+
+    With ``github.org_check: membership``, the required organization is
+    checked with ``get_org_membership`` instead of listing ``/user/orgs``,
+    and it is the only organization returned.
+
+    While the organization directory has a current snapshot, only the
+    profile and emails are fetched at first. A member of the required organization then
+    gets their teams from the snapshot, and it is the only organization
+    returned; anyone else is checked with GitHub as usual.
+
+    Requirement ``checks`` run as soon as the data they need has arrived,
+    so a denied login fails without waiting for the other calls. Calls
+    still queued are cancelled, and calls already running stop before
+    their next request (see ``wait_for_all``).
+
+    Args:
+        github: The authenticated GitHub client.
+        checks: Optional pairs returned by ``get_requirement_checks``.
+
+    Returns:
+        The user profile, organizations, email addresses and team slugs.
+
+    Raises:
+        PermissionError: If GitHub rejects the token, a scope is missing or
+            a requirement fails.
+        RateLimitError: If GitHub is rate limiting the token.
+        RuntimeError: If GitHub returns an unexpected status.
+    """
+    current = get_settings()
+    data: Dict[str, Any] = {}
+
+    if current.api_mode == 'graphql':
+        def on_graphql_result(index: int, result: Any) -> None:
+            if index == 0:
+                data['info'], data['orgs'], data['teams'] = result
+            else:
+                data['emails'] = result
+            run_requirement_checks(checks or [], data)
+
+        (info, orgs, teams), emails = wait_for_all([
+            executor.submit(get_graphql_profile_with_scopes, github),
+            executor.submit(github.get_email_addresses, current.raw),
+        ], on_graphql_result, github.cancelled)
+        return info, orgs, emails, teams
+
+    membership_org = current.membership_org
+    org_source = 'orgs' if membership_org is None else 'membership'
+
+    def collect(sources: Tuple[str, ...]) -> Callable[[int, Any], None]:
+        def on_rest_result(index: int, result: Any) -> None:
+            data[sources[index]] = result
+            run_requirement_checks(checks or [], data)
+
+        return on_rest_result
+
+    def submit_org_check() -> Future:
+        if membership_org is None:
+            return executor.submit(github.get_org_list, current.raw)
+        return executor.submit(github.get_org_membership, membership_org)
+
+    snapshot = org_directory.current()
+
+    if snapshot is None:
+        info, orgs, emails, teams = wait_for_all([
+            executor.submit(get_user_info_with_scopes, github),
+            submit_org_check(),
+            executor.submit(github.get_email_addresses, current.raw),
+            executor.submit(github.get_user_teams, current.raw),
+        ], collect(('info', org_source, 'emails', 'teams')), github.cancelled)
+    else:
+        info, emails = wait_for_all([
+            executor.submit(get_user_info_with_scopes, github),
+            executor.submit(github.get_email_addresses, current.raw),
+        ], collect(('info', 'emails')), github.cancelled)
+        directory_teams = snapshot.roles.get(info['login'].lower())
+
+        if directory_teams is not None:
+            return info, [{'login': snapshot.org}], emails, list(directory_teams)
+
+        # Not a member as of the last sync; the user may have joined since
+        orgs, teams = wait_for_all([
+            submit_org_check(),
+            executor.submit(github.get_user_teams, current.raw),
+        ], collect((org_source, 'teams')), github.cancelled)
+
+    if membership_org is not None:
+        # The full list is not fetched; the profile only names the required org
+        orgs = [{'login': membership_org}] if orgs else []
+
+    return info, orgs, emails, teams
+
+
+def load_profile(github: GithubAuth) -> Dict[str, str]:
+    """Fetch a user's GitHub data, enforce the requirements and build the profile.
+
+    Args:
+        github: The authenticated GitHub client.
+
+    Returns:
+        The Spinnaker user profile.
+
+    Raises:
+        PermissionError: If GitHub rejects the token or a requirement fails.
+        RateLimitError: If GitHub is rate limiting the token.
+        RuntimeError: If GitHub returns an unexpected status.
+    """
+    info, orgs, emails, teams = fetch_github_data(github, list(get_settings().checks))
+    return build_user_info(info, orgs, emails, teams)
+
+
+def fetch_profile(github: GithubAuth, token_hash: str) -> Dict[str, str]:
+    """Load a user's profile and store it in the profile cache.
+
+    Args:
+        github: The authenticated GitHub client.
+        token_hash: Hash of the client's token.
+
+    Returns:
+        The Spinnaker user profile.
+
+    Raises:
+        PermissionError: If GitHub rejects the token or a requirement fails.
+        RateLimitError: If GitHub is rate limiting the token.
+        RuntimeError: If GitHub returns an unexpected status.
+    """
+    user_info = load_profile(github)
+    profile_cache.set(token_hash, user_info)
+    pre_refresher.schedule(token_hash)
+    return user_info
+
+
+def claim_refresh(token_hash: str) -> bool:
+    """Mark a token's profile as being refreshed in the background.
+
+    Args:
+        token_hash: Hash of the token.
+
+    Returns:
+        ``True`` if the caller should start the refresh, or ``False`` if
+        one is already running.
+    """
+    with refreshing_lock:
+        if token_hash in refreshing:
+            return False
+
+        refreshing.add(token_hash)
+        return True
+
+
+def release_refresh(token_hash: str) -> None:
+    """Mark a token's background refresh as finished.
+
+    Args:
+        token_hash: Hash of the token.
+    """
+    with refreshing_lock:
+        refreshing.discard(token_hash)
+
+
+def refresh_profile(access_token: str, token_hash: str) -> None:
+    """Fetch a fresh profile for an expired cache entry.
+
+    A revoked token is evicted and denied at once. Any other failure keeps
+    the expired entry, so the next request retries the refresh.
+
+    Args:
+        access_token: The GitHub OAuth access token.
+        token_hash: Hash of the token.
+    """
+    try:
+        profile_flight.do(token_hash, fetch_profile, GithubAuth(access_token), token_hash)
+    except PermissionError as e:
+        deny_token(token_hash, str(e))
+        app.logger.warning('Authorization failed during refresh: %s', e)
+    except Exception as e:
+        app.logger.warning('Failed to refresh cached profile: %s', e)
+    finally:
+        release_refresh(token_hash)
+
+
+def get_revalidating_profile(access_token: str, token_hash: str) -> Optional[Dict[str, str]]:
+    """Return a recently expired profile and refresh it in the background.
+
+    Args:
+        access_token: The GitHub OAuth access token.
+        token_hash: Hash of the token.
+
+    Returns:
+        The profile if it expired within the ``stale_while_revalidate``
+        window, otherwise ``None``.
+    """
+    window = get_stale_while_revalidate(config)
+
+    if window <= 0:
+        return None
+
+    stale_user_info = profile_cache.get_stale(token_hash, within=window)
+
+    if stale_user_info is not None and claim_refresh(token_hash):
+        refresh_executor.submit(refresh_profile, access_token, token_hash)
+
+    return stale_user_info
+
+
+class PreRefresher:
+    """Refresh the cached profiles of recently active users before they expire.
+
+    Every ``/info`` request marks its token as seen, and every stored
+    profile is scheduled for a refresh shortly before it expires: ``lead``
+    seconds early, plus a random share of ``jitter`` seconds so that
+    profiles cached at the same moment are not all refreshed together. A
+    refresh goes through ``refresh_profile``, so the ``required`` checks
+    are applied again and a rejected token is denied at once.
+
+    Refreshing stops for a token once it has not been seen for
+    ``active_window`` seconds, and is skipped while GitHub reports fewer
+    than ``min_rate_limit_remaining`` requests left for it, leaving them to
+    the user's own logins.
+
+    The tokens have to be kept to call GitHub on the user's behalf; they
+    only ever live in this process's memory, never in the profile cache.
+    The refresh thread is started with the first scheduled profile.
+
+    Attributes:
+        active_window: Seconds after its last request that a token keeps
+            being refreshed; ``0`` disables pre-refreshing.
+        lead: Seconds before expiry that a refresh is due.
+        jitter: Up to this many more seconds, chosen at random, of lead.
+        min_rate_limit_remaining: Fewest remaining GitHub requests a token
+            must have for a refresh.
+        max_tokens: Most tokens tracked; the least recently seen is dropped.
+    """
+
+    def __init__(
+        self,
+        active_window: float,
+        lead: float,
+        jitter: float,
+        min_rate_limit_remaining: int,
+        max_tokens: int,
+    ) -> None:
+        """Initialize a refresher tracking no tokens.
+
+        Args:
+            active_window: Seconds a token keeps being refreshed after its
+                last request.
+            lead: Seconds before expiry that a refresh is due.
+            jitter: Maximum random extra lead, in seconds.
+            min_rate_limit_remaining: Fewest remaining GitHub requests a
+                token must have for a refresh.
+            max_tokens: Most tokens tracked.
+        """
+        self.active_window = active_window
+        self.lead = lead
+        self.jitter = jitter
+        self.min_rate_limit_remaining = min_rate_limit_remaining
+        self.max_tokens = max_tokens
+        # Token and last request time, by token hash, least recently seen first
+        self._tokens: 'OrderedDict[str, Tuple[str, float]]' = OrderedDict()
+        # When each token's refresh is due, and the same as a heap; heap
+        # entries that no longer match ``_due`` were rescheduled
+        self._due: Dict[str, float] = {}
+        self._queue: List[Tuple[float, str]] = []
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+
+    @property
+    def enabled(self) -> bool:
+        """Return whether profiles are refreshed at all."""
+        return self.active_window > 0 and profile_cache.enabled
+
+    def seen(self, access_token: str, token_hash: str) -> None:
+        """Record a request with a token.
+
+        Args:
+            access_token: The GitHub OAuth access token.
+            token_hash: Hash of the token.
+        """
+        if not self.enabled:
+            return
+
+        with self._condition:
+            self._tokens[token_hash] = (access_token, time.monotonic())
+            self._tokens.move_to_end(token_hash)
+
+            while len(self._tokens) > self.max_tokens:
+                self._due.pop(self._tokens.popitem(last=False)[0], None)
+
+    def schedule(self, token_hash: str) -> None:
+        """Schedule a refresh of a profile that was just stored.
+
+        Profiles of tokens that were not seen are not scheduled.
+
+        Args:
+            token_hash: Hash of the profile's token.
+        """
+        if not self.enabled:
+            return
+
+        ttl = profile_cache.ttl
+        # Never refresh sooner than halfway through the TTL, whatever the
+        # lead, so short TTLs cannot turn into a busy loop
+        delay = max(ttl - self.lead - random.uniform(0, self.jitter), ttl / 2)
+
+        with self._condition:
+            if token_hash not in self._tokens:
+                return
+
+            due = time.monotonic() + delay
+            self._due[token_hash] = due
+            heapq.heappush(self._queue, (due, token_hash))
+            self._condition.notify()
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, name='pre-refresh', daemon=True)
+                self._thread.start()
+
+    def forget(self, token_hash: str) -> None:
+        """Stop tracking a token, for example because GitHub rejected it.
+
+        Args:
+            token_hash: Hash of the token.
+        """
+        with self._condition:
+            self._tokens.pop(token_hash, None)
+            self._due.pop(token_hash, None)
+
+    def pop_due(self, now: float) -> List[Tuple[str, str]]:
+        """Take the refreshes that are due.
+
+        Tokens that were not seen within ``active_window`` are dropped.
+
+        Args:
+            now: The current ``time.monotonic()``.
+
+        Returns:
+            The ``(access_token, token_hash)`` pairs to refresh.
+        """
+        due: List[Tuple[str, str]] = []
+
+        with self._condition:
+            while self._queue and self._queue[0][0] <= now:
+                when, token_hash = heapq.heappop(self._queue)
+
+                if self._due.get(token_hash) != when:
+                    continue
+
+                del self._due[token_hash]
+                access_token, last_seen = self._tokens[token_hash]
+
+                if last_seen + self.active_window <= now:
+                    del self._tokens[token_hash]
+                    continue
+
+                due.append((access_token, token_hash))
+
+        return due
+
+    def within_budget(self, token_hash: str) -> bool:
+        """Return whether a token has enough of its rate limit left for a refresh.
+
+        Args:
+            token_hash: Hash of the token.
+
+        Returns:
+            ``False`` while the token is throttled or has fewer than
+            ``min_rate_limit_remaining`` requests left.
+        """
+        rate_limiter = github_auth.rate_limiter
+
+        if rate_limiter.retry_after(token_hash) > 0:
+            return False
+
+        remaining = rate_limiter.remaining(token_hash)
+        return remaining is None or remaining >= self.min_rate_limit_remaining
+
+    def refresh_due(self, now: float) -> int:
+        """Start the refreshes that are due.
+
+        A skipped refresh is not retried: the user's next login fetches
+        the profile, which schedules it again.
+
+        Args:
+            now: The current ``time.monotonic()``.
+
+        Returns:
+            The number of refreshes started.
+        """
+        started = 0
+
+        for access_token, token_hash in self.pop_due(now):
+            if self.within_budget(token_hash) and claim_refresh(token_hash):
+                refresh_executor.submit(refresh_profile, access_token, token_hash)
+                started += 1
+
+        return started
+
+    def run(self) -> None:
+        """Start refreshes as they fall due, until ``stop`` is called.
+
+        An error is logged and the loop carries on, as ``start`` does not
+        restart a thread that has ended.
+        """
+        while True:
+            with self._condition:
+                if self._stopped:
+                    return
+
+                timeout = self._queue[0][0] - time.monotonic() if self._queue else None
+
+                if timeout is None or timeout > 0:
+                    self._condition.wait(timeout)
+                    continue
+
+            try:
+                self.refresh_due(time.monotonic())
+            except Exception:
+                app.logger.exception('Could not start profile pre-refreshes')
+
+    def stop(self) -> None:
+        """Stop the refresh thread."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def clear(self) -> None:
+        """Forget every token."""
+        with self._condition:
+            self._tokens.clear()
+            self._due.clear()
+            self._queue.clear()
+
+
+def create_pre_refresher(config: Optional[Dict[str, Any]]) -> PreRefresher:
+    """Create the profile pre-refresher from ``cache.profile.pre_refresh``.
+
+    Args:
+        config: The loaded configuration, or ``None``.
+
+    Returns:
+        The refresher, disabled unless ``active_window`` is set.
+    """
+    settings = get_profile_cache_settings(config).get('pre_refresh') or {}
+
+    return PreRefresher(
+        active_window=settings.get('active_window', DEFAULT_PRE_REFRESH_ACTIVE_WINDOW),
+        lead=settings.get('lead', DEFAULT_PRE_REFRESH_LEAD),
+        jitter=settings.get('jitter', DEFAULT_PRE_REFRESH_JITTER),
+        min_rate_limit_remaining=settings.get(
+            'min_rate_limit_remaining', DEFAULT_PRE_REFRESH_MIN_RATE_LIMIT_REMAINING
+        ),
+        max_tokens=settings.get('max_tokens', DEFAULT_PRE_REFRESH_MAX_TOKENS),
+    )
+
+
+class OrgSnapshot(NamedTuple):
+    """The required organization's members and teams as of one directory sync.
+
+    Attributes:
+        org: The organization login, as configured.
+        teams: The lowercased logins of each team's members, by team slug.
+        roles: The slugs of the teams each member belongs to, sorted, by
+            lowercased login. Every member of the organization has an entry.
+        synced: ``time.monotonic()`` when the sync finished.
+    """
+
+    org: str
+    teams: Mapping[str, FrozenSet[str]]
+    roles: Mapping[str, Tuple[str, ...]]
+    synced: float
+
+
+def index_roles(
+    members: Set[str],
+    teams: Mapping[str, FrozenSet[str]],
+    previous: Optional[OrgSnapshot] = None,
+) -> Dict[str, Tuple[str, ...]]:
+    """Return the team slugs of every member, by lowercased login.
+
+    Given the previous snapshot, only the members who joined, left or
+    changed teams since are looked up again; everyone else keeps their
+    previous entry.
+
+    Args:
+        members: The lowercased logins of the organization's members.
+        teams: The lowercased logins of each team's members, by team slug.
+        previous: The snapshot of the same organization to update, if any.
+
+    Returns:
+        The sorted team slugs of each member.
+    """
+    if previous is None:
+        changed = members
+    else:
+        changed = members - previous.roles.keys()
+        for slug in teams.keys() | previous.teams.keys():
+            changed |= teams.get(slug, frozenset()) ^ previous.teams.get(slug, frozenset())
+
+    roles = {login: previous.roles[login] for login in members - changed} if previous is not None else {}
+    slugs = sorted(teams)
+
+    for login in changed & members:
+        roles[login] = tuple(slug for slug in slugs if login in teams[slug])
+
+    return roles
+
+
+class OrgDirectory:
+    """Snapshot of the required organization's members and their teams.
+
+    A background thread syncs the snapshot every ``interval`` seconds with
+    a service token, so that logins can check membership of
+    ``github.required.org`` and read the user's teams with a dictionary
+    lookup instead of listing ``/user/orgs`` and ``/user/teams`` with the
+    user's token. Every REST list is requested with ``If-None-Match``, so a
+    sync in which nothing changed is answered with HTTP 304s, which do not
+    count against the rate limit, and only the members whose teams changed
+    are indexed again. Teams with child teams are listed with GraphQL, so
+    that, as in ``/user/teams``, their roles only go to direct members.
+
+    Only members are answered from the snapshot: a user it does not list
+    may have joined since, so their login goes to GitHub as before. A user
+    who leaves the organization or a team keeps it for up to ``interval``
+    seconds, unless a GitHub webhook event reports the change sooner (see
+    ``apply_github_event``). Once the last successful sync is older than
+    ``max_age``, the snapshot is ignored until the next one succeeds.
+
+    Attributes:
+        interval: Seconds between syncs; ``0`` disables the directory.
+        max_age: Seconds after its sync that the snapshot is still used.
+        snapshot: The latest snapshot, or ``None`` before the first sync.
+    """
+
+    def __init__(self, interval: float, max_age: float, token: Optional[str]) -> None:
+        """Initialize a directory without a snapshot.
+
+        Args:
+            interval: Seconds between syncs.
+            max_age: Seconds after its sync that a snapshot is used.
+            token: The service token used to list the organization, or
+                ``None`` to disable the directory.
+        """
+        self.interval = interval
+        self.max_age = max_age
+        self.snapshot: Optional[OrgSnapshot] = None
+        self._token = token
+        self._created = time.monotonic()
+        # Bumped by every event applied to the snapshot, so that a sync
+        # whose lists may predate the event does not undo it
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        """Return whether the directory is synced at all."""
+        return self.interval > 0 and bool(self._token)
+
+    def age(self) -> float:
+        """Return the seconds since the last successful sync, or since startup without one."""
+        snapshot = self.snapshot
+        return time.monotonic() - (snapshot.synced if snapshot is not None else self._created)
+
+    def current(self) -> Optional[OrgSnapshot]:
+        """Return the snapshot if logins can use it.
+
+        Returns:
+            The latest snapshot, unless it is older than ``max_age`` or was
+            taken for another organization than ``github.required.org``.
+        """
+        snapshot = self.snapshot
+
+        if (
+            snapshot is None
+            or snapshot.org.lower() != get_settings().required_org
+            or snapshot.synced + self.max_age <= time.monotonic()
+        ):
+            return None
+
+        return snapshot
+
+    def sync(self) -> Optional[OrgSnapshot]:
+        """List the required organization's members and teams again.
+
+        Returns:
+            The new snapshot, or ``None`` when no organization is required
+            or an event was applied to the snapshot while listing.
+
+        Raises:
+            PermissionError: If GitHub rejects the service token.
+            RateLimitError: If the service token is rate limited.
+            RuntimeError: If GitHub returns an unexpected status.
+        """
+        org = get_required(config).get('org')
+
+        if org is None:
+            return None
+
+        generation = self._generation
+        github = GithubAuth(self._token or '')
+        members = {login.lower() for login in github.get_org_members(org)}
+        parents = github.get_org_teams(org)
+        # Roles must match ``/user/teams``, which only lists direct
+        # memberships, but GitHub's REST list of a parent team's members
+        # includes its child teams' members
+        nested = set(parents.values())
+        teams = {
+            slug: frozenset(
+                login.lower()
+                for login in (
+                    github.get_direct_team_members(org, slug) if slug in nested
+                    else github.get_team_members(org, slug)
+                )
+            )
+            for slug in parents
+        }
+
+        with self._lock:
+            if generation != self._generation:
+                return None
+
+            previous = self.snapshot if self.snapshot is not None and self.snapshot.org == org else None
+            self.snapshot = OrgSnapshot(
+                org=org,
+                teams=MappingProxyType(teams),
+                roles=MappingProxyType(index_roles(members, teams, previous)),
+                synced=time.monotonic(),
+            )
+            return self.snapshot
+
+    def _update(self, org: str, change: Callable[[Set[str], Dict[str, FrozenSet[str]]], None]) -> None:
+        """Apply an event to the snapshot of ``org``, if there is one.
+
+        Args:
+            org: The organization the event is about.
+            change: Updates the lowercased member logins and the members of
+                each team, by team slug, in place.
+        """
+        with self._lock:
+            snapshot = self.snapshot
+
+            if snapshot is None or snapshot.org.lower() != org.lower():
+                return
+
+            members = set(snapshot.roles)
+            teams = dict(snapshot.teams)
+            change(members, teams)
+            self.snapshot = snapshot._replace(
+                teams=MappingProxyType(teams),
+                roles=MappingProxyType(index_roles(members, teams, snapshot)),
+            )
+            self._generation += 1
+
+    def update_member(self, org: str, login: str, member: bool) -> None:
+        """Record that a user joined or left the organization.
+
+        Args:
+            org: The organization login.
+            login: The user's GitHub login.
+            member: Whether the user is now a member.
+        """
+        login = login.lower()
+
+        def change(members: Set[str], teams: Dict[str, FrozenSet[str]]) -> None:
+            if member:
+                members.add(login)
+                return
+
+            members.discard(login)
+            for slug, logins in teams.items():
+                teams[slug] = logins - {login}
+
+        self._update(org, change)
+
+    def update_team_member(self, org: str, team: str, login: str, member: bool) -> None:
+        """Record that a user was added to or removed from a team.
+
+        Args:
+            org: The organization login.
+            team: The team slug.
+            login: The user's GitHub login.
+            member: Whether the user is now a member of the team.
+        """
+        login = login.lower()
+
+        def change(members: Set[str], teams: Dict[str, FrozenSet[str]]) -> None:
+            logins = teams.get(team, frozenset())
+            teams[team] = logins | {login} if member else logins - {login}
+
+        self._update(org, change)
+
+    def remove_team(self, org: str, team: str) -> None:
+        """Record that a team was deleted.
+
+        Args:
+            org: The organization login.
+            team: The team slug.
+        """
+        def change(members: Set[str], teams: Dict[str, FrozenSet[str]]) -> None:
+            teams.pop(team, None)
+
+        self._update(org, change)
+
+    def resync(self) -> None:
+        """Sync again now rather than at the next interval."""
+        self._wake.set()
+
+    def run(self) -> None:
+        """Sync every ``interval`` seconds, until ``stop`` is called.
+
+        A failed sync is logged and retried at the next interval, keeping
+        the previous snapshot until it is older than ``max_age``.
+        """
+        while True:
+            started = time.perf_counter()
+
+            try:
+                snapshot = self.sync()
+            except Exception as e:
+                app.logger.warning('Could not sync the Github organization directory: %s', e)
+                metrics.observe_directory_sync(time.perf_counter() - started, None)
+            else:
+                if snapshot is not None:
+                    metrics.observe_directory_sync(time.perf_counter() - started, len(snapshot.roles))
+
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+            if self._stopped.is_set():
+                return
+
+    def start(self) -> None:
+        """Start the sync thread, if the directory is enabled."""
+        if self.enabled and self._thread is None:
+            metrics.register_directory(self.age)
+            self._thread = threading.Thread(target=self.run, name='org-directory', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the sync thread."""
+        self._stopped.set()
+        self._wake.set()
+
+
+def create_org_directory(config: Optional[Dict[str, Any]]) -> OrgDirectory:
+    """Create the organization directory from ``github.directory``.
+
+    The service token is read from the environment variable named by
+    ``token_env``, so it never has to be written to ``config.yml``.
+
+    Args:
+        config: The loaded configuration, or ``None``.
+
+    Returns:
+        The directory, disabled unless ``interval`` is set and the token
+        is present.
+    """
+    settings: Dict[str, Any] = {}
+    if config and 'github' in config:
+        settings = config['github'].get('directory') or {}
+
+    token_env = settings.get('token_env', DEFAULT_DIRECTORY_TOKEN_ENV)
+    directory = OrgDirectory(
+        interval=settings.get('interval', DEFAULT_DIRECTORY_INTERVAL),
+        max_age=settings.get('max_age', DEFAULT_DIRECTORY_MAX_AGE),
+        token=os.environ.get(token_env),
+    )
+
+    if directory.interval > 0 and not directory.enabled:
+        app.logger.warning('Organization directory disabled: %s is not set', token_env)
+
+    return directory
+
+
+def get_github_webhook_secret(config: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Return the secret GitHub signs webhook deliveries with.
+
+    The secret is read from the environment variable named by
+    ``github.webhook.secret_env``, so it never has to be written to
+    ``config.yml``.
+
+    Args:
+        config: The loaded configuration, or ``None``.
+
+    Returns:
+        The secret, or ``None`` when it is not set, which disables the
+        webhook route.
+    """
+    settings: Dict[str, Any] = {}
+    if config and 'github' in config:
+        settings = config['github'].get('webhook') or {}
+
+    return os.environ.get(settings.get('secret_env', DEFAULT_GITHUB_WEBHOOK_SECRET_ENV)) or None
+
+
+def verify_github_signature(secret: str, body: bytes, signature: Optional[str]) -> bool:
+    """Return whether a webhook delivery was signed with ``secret``.
+
+    Args:
+        secret: The webhook secret.
+        body: The raw request body.
+        signature: The ``X-Hub-Signature-256`` header, if any.
+
+    Returns:
+        ``True`` if the signature is the body's HMAC-SHA256 under ``secret``.
+    """
+    expected = 'sha256=' + hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+    return signature is not None and hmac.compare_digest(expected, signature)
+
+
+def evict_user(login: str) -> int:
+    """Drop every cached profile of a GitHub user.
+
+    Args:
+        login: The user's GitHub login.
+
+    Returns:
+        The number of profiles dropped.
+    """
+    username = get_username(login)
+    return profile_cache.delete_where(lambda profile: profile.get('username') == username)
+
+
+def evict_team(team: str) -> int:
+    """Drop every cached profile with a team among its roles.
+
+    Args:
+        team: The team slug.
+
+    Returns:
+        The number of profiles dropped.
+    """
+    return profile_cache.delete_where(lambda profile: team in profile.get('roles', '').split(','))
+
+
+def apply_github_event(event: str, payload: Dict[str, Any]) -> Optional[int]:
+    """Apply a GitHub webhook event about the required organization.
+
+    Organization membership changes (``organization`` events) and team
+    membership changes (``membership`` events) drop the user's cached
+    profiles, and deleted teams (``team`` events) drop every profile with
+    that role, so that the next login fetches them again. The organization
+    directory is patched the same way. A renamed team drops every profile
+    and syncs the directory again, since events do not name the old slug.
+
+    Args:
+        event: The ``X-GitHub-Event`` header.
+        payload: The decoded delivery.
+
+    Returns:
+        The number of profiles dropped, or ``None`` if the event does not
+        affect profiles: other events and actions, other organizations, or
+        ``member`` events, which are about repository collaborators.
+    """
+    org = (payload.get('organization') or {}).get('login') or ''
+    required_org = get_settings().required_org
+    action = payload.get('action')
+
+    if required_org is None or org.lower() != required_org:
+        return None
+
+    if event == 'organization' and action in ('member_added', 'member_removed'):
+        login = payload['membership']['user']['login']
+        org_directory.update_member(org, login, action == 'member_added')
+        return evict_user(login)
+
+    if event == 'membership' and payload.get('scope') == 'team' and action in ('added', 'removed'):
+        login = payload['member']['login']
+        org_directory.update_team_member(org, payload['team']['slug'], login, action == 'added')
+        return evict_user(login)
+
+    if event == 'team' and action == 'deleted':
+        team = payload['team']['slug']
+        org_directory.remove_team(org, team)
+        return evict_team(team)
+
+    if event == 'team' and action == 'edited' and 'name' in (payload.get('changes') or {}):
+        org_directory.resync()
+        return profile_cache.delete_where(lambda profile: True)
+
+    return None
+
+
+def handle_github_event(event: Optional[str], signature: Optional[str], body: bytes) -> Tuple[int, Dict[str, Any]]:
+    """Verify and apply a GitHub webhook delivery.
+
+    Args:
+        event: The ``X-GitHub-Event`` header, if any.
+        signature: The ``X-Hub-Signature-256`` header, if any.
+        body: The raw request body.
+
+    Returns:
+        The HTTP status and JSON body of the response.
+    """
+    if github_webhook_secret is None or not verify_github_signature(github_webhook_secret, body, signature):
+        # The event header is not trusted until the signature is verified
+        metrics.observe_github_event('unverified', 'rejected')
+        return 401, {'status': 'error', 'msg': 'Unauthorized', 'detail': 'Invalid signature'}
+
+    event = event or 'unknown'
+
+    try:
+        payload = json.loads(body)
+        evicted = apply_github_event(event, payload)
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        metrics.observe_github_event(event, 'rejected')
+        return 400, {'status': 'error', 'msg': 'Bad Request', 'detail': f'Malformed {event} event: {e!r}'}
+
+    if evicted is None:
+        metrics.observe_github_event(event, 'ignored')
+        return 200, {'status': 'ignored'}
+
+    metrics.observe_github_event(event, 'applied')
+    app.logger.info('Applied Github %s event (%s): dropped %d cached profiles', event, payload['action'], evicted)
+    return 200, {'status': 'ok', 'evicted': evicted}
+
+
+def get_prewarm(config: Optional[Dict[str, Any]]) -> bool:
+    """Return whether to connect to GitHub at startup, from ``github.prewarm``.
+
+    Args:
+        config: The loaded configuration, or ``None``.
+
+    Returns:
+        ``True`` to open a connection before the first login.
+    """
+    return bool(config and 'github' in config and config['github'].get('prewarm'))
+
+
+def prewarm_connections() -> None:
+    """Connect to GitHub so the first login skips the TCP and TLS handshakes.
+
+    Failures are logged and otherwise ignored: the first login then simply
+    connects by itself.
+    """
+    try:
+        github_auth.prewarm()
+    except Exception as e:
+        app.logger.warning('Could not pre-warm the connection to Github: %s', e)
+
+
+def report_startup(phases: Dict[str, float]) -> None:
+    """Log and export how long the proxy took to start.
+
+    Args:
+        phases: Seconds spent, by phase name.
+    """
+    metrics.observe_startup(phases)
+    app.logger.info(
+        'Started in %.1f ms (%s); %.1f ms of CPU since the interpreter started, imports included',
+        sum(phases.values()) * 1000,
+        ', '.join(f'{phase} {seconds * 1000:.1f} ms' for phase, seconds in phases.items()),
+        time.process_time() * 1000,
+    )
 
 
 def get_username(login: str) -> str:
@@ -182,21 +1863,120 @@ def get_username(login: str) -> str:
     Returns:
         The mapped username if a mapping exists, otherwise ``login``.
     """
-    if config \
-            and 'spinnaker' in config \
-            and 'username_mapping' in config['spinnaker'] \
-            and login in config['spinnaker']['username_mapping']:
-        return config['spinnaker']['username_mapping'][login]
-    else:
-        return login
+    return get_settings().username_mapping.get(login, login)
+
+
+def build_user_info(
+    info: Dict[str, Any],
+    orgs: List[Dict[str, Any]],
+    emails: List[Dict[str, Any]],
+    teams: List[str],
+) -> Dict[str, str]:
+    """Build the Spinnaker user profile from the GitHub data.
+
+    Args:
+        info: The ``/user`` response.
+        orgs: The list of organizations from GitHub.
+        emails: The list of email entries from GitHub.
+        teams: The team slugs in the required organization.
+
+    Returns:
+        The fields Spinnaker's ``userInfoMapping`` expects.
+    """
+    name = (info.get('name') or '').strip()
+    name_parts = name.split()
+    firstname = name_parts[0] if name_parts else ''
+    lastname = name_parts[-1] if len(name_parts) > 1 else ''
+
+    primary_email = ''
+    org_list = []
+
+    for email in emails:
+        if email.get('primary'):
+            primary_email = email.get('email', '')
+
+    for org in orgs:
+        org_list.append(org.get('login', ''))
+
+    org_memberships = ','.join(org_list)
+
+    return {
+        'username': get_username(info['login']),
+        'firstname': firstname,
+        'lastname': lastname,
+        'email': primary_email,
+        'roles': ','.join(teams),
+        # You could use a regex to check this, but it can possibly match
+        # orgs with similar names instead of doing exact matching
+        'orgs': org_memberships,
+        # This should actually be checked by Gate but is not
+        'organizations_url': 'https://api.github.com/user/orgs',
+    }
 
 
 app = Flask(__name__)
+startup_phases: Dict[str, float] = {}
+phase_started = time.perf_counter()
 config: Optional[Dict[str, Any]] = load_config()
 
 if config:
     validate_config(config)
 
+settings = compile_config(config)
+config_watcher = ConfigWatcher(CONFIG_PATH, get_config_reload_interval(config))
+startup_phases['config'] = time.perf_counter() - phase_started
+phase_started = time.perf_counter()
+
+configure_http(config)
+configure_response_cache(config)
+configure_rate_limit(config)
+profile_cache = create_profile_cache(config)
+denied_cache = create_denied_cache(config)
+executor = create_executor(config)
+# Background refreshes get their own pool: they submit to ``executor``
+# themselves, so sharing it could starve them of workers
+refresh_executor = ThreadPoolExecutor(max_workers=DEFAULT_REFRESH_WORKERS, thread_name_prefix='refresh')
+# Concurrent /info calls with the same token share a single GitHub fetch
+profile_flight = SingleFlight()
+refreshing: Set[str] = set()
+refreshing_lock = threading.Lock()
+pre_refresher = create_pre_refresher(config)
+org_directory = create_org_directory(config)
+org_directory.start()
+github_webhook_secret = get_github_webhook_secret(config)
+metrics.register_cache('profile', lambda: profile_cache)
+metrics.register_cache('denied', lambda: denied_cache)
+metrics.register_cache('etag', lambda: github_auth.response_cache)
+startup_phases['setup'] = time.perf_counter() - phase_started
+
+if get_prewarm(config):
+    phase_started = time.perf_counter()
+    prewarm_connections()
+    startup_phases['prewarm'] = time.perf_counter() - phase_started
+
+report_startup(startup_phases)
+
+
+@app.before_request
+def start_info_request():
+    """Start timing ``/info`` requests."""
+    if request.path == '/info':
+        g.info_started = metrics.start_info_request()
+
+
+@app.before_request
+def watch_config():
+    """Pick up changes to ``config.yml``."""
+    config_watcher.check()
+
+
+@app.after_request
+def finish_info_request(response):
+    """Record the latency and status of ``/info`` requests."""
+    if 'info_started' in g:
+        metrics.finish_info_request(g.info_started, response.status_code)
+    return response
+
 
 @app.errorhandler(404)
 def not_found(error):
@@ -231,6 +2011,31 @@ def ping():
     ), 200)
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics_handler():
+    """Return the proxy's metrics in the Prometheus text format."""
+    body, content_type = metrics.render()
+    return Response(body, status=200, content_type=content_type)
+
+
+@app.route(GITHUB_WEBHOOK_PATH, methods=['POST'])
+def github_webhook_handler():
+    """Apply organization and team changes that GitHub reports to the caches.
+
+    Deliveries must be signed with the secret from ``github.webhook``; the
+    route is not found while no secret is set.
+    """
+    if github_webhook_secret is None:
+        return not_found(None)
+
+    status, body = handle_github_event(
+        request.headers.get('X-GitHub-Event'),
+        request.headers.get('X-Hub-Signature-256'),
+        request.get_data(),
+    )
+    return make_response(jsonify(body), status)
+
+
 @app.route('/info', methods=['GET'])
 def webhook_handler():
     """Handle the ``/info`` endpoint for Spinnaker's user info URI.
@@ -261,46 +2066,37 @@ def webhook_handler():
 
         auth = auth_header.split(' ')
         access_token = auth[-1]
+        token_hash = hash_token(access_token)
+        denial = denied_cache.get(token_hash)
+
+        if denial is not None:
+            return make_response(jsonify(
+                {
+                    'status': 'error',
+                    'msg': 'Unauthorized',
+                    'detail': denial
+                }
+            ), 401)
+
+        pre_refresher.seen(access_token, token_hash)
         github = GithubAuth(access_token)
-        github.validate_scopes()
-        info = github.get_user_info()
-        orgs = github.get_org_list()
-        emails = github.get_email_addresses()
-        teams = github.get_user_teams(config)
-        validate_auth_requirements(config, info['login'], orgs, emails)
-
-        name = (info.get('name') or '').strip()
-        name_parts = name.split()
-        firstname = name_parts[0] if name_parts else ''
-        lastname = name_parts[-1] if len(name_parts) > 1 else ''
-
-        primary_email = ''
-        org_list = []
-
-        for email in emails:
-            if email.get('primary'):
-                primary_email = email.get('email', '')
-
-        for org in orgs:
-            org_list.append(org.get('login', ''))
-
-        org_memberships = ','.join(org_list)
-
-        user_info = {
-            'username': get_username(info['login']),
-            'firstname': firstname,
-            'lastname': lastname,
-            'email': primary_email,
-            'roles': ','.join(teams),
-            # You could use a regex to check this, but it can possibly match
-            # orgs with similar names instead of doing exact matching
-            'orgs': org_memberships,
-            # This should actually be checked by Gate but is not
-            'organizations_url': 'https://api.github.com/user/orgs',
-        }
+        cached_user_info = profile_cache.get(token_hash)
 
+        if cached_user_info is not None:
+            return make_response(jsonify(cached_user_info), 200)
+
+        stale_user_info = get_revalidating_profile(access_token, token_hash)
+
+        if stale_user_info is not None:
+            return make_response(jsonify(stale_user_info), 200)
+
+        user_info = profile_flight.do(token_hash, fetch_profile, github, token_hash)
         return make_response(jsonify(user_info), 200)
     except PermissionError as e:
+        # GitHub rejected the token (HTTP 401/403) or a requirement failed,
+        # so never keep serving a previously cached profile for it, and
+        # answer retries with the same token without calling GitHub
+        deny_token(token_hash, str(e))
         app.logger.warning('Authorization failed: %s', e)
         return make_response(jsonify(
             {
@@ -309,10 +2105,35 @@ def webhook_handler():
                 'detail': str(e)
             }
         ), 401)
+    except RateLimitError as e:
+        # The token is valid but throttled, so keep the user logged in with
+        # their last known profile rather than rejecting them
+        stale_user_info = profile_cache.get_stale(token_hash)
+
+        if stale_user_info is not None:
+            app.logger.warning('Serving cached profile while rate limited: %s', e)
+            return make_response(jsonify(stale_user_info), 200)
+
+        app.logger.warning('Rate limited: %s', e)
+        response = make_response(jsonify(
+            {
+                'status': 'error',
+                'msg': 'Too Many Requests',
+                'detail': str(e)
+            }
+        ), 429)
+        response.headers['Retry-After'] = str(math.ceil(e.retry_after))
+        return response
 
 
 if __name__ == '__main__':
     args = get_args()
+
+    if args.precompile_config:
+        precompile_config()
+        print(f'Wrote {PRECOMPILED_CONFIG_PATH}')
+        raise SystemExit(0)
+
     # Deferred import: waitress is only needed for the standalone server;
     # Zappa/API Gateway serves the app in AWS Lambda, so importing it here
     # keeps the module importable without a hard waitress dependency.